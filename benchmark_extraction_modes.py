@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Benchmark KeyTermsExtractor extraction modes with a stubbed LLM.
+Runs every extraction mode over a local in-memory index of a sample lease.
+The LLM is stubbed with a fixed per-call latency and per-token generation
+time (awaited, not blocking, for async calls), so the comparison reflects
+the number of LLM calls, how many run concurrently and the tokens
+generated, not network variance.
+
+Usage: python benchmark_extraction_modes.py [--runs 3] [--call-latency 0.4] [--token-latency 0.005]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from typing import Any
+
+from llama_index.core import Settings, SimpleDirectoryReader, VectorStoreIndex
+from llama_index.core.base.llms.types import CompletionResponse
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.llms.mock import MockLLM
+
+from key_terms_extractor import EXTRACTION_MODES, KeyTermsExtractor
+from lease_summary_agent_schema import LeaseSummary
+from rag_pipeline import document_metadata
+
+LEASE_CLAUSES = [
+    "This Lease is made between TETCO Center LP (Landlord) and Sanderford & Caroll PC (Tenant).",
+    "The Premises are Suite 550 at 1100 NE Loop 410, San Antonio, TX 78209, containing 2,394 rentable square feet.",
+    "The Term commences on December 9, 2019 and expires on December 31, 2022, a term of three years.",
+    "Tenant shall pay monthly Base Rent of $4,668.25, and a Security Deposit of $9,336.50 is due on execution.",
+    "This is a Net lease; Tenant pays its proportionate share of operating expenses.",
+    "Tenant has two successive options to renew for one year each at market rent.",
+]
+
+LEASE_JSON = {
+    "property_info": {"property_address": "1100 NE Loop 410, Suite 550, San Antonio, TX 78209", "landlord_name": "TETCO Center LP"},
+    "tenant_info": {"tenant": "Sanderford & Caroll PC", "suite_number": "Suite 550", "leased_sqft": 2394.0},
+    "lease_dates": {"lease_commencement_date": "2019-12-09", "lease_expiration_date": "2022-12-31", "lease_term": "3 years"},
+    "financial_terms": {"base_rent": 4668.25, "security_deposit": 9336.5, "expense_recovery_type": "Net",
+                        "renewal_options": "Two successive terms of one year each", "free_rent_months": None},
+}
+
+# Roughly what the comprehensive summary query produces for this lease
+SUMMARY_TEXT = " ".join(LEASE_CLAUSES * 4)
+
+
+class StubLLM(MockLLM):
+    """MockLLM that answers JSON prompts with LEASE_JSON (or the one section whose
+    schema the prompt asks for) and anything else with a summary, sleeping
+    `call_latency` per call plus `token_latency` per generated token"""
+
+    call_latency: float = 0.0
+    token_latency: float = 0.0
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    def _answer(self, prompt: str) -> str:
+        self.calls += 1
+        self.prompt_tokens += len(prompt.split())
+        if "JSON" not in prompt and "json" not in prompt:
+            return SUMMARY_TEXT
+        if '"title": "LeaseSummary"' not in prompt:
+            # Section sub-queries ask for a single LeaseSummary sub-model
+            for section, field in LeaseSummary.model_fields.items():
+                if f'"title": "{field.annotation.__name__}"' in prompt:
+                    return json.dumps(LEASE_JSON[section])
+        return json.dumps(LEASE_JSON)
+
+    def _delay(self, text: str) -> float:
+        tokens = text.split(" ")
+        self.completion_tokens += len(tokens)
+        return self.call_latency + self.token_latency * len(tokens)
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        text = self._answer(prompt)
+        time.sleep(self._delay(text))
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        text = self._answer(prompt)
+        await asyncio.sleep(self._delay(text))
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        text = self._answer(prompt)
+        time.sleep(self.call_latency)
+
+        def gen():
+            so_far = ""
+            for i, token in enumerate(text.split(" ")):
+                time.sleep(self.token_latency)
+                self.completion_tokens += 1
+                delta = token if i == 0 else " " + token
+                so_far += delta
+                yield CompletionResponse(text=so_far, delta=delta)
+        return gen()
+
+
+class LocalPipeline:
+    """Stands in for RAGPipeline: the sample lease is already indexed"""
+
+    def initialize_index(self):
+        return True
+
+    def index_documents(self, file_path, documents, content_sha256=None):
+        return True
+
+    def wait_for_documents(self, documents, timeout=None):
+        return True
+
+
+class LocalManager:
+    def __init__(self, index):
+        self.index = index
+
+    def get_index(self):
+        return self.index
+
+
+class LocalExtractor(KeyTermsExtractor):
+    """Parses locally; parsing is identical in every mode, so LlamaParse is left out"""
+
+    def parse_document(self, file_path):
+        return SimpleDirectoryReader(input_files=[file_path]).load_data()
+
+
+def run_benchmark(runs: int = 3, call_latency: float = 0.4, token_latency: float = 0.005) -> dict:
+    """Mean wall time, LLM calls and tokens per extraction for each mode"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        lease_path = os.path.join(tmp_dir, "sample_lease.txt")
+        with open(lease_path, "w") as f:
+            f.write("\n\n".join(LEASE_CLAUSES * 10))
+
+        llm = StubLLM()
+        # Restore the configured LLM afterwards (Settings is process-wide)
+        previous_llm = Settings._llm
+        Settings.llm = llm
+        try:
+            # Tagged like RAGPipeline ingestion so document-scoped retrieval finds it
+            documents = SimpleDirectoryReader(input_files=[lease_path], file_metadata=document_metadata).load_data()
+            index = VectorStoreIndex.from_documents(documents, embed_model=MockEmbedding(embed_dim=8))
+            extractor = LocalExtractor(rag_pipeline=LocalPipeline(), llama_manager=LocalManager(index))
+            llm.call_latency, llm.token_latency = call_latency, token_latency
+
+            results = {}
+            for mode in EXTRACTION_MODES:
+                llm.calls = llm.prompt_tokens = llm.completion_tokens = 0
+                started = time.perf_counter()
+                statuses = [extractor.process_document(lease_path, extraction_mode=mode)["status"] for _ in range(runs)]
+                elapsed = time.perf_counter() - started
+                results[mode] = {
+                    "seconds": elapsed / runs,
+                    "llm_calls": llm.calls / runs,
+                    "prompt_tokens": llm.prompt_tokens / runs,
+                    "completion_tokens": llm.completion_tokens / runs,
+                    "statuses": statuses,
+                }
+        finally:
+            Settings._llm = previous_llm
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark key terms extraction modes with a stubbed LLM")
+    parser.add_argument("--runs", type=int, default=3, help="Extractions per mode")
+    parser.add_argument("--call-latency", type=float, default=0.4, help="Seconds of latency per LLM call")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Seconds per generated token")
+    args = parser.parse_args()
+
+    # Keep the extractor's progress output out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = run_benchmark(args.runs, args.call_latency, args.token_latency)
+
+    print(f"{'mode':<12} {'seconds':>8} {'llm calls':>10} {'prompt tok':>11} {'output tok':>11}  status")
+    for mode, r in results.items():
+        print(f"{mode:<12} {r['seconds']:>8.2f} {r['llm_calls']:>10.1f} {r['prompt_tokens']:>11.0f} "
+              f"{r['completion_tokens']:>11.0f}  {','.join(sorted(set(r['statuses'])))}")
+    base, single, sectioned = results["two_step"], results["single_pass"], results["sectioned"]
+    print(f"\nsingle_pass is {base['seconds'] / single['seconds']:.1f}x faster with "
+          f"{single['completion_tokens'] / base['completion_tokens']:.0%} of the generated tokens")
+    print(f"sectioned runs {sectioned['llm_calls']:.0f} concurrent calls in {sectioned['seconds'] / single['seconds']:.0%} "
+          f"of single_pass wall time, using {sectioned['prompt_tokens'] / single['prompt_tokens']:.1f}x the prompt tokens")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Measure memory and setup time of KeyTermsExtractor under concurrent requests.
+Compares building an extractor per request (the old behaviour of the key terms
+endpoints) with the shared get_key_terms_extractor(). Each mode runs in a fresh
+interpreter; a sampler thread records peak RSS while the requests run. Every
+simulated request touches the components process_document uses (RAGPipeline
+with its embedding model, LlamaCloudManager); no documents are processed.
+
+Usage: python benchmark_extractor_memory.py [--requests 16] [--threads 8]
+"""
+
+import argparse
+import gc
+import json
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from index_metrics import current_rss_bytes
+
+MODES = ("per_request", "shared")
+
+
+def run_mode(mode: str, requests: int, threads: int) -> dict:
+    from key_terms_extractor import KeyTermsExtractor, get_key_terms_extractor
+
+    def request(_):
+        started = time.perf_counter()
+        extractor = KeyTermsExtractor() if mode == "per_request" else get_key_terms_extractor()
+        extractor.rag_pipeline
+        extractor.llama_manager
+        return time.perf_counter() - started
+
+    before = current_rss_bytes() or 0
+    peak = [before]
+    stop = threading.Event()
+
+    def sample():
+        while not stop.is_set():
+            peak[0] = max(peak[0], current_rss_bytes() or 0)
+            stop.wait(0.02)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        setup_seconds = list(executor.map(request, range(requests)))
+    wall_seconds = time.perf_counter() - started
+    stop.set()
+    sampler.join()
+    gc.collect()
+    after = current_rss_bytes() or 0
+
+    mb = 1024 * 1024
+    return {
+        "rss_before_mb": round(before / mb, 1),
+        "rss_peak_mb": round(max(peak[0], after) / mb, 1),
+        "rss_after_mb": round(after / mb, 1),
+        "wall_seconds": round(wall_seconds, 2),
+        "mean_setup_seconds": round(sum(setup_seconds) / len(setup_seconds), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-request and shared KeyTermsExtractor memory use")
+    parser.add_argument("--requests", type=int, default=16, help="Simulated requests per mode")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent request threads")
+    parser.add_argument("--run-mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        # Child process: report one mode as the last line of output
+        print(json.dumps(run_mode(args.run_mode, args.requests, args.threads)))
+        return
+
+    print(f"{args.requests} requests on {args.threads} threads")
+    print(f"{'mode':<12} {'rss before':>11} {'rss peak':>9} {'rss after':>10} {'wall s':>7} {'setup s':>8}")
+    for mode in MODES:
+        proc = subprocess.run(
+            [sys.executable, __file__, "--run-mode", mode, "--requests", str(args.requests), "--threads", str(args.threads)],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"{mode:<12} failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{mode:<12} {r['rss_before_mb']:>9.1f}MB {r['rss_peak_mb']:>7.1f}MB {r['rss_after_mb']:>8.1f}MB "
+              f"{r['wall_seconds']:>7.2f} {r['mean_setup_seconds']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
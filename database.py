@@ -6,7 +6,7 @@ import os
 import json
 from datetime import datetime, timezone
 from typing import List, Optional, Dict, Any
-from sqlalchemy import create_engine, Column, String, Integer, Float, DateTime, Text, Boolean, ForeignKey, Index, JSON
+from sqlalchemy import create_engine, inspect, text, Column, String, Integer, Float, DateTime, Text, Boolean, ForeignKey, Index, JSON
 from sqlalchemy.orm import sessionmaker, relationship, Session, declarative_base
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 import uuid
@@ -188,10 +188,12 @@ class GoogleDriveSync(Base):
     id = Column(Integer, primary_key=True)
     user_id = Column(String(255), nullable=False, index=True)
     sync_type = Column(String(50))  # manual, scheduled, webhook
-    status = Column(String(50), default='in_progress')  # in_progress, completed, failed
+    status = Column(String(50), default='in_progress')  # queued, in_progress, completed, failed
     files_processed = Column(Integer, default=0)
     files_failed = Column(Integer, default=0)
     error_message = Column(Text)
+    # Per-stage (download/persist/index) throughput of the sync pipeline
+    stage_metrics = Column(JSON if DATABASE_URL.startswith("sqlite") else JSONB)
     started_at = Column(DateTime, default=utc_now)
     completed_at = Column(DateTime)
     
@@ -204,10 +206,17 @@ class GoogleDriveSync(Base):
             'files_processed': self.files_processed,
             'files_failed': self.files_failed,
             'error_message': self.error_message,
+            'stage_metrics': self.stage_metrics,
             'started_at': self.started_at.isoformat() if self.started_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None
         }
 
+# Columns added to tables after their first release. create_all() never alters
+# an existing table, so create_tables() adds any of these a deployment is missing.
+ADDITIVE_COLUMNS = {
+    'google_drive_syncs': ['stage_metrics'],
+}
+
 # Database Operations
 
 class DatabaseManager:
@@ -234,8 +243,30 @@ class DatabaseManager:
         return _CM()
 
     def create_tables(self):
-        """Create all database tables"""
+        """Create all database tables and add columns missing from existing ones"""
         Base.metadata.create_all(bind=self.engine)
+        self.add_missing_columns()
+    
+    def add_missing_columns(self) -> List[str]:
+        """Add ADDITIVE_COLUMNS that existing tables lack (nullable, no backfill).
+        Returns the added columns as 'table.column'.
+        """
+        inspector = inspect(self.engine)
+        added = []
+        for table_name, column_names in ADDITIVE_COLUMNS.items():
+            if not inspector.has_table(table_name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table_name)}
+            table = Base.metadata.tables[table_name]
+            for column_name in column_names:
+                if column_name in existing:
+                    continue
+                column_type = table.c[column_name].type.compile(dialect=self.engine.dialect)
+                with self.engine.begin() as connection:
+                    connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}'))
+                print(f"Added column {table_name}.{column_name}")
+                added.append(f"{table_name}.{column_name}")
+        return added
     
     def get_session(self) -> Session:
         """Get a database session"""
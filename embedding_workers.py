@@ -0,0 +1,164 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+DEFAULT_EMBED_MODEL = "BAAI/bge-small-en-v1.5"
+DEFAULT_WORKER_BATCH_SIZE = 32
+# Upper bound LlamaIndex's BaseEmbedding accepts for embed_batch_size
+MAX_EMBED_BATCH_SIZE = 2048
+
+# Per-process model, loaded once by the pool initializer
+_worker_model = None
+
+
+def _load_huggingface_model(model_name: str):
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    return HuggingFaceEmbedding(model_name=model_name)
+
+
+def _init_worker(model_name: str, model_factory: Callable[[str], Any]):
+    global _worker_model
+    _worker_model = model_factory(model_name)
+
+
+def _worker_embedding_dim() -> int:
+    return len(_worker_model.get_text_embedding("dimension probe"))
+
+
+def _embed_into_shared_memory(shm_name: str, shape: tuple, offset: int, texts: List[str], query: bool = False) -> int:
+    """Embed `texts` and write the vectors into rows offset.. of the shared array"""
+    if query:
+        # The model's query path adds its query instruction (BGE's retrieval prefix)
+        vectors = [_worker_model.get_query_embedding(text) for text in texts]
+    else:
+        vectors = _worker_model.get_text_embedding_batch(texts)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        out[offset:offset + len(texts)] = np.asarray(vectors, dtype=np.float32)
+        del out
+    finally:
+        shm.close()
+    return len(texts)
+
+
+class EmbeddingWorkerPool:
+    """Pool of processes that each load the embedding model once.
+
+    Texts are split into batches and fanned out across the workers; each
+    worker writes its vectors straight into one shared-memory float32 array,
+    so only the input text is pickled between processes.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_EMBED_MODEL,
+        num_workers: Optional[int] = None,
+        batch_size: int = DEFAULT_WORKER_BATCH_SIZE,
+        model_factory: Callable[[str], Any] = _load_huggingface_model,
+    ):
+        self.model_name = model_name
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.batch_size = max(1, batch_size)
+        self.model_factory = model_factory
+        self._executor = None
+        self._dim = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker processes (idempotent)"""
+        with self._lock:
+            if self._executor is None:
+                # Spawn rather than fork: torch does not survive forking a threaded parent
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, self.model_factory),
+                )
+                self._dim = self._executor.submit(_worker_embedding_dim).result()
+                atexit.register(self.shutdown)
+                print(f"Started {self.num_workers} embedding worker(s) for {self.model_name}")
+        return self
+
+    def embed(self, texts: List[str], query: bool = False) -> List[List[float]]:
+        """Embed texts (or queries, if `query`) across the pool, preserving input order"""
+        if not texts:
+            return []
+        self.start()
+        shape = (len(texts), self._dim)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(texts) * self._dim * 4))
+        try:
+            futures = [
+                self._executor.submit(
+                    _embed_into_shared_memory, shm.name, shape, offset, texts[offset:offset + self.batch_size], query
+                )
+                for offset in range(0, len(texts), self.batch_size)
+            ]
+            for future in futures:
+                future.result()
+            vectors = np.ndarray(shape, dtype=np.float32, buffer=shm.buf).tolist()
+        finally:
+            shm.close()
+            shm.unlink()
+        return vectors
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+class PooledEmbedding(BaseEmbedding):
+    """LlamaIndex embedding that delegates to an EmbeddingWorkerPool.
+
+    Drop-in replacement for HuggingFaceEmbedding inside an IngestionPipeline.
+    """
+
+    _pool: EmbeddingWorkerPool = PrivateAttr()
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_EMBED_MODEL,
+        worker_processes: Optional[int] = None,
+        worker_batch_size: int = DEFAULT_WORKER_BATCH_SIZE,
+        model_factory: Callable[[str], Any] = _load_huggingface_model,
+        **kwargs: Any,
+    ):
+        pool = EmbeddingWorkerPool(model_name, worker_processes, worker_batch_size, model_factory)
+        # Hand the pool enough texts per call to keep every worker busy
+        kwargs.setdefault("embed_batch_size", min(pool.num_workers * pool.batch_size, MAX_EMBED_BATCH_SIZE))
+        super().__init__(model_name=model_name, **kwargs)
+        self._pool = pool
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "PooledEmbedding"
+
+    @property
+    def pool(self) -> EmbeddingWorkerPool:
+        return self._pool
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._pool.embed([query], query=True)[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._pool.embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._pool.embed(texts)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embedding(text)
@@ -22,9 +22,9 @@ if phoenix_api_key and phoenix_api_key != "YOUR_PHOENIX_API_KEY":
         print(f"⚠️  LlamaTrace Phoenix setup failed: {e}")
 else:
     print("ℹ️  Phoenix observability disabled (no API key configured)")
-from multiprocessing.managers import BaseManager
+from multiprocessing.managers import BaseManager, RemoteError
 from multiprocessing.context import AuthenticationError as MPAuthenticationError
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import HTTPException
@@ -41,19 +41,26 @@ import chromadb
 from llama_index.core import load_index_from_storage
 from llama_index.vector_stores.chroma import ChromaVectorStore
 from llama_index.core import StorageContext
-from llama_index.core.output_parsers import PydanticOutputParser
+from llama_index.core import get_response_synthesizer
+from llama_index.core.schema import NodeWithScore, TextNode
 from llama_index.core.prompts import PromptTemplate
 import json
+import hashlib
 import threading
 import queue
+from concurrent.futures import ThreadPoolExecutor
 from asset_type_classification import classify_asset_type, AssetTypeClassification, AssetType
 from database import db_manager, Document, BlockchainActivity, BLOCKCHAIN_EVENTS
 from sqlalchemy.exc import SQLAlchemyError
 from google_drive_auth import GoogleDriveAuth
 from google_drive_ingestion import GoogleDriveIngestion
+from google_drive_sync import GoogleDriveSyncWorker, TERMINAL_SYNC_STATUSES, remove_unreferenced_copy
+from index_shards import ShardedIndexClient, parse_shard_endpoints, merge_top_k
+from index_server_pool import rpc_value as _rpc_value
 from database import GoogleDriveFile, GoogleDriveSync
-from key_terms_extractor import KeyTermsExtractor
-import shutil
+from key_terms_extractor import get_key_terms_extractor, EXTRACTION_MODES
+from stream_jobs import StreamJobRegistry, parse_event_id
+from streaming_json import RecoveringPydanticOutputParser
 
 # Load environment variables
 load_dotenv()
@@ -65,10 +72,16 @@ index = llama_manager.get_index()
 # Initialize Google Drive components (optional)
 google_auth = None
 google_ingestion = None
+google_sync_worker = None
 
 try:
     google_auth = GoogleDriveAuth()
     google_ingestion = GoogleDriveIngestion(google_auth)
+    # Worker threads start on the first queued sync
+    google_sync_worker = GoogleDriveSyncWorker(
+        google_ingestion,
+        index_connection=lambda key=None: index_shards.connection(key)
+    )
     print("Google Drive integration enabled")
 except ValueError as e:
     print(f"Google Drive integration disabled: {e}")
@@ -164,11 +177,21 @@ def _load_index_server_key() -> bytes:
 
 INDEX_SERVER_KEY = _load_index_server_key()
 
-def connect_to_index_server(max_retries=5, retry_delay=2):
-    """Connect to the index server with retries"""
-    manager = BaseManager((INDEX_SERVER_HOST, INDEX_SERVER_PORT), INDEX_SERVER_KEY)
+def connect_to_index_server(max_retries=5, retry_delay=2, host=None, port=None):
+    """Connect to the index server (or one shard of it) with retries"""
+    manager = BaseManager((host or INDEX_SERVER_HOST, port or INDEX_SERVER_PORT), INDEX_SERVER_KEY)
     manager.register("query")
+    manager.register("retrieve")
     manager.register("upload_file")
+    manager.register("enqueue_upload")
+    manager.register("get_job")
+    manager.register("list_jobs")
+    manager.register("get_metrics")
+    manager.register("ready")
+    manager.register("begin_upload")
+    manager.register("write_chunk")
+    manager.register("commit_upload")
+    manager.register("abort_upload")
     
     for attempt in range(max_retries):
         try:
@@ -185,21 +208,34 @@ def connect_to_index_server(max_retries=5, retry_delay=2):
     
     raise ConnectionError("Failed to connect to index server after maximum retries")
 
-# Initialize manager connection (non-fatal if index server is down)
-manager = None
-_manager_lock = threading.Lock()
-_manager_ready = threading.Event()
+# Index server shards ("host:port,host:port"; defaults to the single server).
+# Each shard has its own connection pool and each request thread checks one
+# out instead of sharing a single manager (non-fatal if a shard is down)
+index_shards = ShardedIndexClient(
+    parse_shard_endpoints(os.getenv("INDEX_SERVER_SHARDS", f"{INDEX_SERVER_HOST}:{INDEX_SERVER_PORT}")),
+    lambda host, port: connect_to_index_server(max_retries=1, host=host, port=port),
+    pool_size=int(os.getenv("INDEX_SERVER_POOL_SIZE", "8")),
+    acquire_timeout=float(os.getenv("INDEX_SERVER_POOL_TIMEOUT", "30"))
+)
+# Pool for calls that are not routed by document (the first shard)
+index_pool = index_shards.pool_for(None)
+
+# Streaming key terms extractions, kept for replay when a client reconnects
+key_terms_streams = StreamJobRegistry(
+    buffer_size=int(os.getenv("KEY_TERMS_STREAM_BUFFER", "2000")),
+    ttl=float(os.getenv("KEY_TERMS_STREAM_TTL", "300"))
+)
+KEY_TERMS_STREAM_HEARTBEAT = float(os.getenv("KEY_TERMS_STREAM_HEARTBEAT", "15"))
+# Documents extracted at once by one /stream-key-terms/batch stream
+KEY_TERMS_BATCH_CONCURRENCY = max(1, int(os.getenv("KEY_TERMS_BATCH_CONCURRENCY", "3")))
+KEY_TERMS_BATCH_MAX_DOCUMENTS = int(os.getenv("KEY_TERMS_BATCH_MAX_DOCUMENTS", "50"))
 
 def initialize_manager_async(max_retries=0, retry_delay=5):
     def _attempt_connect():
-        global manager
         attempts = 0
         while True:
             try:
-                connected_manager = connect_to_index_server()
-                with _manager_lock:
-                    manager = connected_manager
-                    _manager_ready.set()
+                index_pool.release(index_pool.acquire())
                 logger.info("Connected to index server")
                 break
             except (ConnectionError, ConnectionRefusedError, OSError, TimeoutError, MPAuthenticationError) as e:
@@ -212,17 +248,54 @@ def initialize_manager_async(max_retries=0, retry_delay=5):
     threading.Thread(target=_attempt_connect, daemon=True).start()
 
 initialize_manager_async()
-def get_index_manager(force_connect: bool = True):
-    """Thread-safe accessor for the shared index manager.
-    When force_connect is True and manager is None, attempt a direct connection
-    under the lock to avoid concurrent connection attempts.
+
+def _is_queue_full_error(error: Exception) -> bool:
+    # Exceptions raised inside the index server arrive as RemoteError tracebacks
+    return isinstance(error, RemoteError) and 'IngestionQueueFull' in str(error)
+
+# "path" sends file paths (shared filesystem); "stream" sends file bytes in chunks
+INDEX_UPLOAD_TRANSFER = os.getenv("INDEX_UPLOAD_TRANSFER", "path").lower()
+INDEX_UPLOAD_CHUNK_SIZE = int(os.getenv("INDEX_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+def _file_digest(filepath: str, algorithm: str = 'md5', chunk_size: int = INDEX_UPLOAD_CHUNK_SIZE) -> str:
+    hasher = hashlib.new(algorithm)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def index_routing_key(filepath: str):
+    """Shard routing key: the content MD5 (the same checksum Drive reports, so
+    Drive and direct uploads agree, and the key index servers use to decide
+    which files their background indexing owns)"""
+    if len(index_shards.shards) == 1:
+        return None
+    return _file_digest(filepath, 'md5')
+
+def stream_file_to_index_server(mgr, filepath: str, chunk_size: int = INDEX_UPLOAD_CHUNK_SIZE) -> dict:
+    """Send a file to the index server in fixed-size chunks and index it there.
+    The SHA-256 is computed first so content the server already holds is skipped.
     """
-    global manager
-    with _manager_lock:
-        if manager is None and force_connect:
-            manager = connect_to_index_server()
-            _manager_ready.set()
-        return manager
+    digest = _file_digest(filepath, 'sha256', chunk_size)
+
+    session = _rpc_value(mgr.begin_upload(os.path.basename(filepath), os.path.getsize(filepath), digest))
+    if session["deduplicated"]:
+        return {"status": "success", "path": session["path"], "sha256": digest, "deduplicated": True}
+
+    upload_id = session["upload_id"]
+    try:
+        offset = 0
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                mgr.write_chunk(upload_id, offset, chunk)
+                offset += len(chunk)
+        return _rpc_value(mgr.commit_upload(upload_id, digest))
+    except Exception:
+        try:
+            mgr.abort_upload(upload_id)
+        except Exception:
+            pass
+        raise
 
 
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'doc', 'docx'}
@@ -307,29 +380,45 @@ def index_file():
             logger.error(f'File not found: {filepath}')
             return jsonify({"error": "File not found"}), 404
 
-        # Ensure index server manager is available (lazy connect if needed)
-        global manager
-        mgr = manager
-        if mgr is None:
-            try:
-                mgr = connect_to_index_server()
-                manager = mgr
-            except (ConnectionError, ConnectionRefusedError, OSError, TimeoutError) as conn_err:
-                logger.error(f'Index server unavailable: {str(conn_err)}')
-                return jsonify({"error": "Index server unavailable", "details": str(conn_err)}), 503
-
-        # Index the file with the index server
+        # Check out a pooled connection to the shard that owns this document;
+        # connection-level failures discard it so the next request reconnects
         try:
-            success = mgr.upload_file(filepath)
-            if not success:
-                logger.error('Failed to index file with index server')
-                return jsonify({"error": "Failed to index file"}), 500
-        except (ConnectionError, ConnectionRefusedError) as e:
-            logger.error(f'Index server connection error: {str(e)}')
-            return jsonify({"error": "Index server connection failed"}), 503
-        except (RuntimeError, OSError, ValueError):
-            logger.exception('Error indexing file')
-            return jsonify({"error": "Error indexing file"}), 500
+            routing_key = index_routing_key(filepath)
+            with index_shards.connection(routing_key) as mgr:
+                # Queue the file and return immediately when the caller asks for it
+                # (queued jobs are read by path, so this needs the shared filesystem)
+                if file_data.get('async') and INDEX_UPLOAD_TRANSFER != 'stream':
+                    try:
+                        job_id = _rpc_value(mgr.enqueue_upload(filepath))
+                    except RemoteError as e:
+                        if _is_queue_full_error(e):
+                            logger.warning('Ingestion queue full, rejecting indexing request')
+                            return jsonify({"error": "Indexing queue is full, retry later"}), 503, {"Retry-After": "5"}
+                        logger.error(f'Index server error while queueing: {str(e)}')
+                        return jsonify({"error": "Error queueing file"}), 500
+                    return jsonify({
+                        "status": "queued",
+                        "job_id": job_id,
+                        "filepath": filepath,
+                        "status_url": f"/index/jobs/{job_id}"
+                    }), 202
+
+                # Index the file with the index server
+                try:
+                    if INDEX_UPLOAD_TRANSFER == 'stream':
+                        result = stream_file_to_index_server(mgr, filepath)
+                        success = result.get("status") == "success"
+                    else:
+                        success = _rpc_value(mgr.upload_file(filepath))
+                except (RuntimeError, ValueError, RemoteError):
+                    logger.exception('Error indexing file')
+                    return jsonify({"error": "Error indexing file"}), 500
+                if not success:
+                    logger.error('Failed to index file with index server')
+                    return jsonify({"error": "Failed to index file"}), 500
+        except (ConnectionError, EOFError, OSError, TimeoutError, MPAuthenticationError) as conn_err:
+            logger.error(f'Index server unavailable: {str(conn_err)}')
+            return jsonify({"error": "Index server unavailable", "details": str(conn_err)}), 503
 
         return jsonify({
             "status": "success",
@@ -342,6 +431,106 @@ def index_file():
         logger.exception('Error during indexing')
         return jsonify({"error": "Internal server error"}), 500
 
+@app.route("/index/jobs/<job_id>", methods=["GET"])
+def get_index_job(job_id):
+    """Status of a queued indexing job (looked up on every shard)"""
+    results = index_shards.fan_out(lambda mgr: _rpc_value(mgr.get_job(job_id)))
+    for ok, job in results.values():
+        if ok and job is not None:
+            return jsonify(job), 200
+    if not any(ok for ok, _ in results.values()):
+        logger.error('Index server unavailable while looking up job')
+        return jsonify({"error": "Index server unavailable"}), 503
+    return jsonify({"error": "Job not found"}), 404
+
+@app.route("/index/jobs", methods=["GET"])
+def list_index_jobs():
+    """Recent indexing jobs across shards, optionally filtered with ?status="""
+    status = request.args.get('status')
+    limit = request.args.get('limit', default=100, type=int)
+    results = index_shards.fan_out(lambda mgr: _rpc_value(mgr.list_jobs(status, limit)))
+    if not any(ok for ok, _ in results.values()):
+        logger.error('Index server unavailable while listing jobs')
+        return jsonify({"error": "Index server unavailable"}), 503
+    jobs = [job for ok, shard_jobs in results.values() if ok for job in shard_jobs]
+    jobs.sort(key=lambda job: job.get('created_at') or 0, reverse=True)
+    return jsonify({"jobs": jobs[:limit]}), 200
+
+@app.route("/index/metrics", methods=["GET"])
+def index_server_metrics():
+    """Index server call counts, latency percentiles, queue depth and RSS (per shard when sharded)"""
+    results = index_shards.fan_out(lambda mgr: _rpc_value(mgr.get_metrics()))
+    if not any(ok for ok, _ in results.values()):
+        logger.error('Index server unavailable while collecting metrics')
+        return jsonify({"error": "Index server unavailable"}), 503
+    if len(results) == 1:
+        metrics = next(iter(results.values()))[1]
+        metrics["client_pool"] = index_pool.stats()
+    else:
+        metrics = {
+            "shards": {name: value if ok else {"error": str(value)} for name, (ok, value) in results.items()},
+            "client_pool": index_shards.stats()
+        }
+    return jsonify(metrics), 200
+
+@app.route("/health", methods=["GET"])
+def health():
+    """Readiness check: 200 only once every index server shard reports its pipeline is ready"""
+    results = index_shards.fan_out(lambda mgr: _rpc_value(mgr.ready()))
+    shards = {
+        name: value if ok else {"ready": False, "error": str(value)}
+        for name, (ok, value) in results.items()
+    }
+    body = {"index_server": shards[index_shards.shards[0]], "shards": shards}
+    if not any(ok for ok, _ in results.values()):
+        return jsonify({"status": "unavailable", **body}), 503
+    if not all(shard.get("ready") for shard in shards.values()):
+        return jsonify({"status": "starting", **body}), 503
+    return jsonify({"status": "ok", **body}), 200
+
+@app.route("/index/retrieve", methods=["GET"])
+def retrieve_from_index_server():
+    """Top-k chunks retrieved from every shard concurrently and merged by score.
+    `content_sha256` limits retrieval to the chunks of that one document.
+    """
+    query_text = request.args.get("text")
+    if not query_text:
+        return jsonify({"error": "No text found, please include a ?text=blah parameter in the URL"}), 400
+    top_k = request.args.get("top_k", default=5, type=int)
+    content_sha256 = request.args.get("content_sha256")
+    rpc_args = (query_text, top_k, content_sha256) if content_sha256 else (query_text, top_k)
+    results = index_shards.fan_out(lambda mgr: _rpc_value(mgr.retrieve(*rpc_args)))
+    failed = {name: str(value) for name, (ok, value) in results.items() if not ok}
+    if len(failed) == len(results):
+        logger.error(f'All index server shards failed retrieval: {failed}')
+        return jsonify({"error": "Index server unavailable", "failed_shards": failed}), 503
+    nodes = merge_top_k([value for ok, value in results.values() if ok], top_k)
+    return jsonify({"nodes": nodes, "failed_shards": failed}), 200
+
+def _query_shards(query_text: str, top_k: int):
+    """Answer a query over every shard's pipeline: retrieve top-k from each
+    shard, merge by score and synthesize one response from the merged chunks.
+    Only shard results are merged; scores from other indexes are not comparable."""
+    results = index_shards.fan_out(lambda mgr: _rpc_value(mgr.retrieve(query_text, top_k)))
+    failed = {name: str(value) for name, (ok, value) in results.items() if not ok}
+    if len(failed) == len(results):
+        logger.error(f'All index server shards failed retrieval: {failed}')
+        return jsonify({"error": "Index server unavailable", "failed_shards": failed}), 503
+    nodes = []
+    for hit in merge_top_k([value for ok, value in results.values() if ok], top_k):
+        node = TextNode(text=hit["text"], metadata=hit.get("metadata") or {})
+        if hit.get("node_id"):
+            node.id_ = hit["node_id"]
+        nodes.append(NodeWithScore(node=node, score=hit.get("score")))
+    response = get_response_synthesizer().synthesize(query_text, nodes=nodes)
+
+    logger.info(f'Query processed across {len(results) - len(failed)} shard(s)')
+    return jsonify({
+        "response": str(response),
+        "retrieved_nodes": [str(node) for node in nodes],
+        "failed_shards": failed
+    }), 200
+
 @app.route("/query", methods=["GET"])
 def query_index():
     logger.info('Received query request')
@@ -351,6 +540,9 @@ def query_index():
             "error": "No text found, please include a ?text=blah parameter in the URL"
         }), 400
 
+    if len(index_shards.shards) > 1:
+        return _query_shards(query_text, request.args.get("top_k", default=5, type=int))
+
     # Get both retrieval results and query response
     nodes = index.as_retriever().retrieve(query_text)
     response = index.as_query_engine().query(query_text)
@@ -522,17 +714,138 @@ def extract_risk_flags():
             "message": "Risk flags extraction failed"
         }), 500
 
+def _key_terms_events(filepath, extraction_mode=None):
+    """(event, payload) pairs for one streaming key terms extraction"""
+    yield "connected", {'status': 'connected', 'message': 'Starting key terms extraction with streaming...', 'filepath': filepath}
+    yield "progress", {'status': 'streaming', 'stage': 'initializing', 'message': 'Initializing extractor...'}
+    try:
+        extractor = get_key_terms_extractor(llama_manager=llama_manager)
+        
+        # Forward stage transitions and LLM tokens as the extractor produces them
+        for event in extractor.stream_document(filepath, extraction_mode):
+            kind = event["event"]
+            if kind == "stage":
+                payload = {'status': 'streaming', 'stage': event['stage'], 'state': event['status'], 'message': event['message']}
+                if 'elapsed_seconds' in event:
+                    payload['elapsed_seconds'] = event['elapsed_seconds']
+                yield "progress", payload
+            elif kind == "token":
+                yield "token", {'stage': event['stage'], 'text': event['text']}
+            elif kind in ("field", "section"):
+                yield kind, {k: v for k, v in event.items() if k != 'event'}
+            elif kind == "result":
+                result = event["result"]
+                if result.get("status") == "success":
+                    yield "complete", {'status': 'complete', 'data': result['data'], 'metadata': result.get('extraction_metadata', {}), 'is_complete': True}
+                else:
+                    yield "error", {'status': 'error', 'error': result.get('message', 'Extraction failed'), 'is_complete': True}
+    except Exception as e:
+        logger.exception('Error during streaming key terms extraction')
+        yield "error", {'status': 'error', 'error': str(e), 'is_complete': True}
+
+def _replay_stream_job(job, after_id):
+    """SSE text for a stream job from `after_id` on, with heartbeats while it is idle"""
+    while True:
+        events, missed, finished = job.read(after_id, timeout=KEY_TERMS_STREAM_HEARTBEAT)
+        if missed:
+            yield f"event: replay_gap\ndata: {json.dumps({'job_id': job.job_id, 'missed': missed})}\n\n"
+        for event_id, (name, payload) in events:
+            after_id = event_id
+            yield f"id: {job.job_id}:{event_id}\nevent: {name}\ndata: {json.dumps({**payload, 'job_id': job.job_id})}\n\n"
+        if finished:
+            return
+        if not events:
+            # Keep idle connections open through proxies
+            yield ": heartbeat\n\n"
+
+def _batch_key_terms_events(documents, extraction_mode=None):
+    """
+    Interleaved (event, payload) pairs for several extractions run with bounded
+    concurrency. Every payload carries the `document` it belongs to; the batch
+    ends with a `batch_complete` event.
+    """
+    yield "connected", {'status': 'connected', 'message': f'Starting key terms extraction for {len(documents)} document(s)...',
+                        'documents': [key for key, _ in documents]}
+    events = queue.Queue()
+    
+    def run(key, filepath):
+        try:
+            if filepath is None:
+                events.put(("error", {'status': 'error', 'error': 'File not found', 'is_complete': True, 'document': key}))
+                return
+            for name, payload in _key_terms_events(filepath, extraction_mode):
+                # Each document's own "connected" marks when it leaves the queue
+                events.put(("document_started" if name == "connected" else name, {**payload, 'document': key}))
+        except Exception:
+            logger.exception(f'Error in batch key terms extraction for {key}')
+            events.put(("error", {'status': 'error', 'error': 'Internal server error', 'is_complete': True, 'document': key}))
+        finally:
+            events.put(None)
+    
+    completed, failed = [], []
+    with ThreadPoolExecutor(max_workers=KEY_TERMS_BATCH_CONCURRENCY, thread_name_prefix="key-terms-batch") as executor:
+        for key, filepath in documents:
+            executor.submit(run, key, filepath)
+        remaining = len(documents)
+        while remaining:
+            item = events.get()
+            if item is None:
+                remaining -= 1
+                continue
+            name, payload = item
+            if name == "complete":
+                completed.append(payload['document'])
+            elif name == "error":
+                failed.append(payload['document'])
+            yield name, payload
+    
+    yield "batch_complete", {'status': 'complete', 'completed': completed, 'failed': failed, 'is_complete': True}
+
+def _resume_key_terms_stream():
+    """Stream job named by the request's Last-Event-ID, and the last event id seen"""
+    job_id, after_id = parse_event_id(request.headers.get("Last-Event-ID") or request.args.get("last_event_id"))
+    job = key_terms_streams.get(job_id) if job_id else None
+    return job, after_id
+
+def _invalid_extraction_mode(mode):
+    """400 response for a key terms `mode` outside EXTRACTION_MODES, else None"""
+    if mode and mode not in EXTRACTION_MODES:
+        logger.error(f'Unknown key terms extraction mode: {mode}')
+        return jsonify({"error": f"Unknown extraction mode '{mode}' (expected one of {', '.join(EXTRACTION_MODES)})"}), 400
+    return None
+
 @app.route("/stream-key-terms", methods=["POST", "GET"])
 def stream_key_terms():
     """
     Stream key terms extraction using the hybrid approach.
     Supports both file upload (POST) and filename parameter (GET).
-    Returns Server-Sent Events (SSE) with live extraction progress.
+    Returns Server-Sent Events (SSE) with live extraction progress: a `progress`
+    event per stage transition, `token` events carrying LLM output as it is
+    generated, `field`/`section` events as structured values are validated,
+    then `complete` or `error`.
+    
+    An optional `mode` parameter selects the extraction mode (two_step,
+    single_pass or sectioned; see key_terms_extractor.EXTRACTION_MODES).
+    
+    The extraction runs as a background job whose events carry ids of the form
+    `<job_id>:<n>`. Reconnecting with a `Last-Event-ID` header (or
+    `last_event_id` parameter) reattaches to the running job and replays the
+    events missed in between instead of starting over.
     """
     logger.info('Received streaming key terms extraction request')
+    extraction_mode = request.values.get("mode")
+    invalid = _invalid_extraction_mode(extraction_mode)
+    if invalid:
+        return invalid
     
     def generate():
         try:
+            job, after_id = _resume_key_terms_stream()
+            if job is not None:
+                logger.info(f'Resuming key terms stream {job.job_id} after event {after_id}')
+                yield from _replay_stream_job(job, after_id)
+                return
+            
             # Determine file path based on request method
             if request.method == "POST":
                 if "file" not in request.files:
@@ -561,46 +874,91 @@ def stream_key_terms():
                     yield f"data: {json.dumps({'status': 'error', 'error': 'File not found'})}\n\n"
                     return
             
-            # Send initial connection event
-            yield f"event: connected\ndata: {json.dumps({'status': 'connected', 'message': 'Starting key terms extraction with streaming...', 'filepath': filepath})}\n\n"
-            
-            # Create a custom extractor that yields progress
-            yield f"event: progress\ndata: {json.dumps({'status': 'streaming', 'stage': 'initializing', 'message': 'Initializing extractor...'})}\n\n"
-            
-            try:
-                # Initialize the extractor
-                extractor = KeyTermsExtractor()
-                
-                # Send indexing progress
-                yield f"event: progress\ndata: {json.dumps({'status': 'streaming', 'stage': 'indexing', 'message': 'Indexing document in LlamaCloud...'})}\n\n"
-                
-                # Process the document (this will stream internally but we can't capture that here)
-                # For true streaming, we'd need to modify the extractor to yield events
-                result = extractor.process_document(filepath)
-                
-                # Send completion event with results
-                if result.get("status") == "success":
-                    yield f"event: complete\ndata: {json.dumps({'status': 'complete', 'data': result['data'], 'metadata': result.get('extraction_metadata', {}), 'is_complete': True})}\n\n"
-                else:
-                    yield f"event: error\ndata: {json.dumps({'status': 'error', 'error': result.get('message', 'Extraction failed'), 'is_complete': True})}\n\n"
-                    
-            except Exception as e:
-                logger.exception('Error during streaming key terms extraction')
-                yield f"event: error\ndata: {json.dumps({'status': 'error', 'error': str(e), 'is_complete': True})}\n\n"
+            # The job keeps running if this connection drops
+            job = key_terms_streams.start(_key_terms_events(filepath, extraction_mode))
+            yield from _replay_stream_job(job, 0)
                 
         except Exception as e:
             logger.exception('Error in stream generator')
             yield f"event: error\ndata: {json.dumps({'status': 'error', 'error': 'Internal server error', 'is_complete': True})}\n\n"
     
-    return Response(generate(), mimetype="text/event-stream")
+    # Keep the request context for the generator and stop proxies from buffering the stream
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/stream-key-terms/batch", methods=["POST", "GET"])
+def stream_key_terms_batch():
+    """
+    Stream key terms extraction for several uploaded documents on one SSE connection.
+    Takes a list of filenames from uploaded_documents, either as JSON
+    {"filenames": [...]} (POST) or as repeated `filename` / comma-separated
+    `filenames` parameters (GET). Documents run with bounded concurrency and
+    their progress/token/field/complete/error events are interleaved, each
+    tagged with a `document` key. An optional `mode` (JSON body or query
+    parameter) applies one of key_terms_extractor.EXTRACTION_MODES (two_step,
+    single_pass or sectioned) to every document. Supports Last-Event-ID like
+    /stream-key-terms.
+    """
+    logger.info('Received batch streaming key terms extraction request')
+    if request.method == "POST":
+        extraction_mode = (request.get_json(silent=True) or {}).get("mode")
+    else:
+        extraction_mode = request.args.get("mode")
+    invalid = _invalid_extraction_mode(extraction_mode)
+    if invalid:
+        return invalid
+    
+    def generate():
+        try:
+            job, after_id = _resume_key_terms_stream()
+            if job is not None:
+                logger.info(f'Resuming batch key terms stream {job.job_id} after event {after_id}')
+                yield from _replay_stream_job(job, after_id)
+                return
+            
+            if request.method == "POST":
+                body = request.get_json(silent=True) or {}
+                filenames = body.get("filenames") or []
+            else:
+                filenames = request.args.getlist("filename")
+                for value in request.args.getlist("filenames"):
+                    filenames.extend(name for name in value.split(",") if name.strip())
+            
+            documents = []
+            for filename in filenames:
+                key = secure_filename(str(filename).strip())
+                if key and key not in (k for k, _ in documents):
+                    filepath = os.path.join("uploaded_documents", key)
+                    documents.append((key, filepath if os.path.exists(filepath) else None))
+            if not documents:
+                yield f"event: error\ndata: {json.dumps({'status': 'error', 'error': 'No filenames provided', 'is_complete': True})}\n\n"
+                return
+            if len(documents) > KEY_TERMS_BATCH_MAX_DOCUMENTS:
+                yield f"event: error\ndata: {json.dumps({'status': 'error', 'error': f'At most {KEY_TERMS_BATCH_MAX_DOCUMENTS} documents per batch', 'is_complete': True})}\n\n"
+                return
+            
+            job = key_terms_streams.start(_batch_key_terms_events(documents, extraction_mode))
+            yield from _replay_stream_job(job, 0)
+        
+        except Exception:
+            logger.exception('Error in batch stream generator')
+            yield f"event: error\ndata: {json.dumps({'status': 'error', 'error': 'Internal server error', 'is_complete': True})}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/extract-key-terms", methods=["POST"])
 def extract_key_terms():
     """
     Non-streaming key terms extraction endpoint.
-    Uses the hybrid approach with LlamaCloud caching.
+    Uses the hybrid approach with LlamaCloud caching. An optional `mode` form
+    field selects two_step, single_pass or sectioned extraction
+    (key_terms_extractor.EXTRACTION_MODES).
     """
     logger.info('Received key terms extraction request')
+    invalid = _invalid_extraction_mode(request.form.get("mode"))
+    if invalid:
+        return invalid
     if "file" not in request.files:
         logger.error('No file part in request')
         return jsonify({"error": "No file part in request"}), 400
@@ -618,9 +976,9 @@ def extract_key_terms():
     uploaded_file.save(filepath)
 
     try:
-        # Use the key terms extractor
-        extractor = KeyTermsExtractor()
-        result = extractor.process_document(filepath)
+        # Shared extractor: models and cloud clients are loaded once per process
+        extractor = get_key_terms_extractor(llama_manager=llama_manager)
+        result = extractor.process_document(filepath, extraction_mode=request.form.get("mode"))
         
         if result.get("status") == "success":
             return jsonify({
@@ -761,7 +1119,7 @@ def lease_flag_query():
         index = load_index_from_storage(storage_context)
         
         # Initialize the output parser
-        output_parser = PydanticOutputParser(RiskFlagsSchema)
+        output_parser = RecoveringPydanticOutputParser(RiskFlagsSchema)
         
         # Format the prompt template for lease flags
         json_prompt_str = """
@@ -1859,7 +2217,10 @@ def list_google_drive_folders():
 
 @app.route("/api/google-drive/sync", methods=["POST"])
 def sync_google_drive():
-    """Sync selected files from Google Drive to the RAG pipeline"""
+    """Queue a sync of selected Google Drive files into the RAG pipeline.
+    Returns immediately with a sync_id; progress is available from
+    /api/google-drive/sync/status/<id> and /api/google-drive/sync/progress/<id>.
+    """
     logger.info('Starting Google Drive sync')
     try:
         data = request.get_json()
@@ -1876,162 +2237,45 @@ def sync_google_drive():
         if not file_ids and not folder_ids:
             return jsonify({"error": "No files or folders selected"}), 400
         
-        # Create sync record
-        sync_record = GoogleDriveSync(
-            user_id=user_id,
-            sync_type='manual',
-            status='in_progress'
-        )
-        db_manager.session.add(sync_record)
-        db_manager.session.commit()
+        available, error_response, status_code = check_google_drive_available()
+        if not available:
+            return error_response, status_code
+        
+        if not google_auth.get_credentials(user_id):
+            raise ValueError("User not authenticated with Google Drive")
         
+        # Create sync record
+        session = db_manager.get_session()
         try:
-            # Collect all files to sync
-            all_files_to_sync = []
-            
-            # Add directly selected files
-            if file_ids:
-                # Get file metadata for selected files
-                service = google_ingestion.auth_manager.get_credentials(user_id)
-                if not service:
-                    raise ValueError("User not authenticated")
-                
-                from googleapiclient.discovery import build
-                service = build('drive', 'v3', credentials=google_ingestion.auth_manager.get_credentials(user_id))
-                
-                for file_id in file_ids:
-                    file_metadata = service.files().get(
-                        fileId=file_id,
-                        fields="id, name, mimeType, size, modifiedTime, webViewLink"
-                    ).execute()
-                    all_files_to_sync.append(file_metadata)
-            
-            # Get all files from selected folders
-            if folder_ids:
-                folder_files = google_ingestion.get_files_in_folders(user_id, folder_ids)
-                all_files_to_sync.extend(folder_files)
-            
-            # Download and process files
-            download_results = []
-            for file_metadata in all_files_to_sync:
-                try:
-                    # Check if file already exists in our database
-                    existing_file = db_manager.session.query(GoogleDriveFile).filter_by(
-                        drive_file_id=file_metadata['id'],
-                        user_id=user_id
-                    ).first()
-                    
-                    # Download file
-                    local_path, original_name = google_ingestion.download_file(
-                        user_id, file_metadata['id'], file_metadata
-                    )
-                    
-                    # Move to permanent storage
-                    permanent_path = os.path.join('uploaded_documents', f'gdrive_{user_id}_{original_name}')
-                    shutil.move(local_path, permanent_path)
-                    
-                    # Create or update database record
-                    if existing_file:
-                        existing_file.drive_file_name = file_metadata['name']
-                        existing_file.mime_type = file_metadata.get('mimeType')
-                        existing_file.file_size = int(file_metadata.get('size', 0))
-                        existing_file.drive_modified_time = datetime.fromisoformat(
-                            file_metadata.get('modifiedTime', '').replace('Z', '+00:00')
-                        ) if file_metadata.get('modifiedTime') else None
-                        existing_file.last_synced = datetime.utcnow()
-                        existing_file.local_file_path = permanent_path
-                        existing_file.web_view_link = file_metadata.get('webViewLink')
-                        existing_file.index_status = 'pending'
-                    else:
-                        drive_file = GoogleDriveFile(
-                            user_id=user_id,
-                            drive_file_id=file_metadata['id'],
-                            drive_file_name=file_metadata['name'],
-                            mime_type=file_metadata.get('mimeType'),
-                            file_size=int(file_metadata.get('size', 0)),
-                            drive_modified_time=datetime.fromisoformat(
-                                file_metadata.get('modifiedTime', '').replace('Z', '+00:00')
-                            ) if file_metadata.get('modifiedTime') else None,
-                            local_file_path=permanent_path,
-                            web_view_link=file_metadata.get('webViewLink'),
-                            index_status='pending'
-                        )
-                        db_manager.session.add(drive_file)
-                    
-                    db_manager.session.commit()
-                    
-                    # Index the file with the RAG pipeline
-                    try:
-                        mgr = get_index_manager(force_connect=True)
-                        if mgr:
-                            success = mgr.upload_file(permanent_path)
-                            if success:
-                                if existing_file:
-                                    existing_file.index_status = 'indexed'
-                                else:
-                                    drive_file.index_status = 'indexed'
-                                db_manager.session.commit()
-                                
-                                download_results.append({
-                                    'file_id': file_metadata['id'],
-                                    'name': file_metadata['name'],
-                                    'status': 'success',
-                                    'indexed': True
-                                })
-                            else:
-                                raise Exception("Failed to index file")
-                        else:
-                            raise Exception("Index server unavailable")
-                    except Exception as index_error:
-                        logger.error(f"Failed to index file {file_metadata['name']}: {str(index_error)}")
-                        if existing_file:
-                            existing_file.index_status = 'failed'
-                            existing_file.index_error = str(index_error)
-                        else:
-                            drive_file.index_status = 'failed'
-                            drive_file.index_error = str(index_error)
-                        db_manager.session.commit()
-                        
-                        download_results.append({
-                            'file_id': file_metadata['id'],
-                            'name': file_metadata['name'],
-                            'status': 'success',
-                            'indexed': False,
-                            'index_error': str(index_error)
-                        })
-                    
-                    sync_record.files_processed += 1
-                    
-                except Exception as e:
-                    logger.error(f"Failed to process file {file_metadata.get('name', 'unknown')}: {str(e)}")
-                    download_results.append({
-                        'file_id': file_metadata['id'],
-                        'name': file_metadata.get('name', 'unknown'),
-                        'status': 'error',
-                        'error': str(e)
-                    })
-                    sync_record.files_failed += 1
-            
-            # Update sync record
-            sync_record.status = 'completed'
-            sync_record.completed_at = datetime.utcnow()
-            db_manager.session.commit()
-            
-            return jsonify({
-                "status": "success",
-                "sync_id": sync_record.id,
-                "files_processed": sync_record.files_processed,
-                "files_failed": sync_record.files_failed,
-                "results": download_results
-            }), 200
+            sync_record = GoogleDriveSync(
+                user_id=user_id,
+                sync_type='manual',
+                status='queued'
+            )
+            session.add(sync_record)
+            session.commit()
+            sync_id = sync_record.id
             
-        except Exception as e:
-            # Update sync record with error
-            sync_record.status = 'failed'
-            sync_record.error_message = str(e)
-            sync_record.completed_at = datetime.utcnow()
-            db_manager.session.commit()
-            raise
+            try:
+                google_sync_worker.submit(sync_id, user_id, file_ids, folder_ids)
+            except queue.Full:
+                sync_record.status = 'failed'
+                sync_record.error_message = 'Sync queue is full'
+                sync_record.completed_at = datetime.utcnow()
+                session.commit()
+                return jsonify({
+                    "status": "error",
+                    "message": "Too many syncs in progress, please retry shortly"
+                }), 503
+        finally:
+            session.close()
+        
+        return jsonify({
+            "status": "queued",
+            "sync_id": sync_id,
+            "status_url": f"/api/google-drive/sync/status/{sync_id}",
+            "progress_url": f"/api/google-drive/sync/progress/{sync_id}"
+        }), 202
             
     except ValueError as e:
         logger.error(f'Auth error: {str(e)}')
@@ -2046,18 +2290,32 @@ def sync_google_drive():
             "message": "Sync failed"
         }), 500
 
+def _load_sync_record(sync_id: int):
+    """Return the sync record as a dict, or None if it does not exist"""
+    session = db_manager.get_session()
+    try:
+        sync_record = session.get(GoogleDriveSync, sync_id)
+        return sync_record.to_dict() if sync_record else None
+    finally:
+        session.close()
+
 @app.route("/api/google-drive/sync/status/<int:sync_id>", methods=["GET"])
 def get_sync_status(sync_id):
     """Get the status of a sync operation"""
     logger.info(f'Getting sync status for ID: {sync_id}')
     try:
-        sync_record = db_manager.session.query(GoogleDriveSync).get(sync_id)
-        if not sync_record:
+        sync_data = _load_sync_record(sync_id)
+        if not sync_data:
             return jsonify({"error": "Sync record not found"}), 404
         
+        progress = google_sync_worker.get_progress(sync_id) if google_sync_worker else None
+        if progress:
+            sync_data['files_total'] = progress.get('files_total')
+            sync_data['results'] = progress['results']
+        
         return jsonify({
             "status": "success",
-            "sync": sync_record.to_dict()
+            "sync": sync_data
         }), 200
         
     except Exception as e:
@@ -2067,6 +2325,56 @@ def get_sync_status(sync_id):
             "message": "Failed to get sync status"
         }), 500
 
+@app.route("/api/google-drive/sync/progress/<int:sync_id>", methods=["GET"])
+def stream_sync_progress(sync_id):
+    """
+    Stream live progress of a sync operation as Server-Sent Events.
+    Emits 'progress' events as files complete and a final 'complete' event.
+    """
+    logger.info(f'Streaming sync progress for ID: {sync_id}')
+    
+    def generate():
+        try:
+            version = None
+            last_db_state = None
+            while True:
+                snapshot = google_sync_worker.wait_for_update(sync_id, version) if google_sync_worker else None
+                
+                if snapshot is None:
+                    # Not tracked by this process (e.g. finished long ago); poll the database
+                    sync_data = _load_sync_record(sync_id)
+                    if not sync_data:
+                        yield f"event: error\ndata: {json.dumps({'status': 'error', 'error': 'Sync record not found', 'is_complete': True})}\n\n"
+                        return
+                    if sync_data != last_db_state:
+                        last_db_state = sync_data
+                        is_complete = sync_data['status'] in TERMINAL_SYNC_STATUSES
+                        event = 'complete' if is_complete else 'progress'
+                        yield f"event: {event}\ndata: {json.dumps({**sync_data, 'is_complete': is_complete})}\n\n"
+                        if is_complete:
+                            return
+                    else:
+                        yield ": heartbeat\n\n"
+                    time.sleep(2)
+                    continue
+                
+                if snapshot['version'] == version:
+                    # Keep idle connections open through proxies
+                    yield ": heartbeat\n\n"
+                    continue
+                
+                version = snapshot['version']
+                is_complete = snapshot['status'] in TERMINAL_SYNC_STATUSES
+                event = 'complete' if is_complete else 'progress'
+                yield f"event: {event}\ndata: {json.dumps({**snapshot, 'is_complete': is_complete})}\n\n"
+                if is_complete:
+                    return
+        except Exception:
+            logger.exception('Error in sync progress stream')
+            yield f"event: error\ndata: {json.dumps({'status': 'error', 'error': 'Internal server error', 'is_complete': True})}\n\n"
+    
+    return Response(generate(), mimetype="text/event-stream")
+
 @app.route("/api/google-drive/synced-files", methods=["GET"])
 def get_synced_files():
     """Get all synced Google Drive files for a user"""
@@ -2122,7 +2430,7 @@ def refresh_google_drive_file(drive_file_id):
         
         file_metadata = service.files().get(
             fileId=drive_file_id,
-            fields="id, name, mimeType, size, modifiedTime, webViewLink"
+            fields="id, name, mimeType, size, md5Checksum, modifiedTime, webViewLink"
         ).execute()
         
         # Check if file has been modified
@@ -2138,15 +2446,14 @@ def refresh_google_drive_file(drive_file_id):
                     "modified": False
                 }), 200
         
-        # Download updated file
-        local_path, original_name = google_ingestion.download_file(
-            user_id, drive_file_id, file_metadata
+        # Download updated file into content-addressed storage
+        download = google_ingestion.download_to_storage(
+            user_id, drive_file_id, file_metadata, storage_dir='uploaded_documents'
         )
         
-        # Replace the existing file
-        if os.path.exists(drive_file.local_file_path):
-            os.remove(drive_file.local_file_path)
-        shutil.move(local_path, drive_file.local_file_path)
+        # Drop the previous copy unless another synced file still points at it
+        remove_unreferenced_copy(db_manager.session, drive_file.local_file_path, download['local_path'], drive_file.id)
+        drive_file.local_file_path = download['local_path']
         
         # Update database record
         drive_file.drive_file_name = file_metadata['name']
@@ -2159,14 +2466,13 @@ def refresh_google_drive_file(drive_file_id):
         
         # Re-index the file
         try:
-            mgr = get_index_manager(force_connect=True)
-            if mgr:
-                success = mgr.upload_file(drive_file.local_file_path)
-                if success:
-                    drive_file.index_status = 'indexed'
-                else:
-                    drive_file.index_status = 'failed'
-                    drive_file.index_error = 'Failed to index file'
+            with index_shards.connection(download['md5_checksum']) as mgr:
+                success = _rpc_value(mgr.upload_file(drive_file.local_file_path))
+            if success:
+                drive_file.index_status = 'indexed'
+            else:
+                drive_file.index_status = 'failed'
+                drive_file.index_error = 'Failed to index file'
         except Exception as index_error:
             drive_file.index_status = 'failed'
             drive_file.index_error = str(index_error)
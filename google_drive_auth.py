@@ -3,7 +3,9 @@ Google Drive OAuth authentication handler
 """
 import os
 import json
+import time
 import logging
+import threading
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from google.auth.transport.requests import Request
@@ -34,6 +36,16 @@ class GoogleDriveAuth:
         
         # In production, this should be stored in a database per user
         self.token_storage = {}
+        
+        # Ready-to-use Credentials objects, refreshed ahead of expiry
+        self.refresh_ahead_seconds = int(os.environ.get('GOOGLE_TOKEN_REFRESH_AHEAD_SECONDS', 300))
+        self._credentials_cache: Dict[str, Credentials] = {}
+        self._cache_lock = threading.Lock()
+        self._refresh_locks: Dict[str, threading.Lock] = {}
+        self._refresh_timers: Dict[str, threading.Timer] = {}
+        # Users idle this long stop being refreshed ahead and leave the cache
+        self.credentials_idle_seconds = int(os.environ.get('GOOGLE_CREDENTIALS_IDLE_SECONDS', 3600))
+        self._last_used: Dict[str, float] = {}
     
     def get_auth_url(self, user_id: str, state: Optional[str] = None) -> str:
         """Generate OAuth authorization URL"""
@@ -124,9 +136,114 @@ class GoogleDriveAuth:
         os.makedirs('token_storage', exist_ok=True)
         with open(f'token_storage/google_drive_tokens_{user_id}.json', 'w') as f:
             json.dump(token_data, f)
+        
+        self._cache_credentials(user_id, credentials)
+    
+    def _cache_credentials(self, user_id: str, credentials: Credentials):
+        """Keep a ready Credentials object and schedule its refresh-ahead"""
+        with self._cache_lock:
+            self._credentials_cache[user_id] = credentials
+            # Refreshes re-cache credentials too; only callers count as use
+            self._last_used.setdefault(user_id, time.monotonic())
+        self._schedule_refresh(user_id, credentials)
+    
+    def _evict_credentials(self, user_id: str):
+        """Drop cached credentials and cancel any pending refresh"""
+        with self._cache_lock:
+            self._credentials_cache.pop(user_id, None)
+            self._last_used.pop(user_id, None)
+            timer = self._refresh_timers.pop(user_id, None)
+        if timer:
+            timer.cancel()
+    
+    def _needs_refresh(self, credentials: Credentials) -> bool:
+        """True if credentials are expired or inside the refresh-ahead window"""
+        if credentials.expired:
+            return True
+        if not credentials.expiry:
+            return False
+        return credentials.expiry - datetime.utcnow() <= timedelta(seconds=self.refresh_ahead_seconds)
+    
+    def _schedule_refresh(self, user_id: str, credentials: Credentials):
+        """Schedule a background refresh shortly before the access token expires"""
+        if self.refresh_ahead_seconds <= 0 or not credentials.refresh_token or not credentials.expiry:
+            return
+        
+        delay = (credentials.expiry - datetime.utcnow()).total_seconds() - self.refresh_ahead_seconds
+        timer = threading.Timer(max(delay, 0), self._refresh_ahead, args=(user_id,))
+        timer.daemon = True
+        
+        with self._cache_lock:
+            previous = self._refresh_timers.get(user_id)
+            self._refresh_timers[user_id] = timer
+        if previous:
+            previous.cancel()
+        timer.start()
+    
+    def _is_idle(self, user_id: str) -> bool:
+        with self._cache_lock:
+            last_used = self._last_used.get(user_id)
+        return last_used is None or time.monotonic() - last_used >= self.credentials_idle_seconds
+    
+    def _refresh_ahead(self, user_id: str):
+        """Timer callback: renew cached credentials before they expire.
+        Idle users are evicted instead, and a failed refresh is not re-armed."""
+        if self._is_idle(user_id):
+            logger.info(f"Dropping cached Google Drive credentials for idle user {user_id}")
+            self._evict_credentials(user_id)
+            return
+        with self._cache_lock:
+            credentials = self._credentials_cache.get(user_id)
+        if credentials is not None and credentials.refresh_token:
+            logger.info(f"Refreshing Google Drive token ahead of expiry for user {user_id}")
+            if self._refresh_credentials(user_id, credentials) is None:
+                # get_credentials retries the refresh on the next request
+                with self._cache_lock:
+                    if self._refresh_timers.get(user_id) is threading.current_thread():
+                        del self._refresh_timers[user_id]
+    
+    def _refresh_credentials(self, user_id: str, credentials: Credentials) -> Optional[Credentials]:
+        """Refresh credentials, letting only one caller per user hit the token endpoint"""
+        with self._cache_lock:
+            refresh_lock = self._refresh_locks.setdefault(user_id, threading.Lock())
+        
+        with refresh_lock:
+            # Another caller may have refreshed while we waited for the lock
+            with self._cache_lock:
+                current = self._credentials_cache.get(user_id, credentials)
+            if not self._needs_refresh(current):
+                return current
+            
+            try:
+                current.refresh(Request())
+                self.store_tokens(user_id, current)
+                return current
+            except Exception as e:
+                logger.error(f"Token refresh failed: {str(e)}")
+                return None
     
     def get_credentials(self, user_id: str) -> Optional[Credentials]:
         """Get valid credentials for a user, refreshing if necessary"""
+        # Fast path: ready credentials kept fresh by the refresh-ahead timer
+        with self._cache_lock:
+            credentials = self._credentials_cache.get(user_id)
+            if credentials is not None:
+                self._last_used[user_id] = time.monotonic()
+        
+        if credentials is None:
+            credentials = self._load_credentials(user_id)
+            if credentials is None:
+                return None
+            self._cache_credentials(user_id, credentials)
+        
+        # Refresh if expired
+        if credentials.expired and credentials.refresh_token:
+            return self._refresh_credentials(user_id, credentials)
+        
+        return credentials
+    
+    def _load_credentials(self, user_id: str) -> Optional[Credentials]:
+        """Build Credentials from stored token data"""
         # Try to load from memory first
         token_data = self.token_storage.get(user_id)
         
@@ -155,15 +272,6 @@ class GoogleDriveAuth:
         if token_data.get('expiry'):
             credentials.expiry = datetime.fromisoformat(token_data['expiry'])
         
-        # Refresh if expired
-        if credentials.expired and credentials.refresh_token:
-            try:
-                credentials.refresh(Request())
-                self.store_tokens(user_id, credentials)
-            except Exception as e:
-                logger.error(f"Token refresh failed: {str(e)}")
-                return None
-        
         return credentials
     
     def revoke_access(self, user_id: str) -> bool:
@@ -182,6 +290,7 @@ class GoogleDriveAuth:
                 logger.info(f"Token revocation response: {response.status_code}")
             
             # Remove stored tokens regardless of revocation result
+            self._evict_credentials(user_id)
             if user_id in self.token_storage:
                 del self.token_storage[user_id]
             
@@ -194,6 +303,7 @@ class GoogleDriveAuth:
             logger.error(f"Failed to revoke access: {str(e)}")
             # Still remove local tokens even if revocation fails
             try:
+                self._evict_credentials(user_id)
                 if user_id in self.token_storage:
                     del self.token_storage[user_id]
                 
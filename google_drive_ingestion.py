@@ -2,9 +2,10 @@
 Google Drive file ingestion and synchronization
 """
 import os
-import io
+import hashlib
 import tempfile
 import logging
+import uuid
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 from googleapiclient.discovery import build
@@ -14,6 +15,31 @@ from google_drive_auth import GoogleDriveAuth
 
 logger = logging.getLogger(__name__)
 
+# Default chunk size for streamed Drive downloads (bytes); override with
+# GOOGLE_DRIVE_DOWNLOAD_CHUNK_SIZE or the chunk_size constructor argument
+DEFAULT_DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Drive's HTTP batch endpoint accepts at most 100 sub-requests per call
+METADATA_BATCH_SIZE = 100
+
+# Fields requested for single-file metadata lookups
+FILE_METADATA_FIELDS = "id, name, mimeType, size, md5Checksum, modifiedTime, webViewLink"
+
+
+class _HashingWriter:
+    """File-like wrapper that updates an MD5 digest as chunks are written"""
+
+    def __init__(self, fh):
+        self._fh = fh
+        self.md5 = hashlib.md5()
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.md5.update(data)
+        self.bytes_written += len(data)
+        return self._fh.write(data)
+
+
 class GoogleDriveIngestion:
     """Handles downloading and processing files from Google Drive"""
     
@@ -35,10 +61,13 @@ class GoogleDriveIngestion:
         'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     ] + list(GOOGLE_DOCS_EXPORT_FORMATS.keys())
     
-    def __init__(self, auth_manager: GoogleDriveAuth):
+    def __init__(self, auth_manager: GoogleDriveAuth, chunk_size: Optional[int] = None):
         self.auth_manager = auth_manager
         self.temp_dir = os.path.join(tempfile.gettempdir(), 'atlas_gdrive_temp')
         os.makedirs(self.temp_dir, exist_ok=True)
+        self.chunk_size = chunk_size or int(
+            os.environ.get('GOOGLE_DRIVE_DOWNLOAD_CHUNK_SIZE', DEFAULT_DOWNLOAD_CHUNK_SIZE)
+        )
     
     def list_files(self, user_id: str, folder_id: Optional[str] = None, 
                    page_size: int = 100, page_token: Optional[str] = None) -> Dict[str, Any]:
@@ -66,7 +95,7 @@ class GoogleDriveIngestion:
                 q=query,
                 pageSize=page_size,
                 pageToken=page_token,
-                fields="nextPageToken, files(id, name, mimeType, size, modifiedTime, parents, webViewLink)",
+                fields="nextPageToken, files(id, name, mimeType, size, md5Checksum, modifiedTime, parents, webViewLink)",
                 orderBy="modifiedTime desc"
             ).execute()
             
@@ -181,6 +210,64 @@ class GoogleDriveIngestion:
             logger.error(f"Traceback: {traceback.format_exc()}")
             raise
     
+    def _build_download_request(self, service, file_id: str, file_metadata: Dict[str, Any]) -> Tuple[Any, str]:
+        """Build the media request for a file and return it with the local filename"""
+        mime_type = file_metadata.get('mimeType', '')
+        file_name = file_metadata.get('name', f'file_{file_id}')
+        
+        # Determine if we need to export (Google Docs) or download
+        if mime_type in self.GOOGLE_DOCS_EXPORT_FORMATS:
+            # Export Google Docs/Sheets/Slides
+            export_mime_type = self.GOOGLE_DOCS_EXPORT_FORMATS[mime_type]
+            request = service.files().export_media(
+                fileId=file_id,
+                mimeType=export_mime_type
+            )
+            
+            # Update file extension based on export type
+            if export_mime_type == 'text/plain':
+                file_name = os.path.splitext(file_name)[0] + '.txt'
+            elif export_mime_type == 'text/csv':
+                file_name = os.path.splitext(file_name)[0] + '.csv'
+            elif export_mime_type == 'application/pdf':
+                file_name = os.path.splitext(file_name)[0] + '.pdf'
+        else:
+            # Download regular files
+            request = service.files().get_media(fileId=file_id)
+        
+        return request, file_name
+    
+    def _stream_to_file(self, request, target_path: str) -> str:
+        """Stream a media request into target_path, hashing on the fly.
+        
+        Data is written to a sibling '.part' file which is atomically renamed
+        over target_path once the download completes. Returns the MD5 hex digest.
+        """
+        part_path = f"{target_path}.part"
+        try:
+            with open(part_path, 'wb') as fh:
+                writer = _HashingWriter(fh)
+                downloader = MediaIoBaseDownload(writer, request, chunksize=self.chunk_size)
+                
+                done = False
+                while not done:
+                    status, done = downloader.next_chunk()
+                    if status:
+                        logger.info(f"Download {int(status.progress() * 100)}% complete.")
+            
+            os.replace(part_path, target_path)
+            return writer.md5.hexdigest()
+        except Exception:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+    
+    @staticmethod
+    def content_addressed_path(storage_dir: str, md5_checksum: str, file_name: str) -> str:
+        """Return the permanent storage path for content with the given MD5 checksum"""
+        extension = os.path.splitext(file_name)[1].lower()
+        return os.path.join(storage_dir, f"gdrive_{md5_checksum}{extension}")
+    
     def download_file(self, user_id: str, file_id: str, file_metadata: Dict[str, Any]) -> Tuple[str, str]:
         """Download a file from Google Drive and return local path and original filename"""
         credentials = self.auth_manager.get_credentials(user_id)
@@ -189,41 +276,11 @@ class GoogleDriveIngestion:
         
         try:
             service = build('drive', 'v3', credentials=credentials)
-            
-            mime_type = file_metadata.get('mimeType', '')
-            file_name = file_metadata.get('name', f'file_{file_id}')
-            
-            # Determine if we need to export (Google Docs) or download
-            if mime_type in self.GOOGLE_DOCS_EXPORT_FORMATS:
-                # Export Google Docs/Sheets/Slides
-                export_mime_type = self.GOOGLE_DOCS_EXPORT_FORMATS[mime_type]
-                request = service.files().export_media(
-                    fileId=file_id,
-                    mimeType=export_mime_type
-                )
-                
-                # Update file extension based on export type
-                if export_mime_type == 'text/plain':
-                    file_name = os.path.splitext(file_name)[0] + '.txt'
-                elif export_mime_type == 'text/csv':
-                    file_name = os.path.splitext(file_name)[0] + '.csv'
-                elif export_mime_type == 'application/pdf':
-                    file_name = os.path.splitext(file_name)[0] + '.pdf'
-            else:
-                # Download regular files
-                request = service.files().get_media(fileId=file_id)
+            request, file_name = self._build_download_request(service, file_id, file_metadata)
             
             # Download to temp file
             temp_path = os.path.join(self.temp_dir, f"{user_id}_{file_id}_{file_name}")
-            
-            fh = io.FileIO(temp_path, 'wb')
-            downloader = MediaIoBaseDownload(fh, request)
-            
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-                if status:
-                    logger.info(f"Download {int(status.progress() * 100)}% complete.")
+            self._stream_to_file(request, temp_path)
             
             logger.info(f"Downloaded file: {file_name} to {temp_path}")
             return temp_path, file_name
@@ -232,6 +289,105 @@ class GoogleDriveIngestion:
             logger.error(f"Error downloading file {file_id}: {error}")
             raise
     
+    def download_to_storage(self, user_id: str, file_id: str, file_metadata: Dict[str, Any],
+                            storage_dir: str = 'uploaded_documents') -> Dict[str, Any]:
+        """Stream a file straight into content-addressed permanent storage.
+        
+        When Drive reports an md5Checksum that we already hold, the download is
+        skipped entirely. Returns a dict with 'local_path', 'original_name',
+        'md5_checksum' and 'skipped'.
+        """
+        credentials = self.auth_manager.get_credentials(user_id)
+        if not credentials:
+            raise ValueError("User not authenticated with Google Drive")
+        
+        os.makedirs(storage_dir, exist_ok=True)
+        
+        try:
+            service = build('drive', 'v3', credentials=credentials)
+            request, file_name = self._build_download_request(service, file_id, file_metadata)
+            
+            # Binary files carry a Drive checksum; exported Google Docs do not
+            drive_md5 = file_metadata.get('md5Checksum')
+            if drive_md5:
+                existing_path = self.content_addressed_path(storage_dir, drive_md5, file_name)
+                if os.path.exists(existing_path):
+                    logger.info(f"Skipping download of {file_name}: checksum {drive_md5} already stored")
+                    return {
+                        'local_path': existing_path,
+                        'original_name': file_name,
+                        'md5_checksum': drive_md5,
+                        'skipped': True
+                    }
+            
+            # Stream into the storage directory so the final rename stays on one filesystem;
+            # the suffix keeps concurrent downloads of the same Drive file apart
+            staging_path = os.path.join(storage_dir, f".gdrive_{user_id}_{file_id}_{uuid.uuid4().hex}")
+            md5_checksum = self._stream_to_file(request, staging_path)
+            
+            if drive_md5 and md5_checksum != drive_md5:
+                os.remove(staging_path)
+                raise IOError(
+                    f"Checksum mismatch for {file_name}: expected {drive_md5}, got {md5_checksum}"
+                )
+            
+            final_path = self.content_addressed_path(storage_dir, md5_checksum, file_name)
+            os.replace(staging_path, final_path)
+            
+            logger.info(f"Downloaded file: {file_name} to {final_path}")
+            return {
+                'local_path': final_path,
+                'original_name': file_name,
+                'md5_checksum': md5_checksum,
+                'skipped': False
+            }
+            
+        except HttpError as error:
+            logger.error(f"Error downloading file {file_id}: {error}")
+            raise
+    
+    def get_files_metadata(self, user_id: str, file_ids: List[str]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+        """Fetch metadata for many files using Drive's HTTP batch API.
+        
+        Returns (metadata_by_id, errors_by_id). Each call to Drive carries up to
+        METADATA_BATCH_SIZE sub-requests, and a failing id only affects its own entry.
+        """
+        credentials = self.auth_manager.get_credentials(user_id)
+        if not credentials:
+            raise ValueError("User not authenticated with Google Drive")
+        
+        service = build('drive', 'v3', credentials=credentials)
+        metadata_by_id: Dict[str, Dict[str, Any]] = {}
+        errors_by_id: Dict[str, str] = {}
+        
+        # De-duplicate while preserving the caller's order
+        unique_ids = list(dict.fromkeys(file_ids))
+        
+        def handle_response(request_id, response, exception):
+            if exception is not None:
+                logger.error(f"Failed to get metadata for file {request_id}: {exception}")
+                errors_by_id[request_id] = str(exception)
+            else:
+                metadata_by_id[request_id] = response
+        
+        for start in range(0, len(unique_ids), METADATA_BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=handle_response)
+            for file_id in unique_ids[start:start + METADATA_BATCH_SIZE]:
+                batch.add(
+                    service.files().get(fileId=file_id, fields=FILE_METADATA_FIELDS),
+                    request_id=file_id
+                )
+            try:
+                batch.execute()
+            except HttpError as error:
+                # The whole round trip failed; attribute it to every id in this batch
+                logger.error(f"Batch metadata request failed: {error}")
+                for file_id in unique_ids[start:start + METADATA_BATCH_SIZE]:
+                    if file_id not in metadata_by_id:
+                        errors_by_id.setdefault(file_id, str(error))
+        
+        return metadata_by_id, errors_by_id
+    
     def batch_download_files(self, user_id: str, file_ids: List[str]) -> List[Dict[str, Any]]:
         """Download multiple files and return their paths and metadata"""
         credentials = self.auth_manager.get_credentials(user_id)
@@ -239,15 +395,19 @@ class GoogleDriveIngestion:
             raise ValueError("User not authenticated with Google Drive")
         
         results = []
-        service = build('drive', 'v3', credentials=credentials)
+        metadata_by_id, errors_by_id = self.get_files_metadata(user_id, file_ids)
         
         for file_id in file_ids:
+            if file_id in errors_by_id:
+                results.append({
+                    'file_id': file_id,
+                    'status': 'error',
+                    'error': errors_by_id[file_id]
+                })
+                continue
+            
             try:
-                # Get file metadata
-                file_metadata = service.files().get(
-                    fileId=file_id,
-                    fields="id, name, mimeType, size, modifiedTime, webViewLink"
-                ).execute()
+                file_metadata = metadata_by_id[file_id]
                 
                 # Skip unsupported files
                 if file_metadata.get('mimeType') not in self.SUPPORTED_MIME_TYPES:
@@ -301,7 +461,7 @@ class GoogleDriveIngestion:
                         q=f"'{folder_id}' in parents and trashed = false",
                         pageSize=100,
                         pageToken=page_token,
-                        fields="nextPageToken, files(id, name, mimeType, size, modifiedTime, parents, webViewLink)"
+                        fields="nextPageToken, files(id, name, mimeType, size, md5Checksum, modifiedTime, parents, webViewLink)"
                     ).execute()
                     
                     files = results.get('files', [])
@@ -0,0 +1,486 @@
+"""
+Background Google Drive sync worker with live progress tracking
+"""
+import os
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable, ContextManager
+from database import db_manager, GoogleDriveFile, GoogleDriveSync, utc_now
+from google_drive_ingestion import GoogleDriveIngestion
+from index_server_pool import rpc_value
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_SYNC_STATUSES = ('completed', 'failed')
+
+# Pipeline stages in order, with their default concurrency. Indexing stays at
+# one worker by default because it talks to the single index server.
+SYNC_STAGES = ('download', 'persist', 'index')
+DEFAULT_STAGE_CONCURRENCY = {'download': 4, 'persist': 1, 'index': 1}
+
+# Sentinel telling a stage worker to exit
+_STOP = object()
+
+# Seconds run_sync waits for the next file result before failing the sync
+DEFAULT_RESULT_TIMEOUT = 1800.0
+
+
+class IndexUploadFailed(RuntimeError):
+    """Raised when the index server reports it could not index a synced file"""
+
+
+def remove_unreferenced_copy(session, path: Optional[str], keep_path: Optional[str], drive_file_row_id: Optional[int]):
+    """Delete a replaced local copy unless it is the new copy or another synced file still points at it"""
+    if not path or path == keep_path or not os.path.exists(path):
+        return
+    still_referenced = session.query(GoogleDriveFile).filter(
+        GoogleDriveFile.local_file_path == path,
+        GoogleDriveFile.id != drive_file_row_id
+    ).first()
+    if not still_referenced:
+        os.remove(path)
+
+
+class _StageMetrics:
+    """Thread-safe throughput counters for one pipeline stage"""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.items = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+        self.first_started: Optional[float] = None
+        self.last_finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, started: float, finished: float, failed: bool):
+        with self._lock:
+            self.items += 1
+            if failed:
+                self.failures += 1
+            self.busy_seconds += finished - started
+            if self.first_started is None or started < self.first_started:
+                self.first_started = started
+            if self.last_finished is None or finished > self.last_finished:
+                self.last_finished = finished
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            wall_seconds = (self.last_finished - self.first_started) if self.items else 0.0
+            return {
+                'concurrency': self.concurrency,
+                'items': self.items,
+                'failures': self.failures,
+                'busy_seconds': round(self.busy_seconds, 3),
+                'wall_seconds': round(wall_seconds, 3),
+                'items_per_second': round(self.items / wall_seconds, 3) if wall_seconds > 0 else None
+            }
+
+
+class GoogleDriveSyncWorker:
+    """Runs queued Drive sync jobs on background threads.
+
+    The HTTP request only creates the GoogleDriveSync record and enqueues the
+    job. Each job runs its files through a download -> persist -> index
+    pipeline whose stages are connected by bounded queues and have their own
+    concurrency, so downloads keep flowing while earlier files are indexed.
+    files_processed/files_failed are committed after every file, and an
+    in-memory progress snapshot per sync is kept so SSE clients can follow along.
+    """
+
+    # Finished syncs whose progress snapshots are kept in memory
+    MAX_TRACKED_SYNCS = 200
+
+    def __init__(self, ingestion: GoogleDriveIngestion, index_connection: Callable[[Optional[str]], ContextManager[Any]],
+                 db=db_manager, storage_dir: str = 'uploaded_documents',
+                 num_workers: Optional[int] = None, max_queue_size: Optional[int] = None,
+                 stage_concurrency: Optional[Dict[str, int]] = None, stage_queue_size: Optional[int] = None,
+                 result_timeout: Optional[float] = None):
+        self.ingestion = ingestion
+        # index_connection(routing_key) returns a context manager yielding a
+        # connection to the owning index server shard; each index stage
+        # thread checks out its own
+        self.index_connection = index_connection
+        self.db = db
+        self.storage_dir = storage_dir
+        self.stage_concurrency = {
+            stage: int(os.environ.get(f'GOOGLE_DRIVE_SYNC_{stage.upper()}_WORKERS', default))
+            for stage, default in DEFAULT_STAGE_CONCURRENCY.items()
+        }
+        self.stage_concurrency.update(stage_concurrency or {})
+        self.stage_queue_size = stage_queue_size or int(os.environ.get('GOOGLE_DRIVE_SYNC_STAGE_QUEUE_SIZE', 8))
+        self.result_timeout = result_timeout or float(os.environ.get('GOOGLE_DRIVE_SYNC_RESULT_TIMEOUT', DEFAULT_RESULT_TIMEOUT))
+        self.num_workers = num_workers or int(os.environ.get('GOOGLE_DRIVE_SYNC_WORKERS', 2))
+        self.jobs = queue.Queue(maxsize=max_queue_size or int(os.environ.get('GOOGLE_DRIVE_SYNC_QUEUE_SIZE', 100)))
+
+        self._progress: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._progress_changed = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.num_workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"gdrive-sync-{i}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, sync_id: int, user_id: str, file_ids: List[str], folder_ids: List[str]):
+        """Queue a sync job; raises queue.Full when the backlog is saturated"""
+        self.start()
+        self._update_progress(sync_id, {
+            'sync_id': sync_id,
+            'user_id': user_id,
+            'status': 'queued',
+            'files_total': None,
+            'files_processed': 0,
+            'files_failed': 0,
+            'results': []
+        })
+        try:
+            self.jobs.put_nowait({
+                'sync_id': sync_id,
+                'user_id': user_id,
+                'file_ids': list(file_ids or []),
+                'folder_ids': list(folder_ids or [])
+            })
+        except queue.Full:
+            with self._progress_changed:
+                self._progress.pop(sync_id, None)
+            raise
+
+    def get_progress(self, sync_id: int) -> Optional[Dict[str, Any]]:
+        """Return a copy of the latest progress snapshot, if this process tracks it"""
+        with self._progress_changed:
+            snapshot = self._progress.get(sync_id)
+            return self._copy_snapshot(snapshot) if snapshot else None
+
+    def wait_for_update(self, sync_id: int, last_version: int, timeout: float = 15.0) -> Optional[Dict[str, Any]]:
+        """Block until the snapshot for sync_id moves past last_version or timeout elapses.
+
+        Returns the current snapshot (unchanged on timeout) or None if unknown.
+        """
+        with self._progress_changed:
+            self._progress_changed.wait_for(
+                lambda: sync_id not in self._progress or self._progress[sync_id]['version'] != last_version,
+                timeout=timeout
+            )
+            snapshot = self._progress.get(sync_id)
+            return self._copy_snapshot(snapshot) if snapshot else None
+
+    @staticmethod
+    def _copy_snapshot(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        copied = dict(snapshot)
+        copied['results'] = list(snapshot['results'])
+        return copied
+
+    def _update_progress(self, sync_id: int, changes: Dict[str, Any], result: Optional[Dict[str, Any]] = None):
+        with self._progress_changed:
+            snapshot = self._progress.setdefault(sync_id, {'version': 0, 'results': []})
+            snapshot.update(changes)
+            if result is not None:
+                snapshot['results'].append(result)
+            snapshot['version'] = snapshot.get('version', 0) + 1
+            self._progress.move_to_end(sync_id)
+
+            # Forget the oldest finished syncs once we track too many
+            while len(self._progress) > self.MAX_TRACKED_SYNCS:
+                oldest_id, oldest = next(iter(self._progress.items()))
+                if oldest.get('status') not in TERMINAL_SYNC_STATUSES:
+                    break
+                del self._progress[oldest_id]
+
+            self._progress_changed.notify_all()
+
+    def _worker_loop(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                self.run_sync(**job)
+            except Exception:
+                logger.exception(f"Unhandled error in Drive sync {job.get('sync_id')}")
+            finally:
+                self.jobs.task_done()
+
+    def run_sync(self, sync_id: int, user_id: str, file_ids: List[str], folder_ids: List[str]):
+        """Process a sync job, committing progress after each file"""
+        session = self.db.get_session()
+        try:
+            sync_record = session.get(GoogleDriveSync, sync_id)
+            if sync_record is None:
+                logger.error(f"Sync record {sync_id} not found; dropping job")
+                return
+
+            sync_record.status = 'in_progress'
+            session.commit()
+            self._update_progress(sync_id, {'status': 'in_progress'})
+
+            try:
+                # Collect all files to sync
+                all_files_to_sync = []
+
+                # Add directly selected files, fetching their metadata in batched round trips
+                if file_ids:
+                    metadata_by_id, metadata_errors = self.ingestion.get_files_metadata(user_id, file_ids)
+                    for file_id in dict.fromkeys(file_ids):
+                        if file_id in metadata_by_id:
+                            all_files_to_sync.append(metadata_by_id[file_id])
+                        elif file_id in metadata_errors:
+                            sync_record.files_failed += 1
+                            session.commit()
+                            self._record_result(sync_record, {
+                                'file_id': file_id,
+                                'name': 'unknown',
+                                'status': 'error',
+                                'error': metadata_errors[file_id]
+                            })
+
+                # Get all files from selected folders
+                if folder_ids:
+                    all_files_to_sync.extend(self.ingestion.get_files_in_folders(user_id, folder_ids))
+
+                self._update_progress(sync_id, {
+                    'files_total': len(all_files_to_sync) + sync_record.files_failed
+                })
+
+                # Download, persist and index files through the staged pipeline
+                results = self._run_pipeline(user_id, all_files_to_sync)
+                for _ in all_files_to_sync:
+                    try:
+                        result = results.get(timeout=self.result_timeout)
+                    except queue.Empty:
+                        raise TimeoutError(f"No file finished within {self.result_timeout:g}s; sync pipeline stalled")
+                    # A file that downloaded but failed to index counts as failed
+                    if result['status'] == 'success' and result.get('indexed', True):
+                        sync_record.files_processed += 1
+                    else:
+                        sync_record.files_failed += 1
+                    sync_record.stage_metrics = self._stage_metrics_dict(results.metrics)
+                    session.commit()
+                    self._record_result(sync_record, result)
+
+                sync_record.status = 'completed'
+                sync_record.completed_at = utc_now()
+                session.commit()
+
+            except Exception as e:
+                logger.error(f"Error during sync {sync_id}: {str(e)}")
+                session.rollback()
+                sync_record.status = 'failed'
+                sync_record.error_message = str(e)
+                sync_record.completed_at = utc_now()
+                session.commit()
+
+            self._update_progress(sync_id, {
+                'status': sync_record.status,
+                'error_message': sync_record.error_message,
+                'files_processed': sync_record.files_processed,
+                'files_failed': sync_record.files_failed,
+                'stage_metrics': sync_record.stage_metrics
+            })
+        finally:
+            session.close()
+
+    def _record_result(self, sync_record: GoogleDriveSync, result: Dict[str, Any]):
+        self._update_progress(sync_record.id, {
+            'files_processed': sync_record.files_processed,
+            'files_failed': sync_record.files_failed,
+            'stage_metrics': sync_record.stage_metrics
+        }, result=result)
+
+    @staticmethod
+    def _stage_metrics_dict(metrics: Dict[str, _StageMetrics]) -> Dict[str, Any]:
+        return {stage: metrics[stage].to_dict() for stage in SYNC_STAGES}
+
+    def _run_pipeline(self, user_id: str, files: List[Dict[str, Any]]) -> queue.Queue:
+        """Start the download -> persist -> index stages for a batch of files.
+
+        Returns a queue that yields exactly one result dict per file, in
+        completion order. The queue's `metrics` attribute holds live
+        per-stage counters.
+        """
+        results: queue.Queue = queue.Queue()
+        results.metrics = {
+            stage: _StageMetrics(self.stage_concurrency[stage]) for stage in SYNC_STAGES
+        }
+
+        handlers = {
+            'download': lambda item: self._download_stage(user_id, item),
+            'persist': lambda item: self._persist_stage(user_id, item),
+            'index': self._index_stage
+        }
+
+        # The source queue is unbounded (it only holds metadata); the queues
+        # between stages are bounded so a fast stage cannot run far ahead
+        inboxes = [queue.Queue()] + [queue.Queue(maxsize=self.stage_queue_size) for _ in SYNC_STAGES[1:]]
+        for position, stage in enumerate(SYNC_STAGES):
+            outbox = inboxes[position + 1] if position + 1 < len(SYNC_STAGES) else None
+            next_workers = self.stage_concurrency[SYNC_STAGES[position + 1]] if outbox is not None else 0
+            self._start_stage(stage, handlers[stage], inboxes[position], outbox,
+                              next_workers, results, results.metrics[stage])
+
+        for file_metadata in files:
+            inboxes[0].put({'metadata': file_metadata})
+        for _ in range(self.stage_concurrency['download']):
+            inboxes[0].put(_STOP)
+
+        return results
+
+    def _start_stage(self, stage: str, handler: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+                     inbox: queue.Queue, outbox: Optional[queue.Queue], next_workers: int,
+                     results: queue.Queue, metrics: _StageMetrics):
+        """Run `handler` over `inbox` on the stage's worker threads.
+
+        A handler returns the item to forward to the next stage, or a final
+        result dict under 'result' to finish the file early. When the last
+        worker of a stage exits it stops the workers of the next stage.
+        """
+        remaining = [metrics.concurrency]
+        remaining_lock = threading.Lock()
+
+        def error_result(item: Any, error: Exception) -> Dict[str, Any]:
+            file_metadata = item.get('metadata', {}) if isinstance(item, dict) else {}
+            logger.error(f"{stage} failed for file {file_metadata.get('name', 'unknown')}: {str(error)}")
+            return {
+                'file_id': file_metadata.get('id'),
+                'name': file_metadata.get('name', 'unknown'),
+                'status': 'error',
+                'stage': stage,
+                'error': str(error)
+            }
+
+        def process(item: Dict[str, Any]):
+            # Every item ends in exactly one forward or one result, whatever
+            # fails, so run_sync never waits on a file that was dropped
+            started = time.monotonic()
+            try:
+                forwarded = handler(item)
+                if not isinstance(forwarded, dict):
+                    raise TypeError(f"{stage} handler returned {type(forwarded).__name__}, expected a dict")
+            except Exception as e:
+                forwarded = {'result': error_result(item, e)}
+            try:
+                failed = 'result' in forwarded and forwarded['result']['status'] == 'error'
+                metrics.record(started, time.monotonic(), failed=failed)
+                if 'result' in forwarded or outbox is None:
+                    results.put(forwarded['result'])
+                else:
+                    outbox.put(forwarded)
+            except Exception as e:
+                results.put(error_result(item, e))
+
+        def loop():
+            try:
+                while True:
+                    item = inbox.get()
+                    if item is _STOP:
+                        break
+                    process(item)
+            finally:
+                # Stop the next stage even if this worker dies
+                with remaining_lock:
+                    remaining[0] -= 1
+                    last_worker = remaining[0] == 0
+                if last_worker and outbox is not None:
+                    for _ in range(next_workers):
+                        outbox.put(_STOP)
+
+        for i in range(metrics.concurrency):
+            threading.Thread(target=loop, name=f"gdrive-{stage}-{i}", daemon=True).start()
+
+    def _download_stage(self, user_id: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Stream the file straight into content-addressed permanent storage"""
+        file_metadata = item['metadata']
+        item['download'] = self.ingestion.download_to_storage(
+            user_id, file_metadata['id'], file_metadata, storage_dir=self.storage_dir
+        )
+        return item
+
+    def _persist_stage(self, user_id: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Create or update the GoogleDriveFile record for a downloaded file"""
+        file_metadata = item['metadata']
+        drive_modified_time = datetime.fromisoformat(
+            file_metadata.get('modifiedTime', '').replace('Z', '+00:00')
+        ) if file_metadata.get('modifiedTime') else None
+
+        session = self.db.get_session()
+        try:
+            # Check if file already exists in our database
+            drive_file = session.query(GoogleDriveFile).filter_by(
+                drive_file_id=file_metadata['id'],
+                user_id=user_id
+            ).first()
+
+            if drive_file is None:
+                drive_file = GoogleDriveFile(
+                    user_id=user_id,
+                    drive_file_id=file_metadata['id']
+                )
+                session.add(drive_file)
+            previous_path = drive_file.local_file_path
+            drive_file.drive_file_name = file_metadata['name']
+            drive_file.mime_type = file_metadata.get('mimeType')
+            drive_file.file_size = int(file_metadata.get('size', 0))
+            drive_file.drive_modified_time = drive_modified_time
+            drive_file.last_synced = utc_now()
+            drive_file.local_file_path = item['download']['local_path']
+            drive_file.web_view_link = file_metadata.get('webViewLink')
+            drive_file.index_status = 'pending'
+            session.commit()
+            item['drive_file_id'] = drive_file.id
+
+            # Drop the copy the row pointed to before (an older revision or legacy name)
+            try:
+                remove_unreferenced_copy(session, previous_path, drive_file.local_file_path, drive_file.id)
+            except Exception as e:
+                logger.warning(f"Could not remove replaced copy {previous_path}: {str(e)}")
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        return item
+
+    def _index_stage(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Index the file with the RAG pipeline and record the outcome"""
+        file_metadata = item['metadata']
+        index_error = None
+        try:
+            # Route by content checksum so each document lands on one shard
+            with self.index_connection(item['download'].get('md5_checksum')) as mgr:
+                success = rpc_value(mgr.upload_file(item['download']['local_path']))
+            if not success:
+                raise IndexUploadFailed("Failed to index file")
+        except Exception as e:
+            logger.error(f"Failed to index file {file_metadata['name']}: {str(e)}")
+            index_error = str(e)
+
+        session = self.db.get_session()
+        try:
+            drive_file = session.get(GoogleDriveFile, item['drive_file_id'])
+            drive_file.index_status = 'failed' if index_error else 'indexed'
+            drive_file.index_error = index_error
+            session.commit()
+        finally:
+            session.close()
+
+        result = {
+            'file_id': file_metadata['id'],
+            'name': file_metadata['name'],
+            'status': 'success',
+            'indexed': index_error is None
+        }
+        if index_error:
+            result['index_error'] = index_error
+        return {'result': result}
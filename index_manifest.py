@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+INDEXED = "indexed"
+FAILED = "failed"
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    return _file_digest(path, hashlib.sha256(), chunk_size)
+
+
+def file_md5(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Content MD5, the shard routing key for documents without an id"""
+    return _file_digest(path, hashlib.md5(), chunk_size)
+
+
+def _file_digest(path: str, hasher, chunk_size: int) -> str:
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class IndexManifest:
+    """Persistent map of file path -> content hash and index state.
+
+    A file is skipped when its size and mtime are unchanged since it was
+    indexed; if only the stat changed, the content hash decides. The manifest
+    is rewritten atomically on save; background indexing saves every few
+    results, so a crash loses at most those files' records and they are
+    indexed again. Entries for deleted files are pruned on each background scan.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = self._load()
+
+    def _load(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read index manifest {self.path}: {str(e)}")
+            return {}
+
+    def changed_digest(self, file_path: str) -> Optional[str]:
+        """Content hash if the file needs indexing, None if it is already indexed"""
+        stat = os.stat(file_path)
+        with self._lock:
+            entry = self.entries.get(file_path)
+        if entry and entry.get("status") == INDEXED \
+                and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            return None
+        digest = file_sha256(file_path)
+        if entry and entry.get("status") == INDEXED and entry.get("sha256") == digest:
+            # Touched but unchanged: refresh the stat so the next scan skips hashing
+            with self._lock:
+                entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            return None
+        return digest
+
+    def record(self, file_path: str, digest: str, indexed: bool, error: Optional[str] = None, save: bool = True):
+        """Record an index result. Re-recording an unchanged result is a no-op."""
+        try:
+            stat = os.stat(file_path)
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        except OSError:
+            size, mtime_ns = None, None
+        entry = {
+            "sha256": digest,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "status": INDEXED if indexed else FAILED,
+            "error": error,
+        }
+        with self._lock:
+            previous = self.entries.get(file_path)
+            if previous and all(previous.get(key) == value for key, value in entry.items()):
+                return
+            self.entries[file_path] = dict(entry, updated_at=time.time())
+            if save:
+                self._save()
+
+    def prune_missing(self) -> int:
+        """Drop entries for files that no longer exist; returns how many were removed"""
+        with self._lock:
+            missing = [file_path for file_path in self.entries if not os.path.exists(file_path)]
+            for file_path in missing:
+                del self.entries[file_path]
+        return len(missing)
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not write index manifest {self.path}: {str(e)}")
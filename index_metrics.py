@@ -0,0 +1,129 @@
+import functools
+import os
+import resource
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Optional
+
+# Bucket upper bounds in seconds, roughly log-spaced from 1ms to 2 minutes
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, float("inf"),
+)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; percentiles resolve to bucket upper bounds"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.total = 0
+        self.sum_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.total += 1
+        self.sum_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.total:
+            return None
+        rank = pct / 100.0 * self.total
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                # The overflow bucket has no bound; report the worst observed latency
+                return self.max_seconds if bound == float("inf") else bound
+        return self.max_seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.total,
+            "mean_seconds": round(self.sum_seconds / self.total, 6) if self.total else None,
+            "max_seconds": round(self.max_seconds, 6),
+            "p50_seconds": self.percentile(50),
+            "p95_seconds": self.percentile(95),
+            "p99_seconds": self.percentile(99),
+            "buckets": {
+                ("+Inf" if bound == float("inf") else str(bound)): count
+                for bound, count in zip(self.buckets, self.counts)
+            },
+        }
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ValueError, OSError):
+        return None
+
+
+class IndexServerMetrics:
+    """Per-method call counts, in-flight calls, errors and latency histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods: Dict[str, Dict[str, Any]] = {}
+        self.started_at = time.time()
+
+    def _method(self, name: str) -> Dict[str, Any]:
+        method = self._methods.get(name)
+        if method is None:
+            method = {"calls": 0, "in_flight": 0, "errors": 0, "latency": LatencyHistogram()}
+            self._methods[name] = method
+        return method
+
+    def timed(self, name: str) -> Callable:
+        """Decorator recording a call to `name`; exceptions count as errors"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self._lock:
+                    method = self._method(name)
+                    method["calls"] += 1
+                    method["in_flight"] += 1
+                started = time.perf_counter()
+                failed = True
+                try:
+                    result = fn(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    elapsed = time.perf_counter() - started
+                    with self._lock:
+                        method["in_flight"] -= 1
+                        method["errors"] += int(failed)
+                        method["latency"].observe(elapsed)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            methods = {
+                name: {
+                    "calls": m["calls"],
+                    "in_flight": m["in_flight"],
+                    "errors": m["errors"],
+                    "latency": m["latency"].snapshot(),
+                }
+                for name, m in self._methods.items()
+            }
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "rss_bytes": current_rss_bytes(),
+            "methods": methods,
+        }
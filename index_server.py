@@ -1,8 +1,15 @@
 import sys
 import threading
+import time
 import os
 from multiprocessing.managers import BaseManager
 from rag_pipeline import RAGPipeline
+from ingestion_queue import IngestionJobQueue
+from query_cache import QueryResultCache
+from index_metrics import IndexServerMetrics
+from upload_sessions import UploadSessionStore
+from index_shards import HashRing, parse_shard_endpoints, shard_name
+from index_manifest import file_md5
 
 # Server configuration
 INDEX_SERVER_HOST = os.getenv("INDEX_SERVER_HOST", "127.0.0.1")
@@ -59,6 +66,40 @@ INDEX_SERVER_KEY = _load_index_server_key()
 rag_pipeline = None
 pipeline_lock = threading.Lock()
 
+# Per-RPC call counts and latency histograms, reported by get_metrics()
+metrics = IndexServerMetrics()
+
+# Opt-in: build the pipeline at boot instead of on the first request
+WARM_START = os.getenv("INDEX_SERVER_WARM_START", "false").lower() in ("1", "true", "yes")
+WARM_START_RETRY_SECONDS = float(os.getenv("INDEX_SERVER_WARM_START_RETRY", "10"))
+
+# Sharding: INDEX_SERVER_SHARDS lists every shard, exactly as Flask is given it.
+# This server's name on the ring is INDEX_SHARD_ID (default host:port); it keeps
+# its own LlamaCloud pipeline and background-indexes only the files it owns.
+def _load_shard_config():
+    endpoints = os.getenv("INDEX_SERVER_SHARDS")
+    names = [shard_name(e) for e in parse_shard_endpoints(endpoints)] if endpoints else []
+    if len(names) < 2:
+        return None, None
+    shard_id = os.getenv("INDEX_SHARD_ID", shard_name((INDEX_SERVER_HOST, INDEX_SERVER_PORT)))
+    if shard_id not in names:
+        raise RuntimeError(f"INDEX_SHARD_ID {shard_id} is not one of INDEX_SERVER_SHARDS ({', '.join(names)})")
+    return shard_id, HashRing(names)
+
+INDEX_SHARD_ID, shard_ring = _load_shard_config()
+
+# Uploads and background indexing record into the same manifest, so a restart
+# only re-indexes files that are new, changed or failed
+INDEX_MANIFEST_FILE = os.getenv("INDEX_MANIFEST_FILE", f"index_manifest_{INDEX_SERVER_PORT}.json")
+
+def owns_file(path: str) -> bool:
+    """Whether the hash ring routes this file to this shard. Flask routes every
+    document by its content MD5 too, so uploads and background indexing agree."""
+    return shard_ring is None or shard_ring.get(file_md5(path)) == INDEX_SHARD_ID
+
+# "lazy" (initializes on first use), "warming", "ready" or "failed"
+readiness = {"state": "lazy", "warm_start": False, "error": None, "started_at": None, "ready_at": None}
+
 def ensure_pipeline():
     """Lazy initialization of RAG pipeline on first use"""
     global rag_pipeline
@@ -69,7 +110,7 @@ def ensure_pipeline():
             if rag_pipeline is None:
                 print("🚀 Initializing RAG Pipeline on first use...")
                 try:
-                    rag_pipeline = RAGPipeline()
+                    rag_pipeline = RAGPipeline(shard_id=INDEX_SHARD_ID, manifest_path=INDEX_MANIFEST_FILE)
                     rag_pipeline.initialize_index()
                     print("✅ RAG Pipeline ready")
                     return True
@@ -78,26 +119,240 @@ def ensure_pipeline():
                     return False
     return True
 
+def warm_start(max_attempts: int = 0) -> bool:
+    """Initialize the pipeline, connect the index and load the embedding model.
+    Retries every WARM_START_RETRY_SECONDS until it succeeds (or max_attempts is reached).
+    """
+    readiness.update(state="warming", warm_start=True, error=None, started_at=time.time())
+    print("🔥 Warm start: initializing RAG pipeline...")
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            if ensure_pipeline() and rag_pipeline.warm_up():
+                readiness.update(state="ready", error=None, ready_at=time.time())
+                print(f"✅ Warm start complete in {readiness['ready_at'] - readiness['started_at']:.1f}s")
+                return True
+            error = "Pipeline initialization failed"
+        except Exception as e:
+            error = str(e)
+        print(f"❌ Warm start attempt {attempts} failed: {error}")
+        if max_attempts and attempts >= max_attempts:
+            readiness.update(state="failed", error=error)
+            return False
+        readiness.update(error=error)
+        time.sleep(WARM_START_RETRY_SECONDS)
+
+def ready() -> dict:
+    """Readiness probe. In lazy mode the server is always ready to accept work;
+    in warm-start mode it is ready once the pipeline is hot."""
+    state = dict(readiness)
+    state["ready"] = state["state"] in ("lazy", "ready")
+    state["pipeline_initialized"] = rag_pipeline is not None
+    return state
+
+class UploadCoalescer:
+    """Groups concurrent upload_file calls into batched pipeline runs.
+
+    Each RPC runs on its own server thread and blocks in submit(). A single
+    flusher thread collects paths for up to `window_seconds` (or until
+    `max_batch_size` is reached) and hands them to `process_batch`, which
+    returns a success flag per path. Batches run one at a time, so the local
+    ingestion pipeline is never used concurrently.
+    """
+
+    def __init__(self, process_batch, window_seconds: float = 0.05, max_batch_size: int = 16):
+        self.process_batch = process_batch
+        self.window_seconds = window_seconds
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, file_path: str) -> bool:
+        """Queue a path and block until its batch has been processed"""
+        request = {"path": file_path, "done": threading.Event(), "result": False}
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="upload-coalescer", daemon=True)
+                self._thread.start()
+            self._pending.append(request)
+            self._cond.notify_all()
+        request["done"].wait()
+        return request["result"]
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _next_batch(self) -> list:
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending)
+            # Give concurrent callers a short window to join this batch
+            deadline = time.monotonic() + self.window_seconds
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            paths = list(dict.fromkeys(request["path"] for request in batch))
+            try:
+                print(f"📦 Processing upload batch of {len(paths)} file(s)")
+                results = self.process_batch(paths)
+            except Exception as e:
+                print(f"❌ Upload batch failed: {str(e)}")
+                results = {}
+            for request in batch:
+                request["result"] = bool(results.get(request["path"], False))
+                request["done"].set()
+
+# Query results keyed by normalized text and index generation
+query_cache = QueryResultCache(
+    max_entries=int(os.getenv("INDEX_QUERY_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("INDEX_QUERY_CACHE_TTL", "600"))
+)
+
+def _process_upload_batch(paths: list) -> dict:
+    results = rag_pipeline.handle_file_uploads(paths)
+    if any(results.values()):
+        query_cache.bump_generation()
+    return results
+
+upload_coalescer = UploadCoalescer(
+    _process_upload_batch,
+    window_seconds=float(os.getenv("INDEX_UPLOAD_BATCH_WINDOW_MS", "50")) / 1000,
+    max_batch_size=int(os.getenv("INDEX_UPLOAD_BATCH_MAX", "16"))
+)
+
+@metrics.timed("upload_file")
 def upload_file(file_path: str) -> bool:
-    """Upload and process a file through the RAG pipeline"""
+    """Upload and process a file through the RAG pipeline.
+    Concurrent calls are coalesced into a single batched upsert and pipeline run.
+    """
     if not ensure_pipeline():
         return False
-    return rag_pipeline.handle_file_upload(file_path)
+    return upload_coalescer.submit(file_path)
+
+# Non-blocking ingestion: jobs are journaled to disk and drained by worker
+# threads that feed upload_file (and therefore the batching coalescer)
+ingestion_queue = IngestionJobQueue(
+    upload_file,
+    state_path=os.getenv("INDEX_JOB_STATE_FILE", f"index_jobs_{INDEX_SERVER_PORT}.json"),
+    num_workers=int(os.getenv("INDEX_JOB_WORKERS", "4")),
+    max_depth=int(os.getenv("INDEX_JOB_QUEUE_SIZE", "100")),
+    enqueue_timeout=float(os.getenv("INDEX_JOB_ENQUEUE_TIMEOUT", "5"))
+)
+
+@metrics.timed("enqueue_upload")
+def enqueue_upload(file_path: str) -> str:
+    """Queue a file for indexing and return its job id without waiting.
+    Raises IngestionQueueFull when the queue stays full past the enqueue timeout.
+    """
+    ingestion_queue.start()
+    return ingestion_queue.enqueue(file_path)
+
+@metrics.timed("get_job")
+def get_job(job_id: str):
+    """Get a single ingestion job, or None if unknown"""
+    return ingestion_queue.get_job(job_id)
+
+@metrics.timed("list_jobs")
+def list_jobs(status: str = None, limit: int = 100) -> list:
+    """List recent ingestion jobs, newest first"""
+    return ingestion_queue.list_jobs(status=status, limit=limit)
+
+# Byte-streamed uploads land in content-addressed storage on this server,
+# so Flask and the index server do not need a shared filesystem
+upload_store = UploadSessionStore(
+    storage_dir=os.getenv("INDEX_UPLOAD_STORE", os.path.join("index_uploads", str(INDEX_SERVER_PORT))),
+    session_ttl=float(os.getenv("INDEX_UPLOAD_SESSION_TTL", "3600"))
+)
+
+@metrics.timed("begin_upload")
+def begin_upload(filename: str, size: int = None, sha256: str = None) -> dict:
+    """Start a chunked upload. If `sha256` is given and that content is already
+    stored and indexed, no session is opened and the client can skip sending
+    any bytes."""
+    if sha256 and upload_store.is_indexed(sha256):
+        existing = upload_store.find(sha256, filename)
+        if existing:
+            return {"upload_id": None, "deduplicated": True, "path": existing, "sha256": sha256.lower()}
+    return {"upload_id": upload_store.begin(filename, size), "deduplicated": False}
 
+@metrics.timed("write_chunk")
+def write_chunk(upload_id: str, offset: int, data: bytes) -> int:
+    """Append a chunk; returns total bytes received so far"""
+    return upload_store.write(upload_id, offset, data)
+
+@metrics.timed("commit_upload")
+def commit_upload(upload_id: str, sha256: str = None) -> dict:
+    """Verify the content hash, store the file and index it.
+    Content that was already indexed successfully is not indexed again."""
+    path, digest, _ = upload_store.commit(upload_id, sha256)
+    # Serializes concurrent commits of the same content: the second one waits
+    # and then dedupes, or retries if the first one's indexing failed
+    with upload_store.content_lock(digest):
+        if upload_store.is_indexed(digest):
+            return {"status": "success", "path": path, "sha256": digest, "deduplicated": True}
+        if not upload_file(path):
+            # The stored copy is kept (other sessions may have committed against
+            # it); without the indexed marker a retry indexes it again
+            return {"status": "failed", "path": path, "sha256": digest, "deduplicated": False}
+        upload_store.mark_indexed(digest)
+    return {"status": "success", "path": path, "sha256": digest, "deduplicated": False}
+
+@metrics.timed("abort_upload")
+def abort_upload(upload_id: str) -> bool:
+    """Discard an in-progress upload"""
+    return upload_store.abort(upload_id)
+
+@metrics.timed("query")
 def query(query_text: str) -> str:
     """Query the index through the RAG pipeline"""
     if not ensure_pipeline():
         return "Failed to initialize pipeline"
-    return rag_pipeline.query_index(query_text)
+    hit, cached = query_cache.get(query_text)
+    if hit:
+        return cached
+    generation = query_cache.generation
+    started = time.perf_counter()
+    response = rag_pipeline.query_index(query_text)
+    # query_index reports failures as text; only cache real answers
+    if not response.startswith(("Error querying index", "Failed to initialize")):
+        query_cache.put(query_text, response, time.perf_counter() - started, generation=generation)
+    return response
 
+@metrics.timed("retrieve")
+def retrieve(query_text: str, top_k: int = 5, content_sha256: str = None) -> list:
+    """Top-k retrieved chunks with scores, so a sharded client can merge results.
+    `content_sha256` scopes retrieval to one document's nodes.
+    """
+    if not ensure_pipeline():
+        return []
+    return rag_pipeline.retrieve(query_text, top_k, content_sha256=content_sha256)
+
+@metrics.timed("start_background_indexing")
 def start_background_indexing() -> bool:
     """Start background indexing of existing documents"""
     if not ensure_pipeline():
         return False
     
     print("🔄 Starting background indexing...")
+    # Files go through upload_file so parallel workers share batched pipeline
+    # runs and invalidate the query cache like any other upload
     threading.Thread(
         target=rag_pipeline.background_index_existing_documents, 
+        kwargs={
+            "index_file": upload_file,
+            "owns": owns_file
+        },
         daemon=True
     ).start()
     return True
@@ -105,36 +360,77 @@ def start_background_indexing() -> bool:
 def get_status() -> dict:
     """Get pipeline status"""
     if rag_pipeline is None:
-        return {
+        status = {
             "initialized": False, 
             "connected": False,
             "message": "Pipeline not yet initialized - will initialize on first use"
         }
-    return rag_pipeline.get_status()
+    else:
+        status = rag_pipeline.get_status()
+    status["ingestion_queue"] = ingestion_queue.stats()
+    status["query_cache"] = query_cache.stats()
+    return status
+
+def get_metrics() -> dict:
+    """Call counts, in-flight calls and latency percentiles per RPC, plus
+    ingest throughput, queue depth, cache stats and process RSS"""
+    snapshot = metrics.snapshot()
+    snapshot["ingest"] = rag_pipeline.get_ingest_stats() if rag_pipeline is not None else None
+    snapshot["ingestion_queue"] = ingestion_queue.stats()
+    snapshot["upload_batch_pending"] = upload_coalescer.pending_count()
+    snapshot["query_cache"] = query_cache.stats()
+    snapshot["active_uploads"] = upload_store.active_count()
+    return snapshot
 
 if __name__ == "__main__":
     try:
         print("🌟 LlamaCloud Index Server")
         print("=" * 50)
-        print("📋 Server starting in lazy-load mode")
-        print("💡 Pipeline will initialize on first request")
+        if WARM_START:
+            print("📋 Server starting in warm-start mode")
+            print("💡 Pipeline initializes in the background; ready() reports when it is hot")
+        else:
+            print("📋 Server starting in lazy-load mode")
+            print("💡 Pipeline will initialize on first request")
         
         # Setup and start server immediately - no initialization
         print(f"🚀 Starting server on {INDEX_SERVER_HOST}:{INDEX_SERVER_PORT}")
         manager = BaseManager((INDEX_SERVER_HOST, INDEX_SERVER_PORT), INDEX_SERVER_KEY)
         manager.register("upload_file", upload_file)
         manager.register("query", query)
+        manager.register("retrieve", retrieve)
         manager.register("start_background_indexing", start_background_indexing)
         manager.register("get_status", get_status)
+        manager.register("enqueue_upload", enqueue_upload)
+        manager.register("get_job", get_job)
+        manager.register("list_jobs", list_jobs)
+        manager.register("get_metrics", get_metrics)
+        manager.register("ready", ready)
+        manager.register("begin_upload", begin_upload)
+        manager.register("write_chunk", write_chunk)
+        manager.register("commit_upload", commit_upload)
+        manager.register("abort_upload", abort_upload)
+        
+        # Resume any jobs left over from a previous run
+        ingestion_queue.start()
+
+        if WARM_START:
+            threading.Thread(target=warm_start, name="warm-start", daemon=True).start()
         
         server = manager.get_server()
         print("✅ Server ready!")
         print("📋 Available methods:")
         print("   - upload_file(file_path)")
         print("   - query(query_text)")
+        print("   - retrieve(query_text, top_k)")
         print("   - start_background_indexing()")
         print("   - get_status()")
-        print("🔧 Pipeline will initialize automatically on first use")
+        print("   - enqueue_upload(file_path) / get_job(job_id) / list_jobs()")
+        print("   - get_metrics()")
+        print("   - ready()")
+        print("   - begin_upload(filename, size, sha256) / write_chunk(upload_id, offset, data) / commit_upload(upload_id, sha256)")
+        if not WARM_START:
+            print("🔧 Pipeline will initialize automatically on first use")
         
         server.serve_forever()
         
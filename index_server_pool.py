@@ -0,0 +1,146 @@
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing.managers import BaseProxy
+from typing import Any, Callable, Dict, List, Optional
+
+# Errors that mean the connection (not the request) is broken
+CONNECTION_ERRORS = (ConnectionError, EOFError, OSError, TimeoutError)
+
+
+def rpc_value(result):
+    """Unwrap a BaseManager proxy into a plain value (dicts, lists, ids, bools).
+    A proxy is always truthy, so check results only after unwrapping them."""
+    if isinstance(result, BaseProxy):
+        return result._getvalue()
+    return result
+
+
+class IndexServerPool:
+    """Pool of index server connections checked out one thread at a time.
+
+    BaseManager proxies hold per-connection state, so a connection is never
+    used by two threads at once. Idle connections are health-checked before
+    reuse once they have been idle for `health_check_interval` seconds;
+    connections that fail a call are discarded and replaced on the next
+    checkout. At most `max_size` connections exist; further callers wait up
+    to `acquire_timeout` seconds for one to be returned.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        max_size: int = 8,
+        acquire_timeout: float = 30.0,
+        health_check_interval: float = 30.0,
+    ):
+        self.connect = connect
+        self.max_size = max(1, max_size)
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self._idle: List[tuple] = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self.connects = 0
+        self.discarded = 0
+
+    def acquire(self, timeout: Optional[float] = None):
+        """Check out a healthy connection, connecting a new one if the pool has room"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No index server connection available after {timeout}s")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    conn, idle_since = None, None
+                    # Reserve the slot before connecting outside the lock
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self.connect()
+                except BaseException:
+                    self._release_slot()
+                    raise
+                with self._cond:
+                    self.connects += 1
+                return conn
+
+            if time.monotonic() - idle_since < self.health_check_interval or self._is_healthy(conn):
+                return conn
+            self.discard(conn)
+
+    def release(self, conn):
+        """Return a connection to the pool"""
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def discard(self, conn):
+        """Drop a broken connection and free its slot"""
+        with self._cond:
+            self.discarded += 1
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _is_healthy(conn) -> bool:
+        # Cheap round trip that does not create objects on the server
+        try:
+            conn._number_of_objects()
+            return True
+        except Exception:
+            return False
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a checked-out connection.
+        Connection-level errors discard it; anything else returns it to the pool.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        except CONNECTION_ERRORS:
+            self.discard(conn)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def warm(self) -> bool:
+        """Open one connection ahead of the first request"""
+        try:
+            self.release(self.acquire())
+            return True
+        except CONNECTION_ERRORS:
+            return False
+
+    def reset(self):
+        """Forget every connection (pooled ones are simply dropped)"""
+        with self._cond:
+            self._size -= len(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max_size": self.max_size,
+                "connects": self.connects,
+                "discarded": self.discarded,
+            }
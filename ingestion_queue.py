@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+
+JOB_STATUSES = ('queued', 'running', 'completed', 'failed')
+TERMINAL_JOB_STATUSES = ('completed', 'failed')
+
+
+class IngestionQueueFull(Exception):
+    """Raised by enqueue when the queue stays full past the enqueue timeout"""
+
+
+class IngestionJobQueue:
+    """Bounded, persistent work queue for index uploads.
+
+    Jobs are journaled to `state_path` (JSON, replaced atomically on every
+    state change) so queued and interrupted jobs are picked up again when the
+    index server restarts. `process(path) -> bool` runs on `num_workers`
+    threads; enqueue blocks for up to `enqueue_timeout` seconds when
+    `max_depth` jobs are waiting and then raises IngestionQueueFull.
+    """
+
+    MAX_FINISHED_JOBS = 500
+
+    def __init__(
+        self,
+        process: Callable[[str], bool],
+        state_path: Optional[str] = None,
+        num_workers: int = 4,
+        max_depth: int = 100,
+        enqueue_timeout: float = 5.0,
+    ):
+        self.process = process
+        self.state_path = state_path
+        self.num_workers = max(1, num_workers)
+        self.max_depth = max(1, max_depth)
+        self.enqueue_timeout = enqueue_timeout
+        self._pending: deque = deque()
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """Reload persisted jobs and start the worker threads (idempotent)"""
+        with self._lock:
+            if self._threads:
+                return self
+            pending = self._load_state()
+            # Resumed jobs bypass the depth limit; they were accepted before the restart
+            self._pending.extend(pending)
+            # Registered before the lock is released so a concurrent start() returns early
+            self._threads = [
+                threading.Thread(target=self._worker, name=f"ingest-worker-{i}", daemon=True)
+                for i in range(self.num_workers)
+            ]
+        if pending:
+            print(f"🔁 Resuming {len(pending)} ingestion job(s)")
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def enqueue(self, path: str) -> str:
+        """Queue a file for indexing and return its job id"""
+        job = {
+            'id': uuid.uuid4().hex,
+            'path': path,
+            'status': 'queued',
+            'error': None,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+        }
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._pending) < self.max_depth, timeout=self.enqueue_timeout):
+                raise IngestionQueueFull(f"Ingestion queue is full ({self.max_depth} jobs waiting)")
+            self._jobs[job['id']] = job
+            self._pending.append(job['id'])
+            self._persist()
+            self._cond.notify_all()
+        return job['id']
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """Most recent jobs first, optionally filtered by status"""
+        with self._lock:
+            jobs = [dict(job) for job in reversed(self._jobs.values()) if status is None or job['status'] == status]
+        return jobs[:limit]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = {s: 0 for s in JOB_STATUSES}
+            for job in self._jobs.values():
+                counts[job['status']] += 1
+            return {
+                'depth': len(self._pending),
+                'capacity': self.max_depth,
+                'workers': self.num_workers,
+                'jobs': counts,
+            }
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                job_id = self._pending.popleft()
+                # Wake producers blocked on a full queue
+                self._cond.notify_all()
+            if not self._update(job_id, status='running', started_at=time.time()):
+                continue
+            path = self.get_job(job_id)['path']
+            try:
+                success = self.process(path)
+                error = None if success else 'Failed to index file'
+            except Exception as e:
+                error = str(e)
+            self._update(
+                job_id,
+                status='failed' if error else 'completed',
+                error=error,
+                finished_at=time.time(),
+            )
+
+    def _update(self, job_id: str, **changes) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.update(changes)
+            if job['status'] in TERMINAL_JOB_STATUSES:
+                self._trim_finished()
+            self._persist()
+            return True
+
+    def _trim_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in TERMINAL_JOB_STATUSES]
+        for job_id in finished[:max(0, len(finished) - self.MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _persist(self):
+        """Write the job table atomically; caller holds the lock"""
+        if not self.state_path:
+            return
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(list(self._jobs.values()), f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"⚠️ Could not persist ingestion jobs: {str(e)}")
+
+    def _load_state(self) -> List[str]:
+        """Load the job table; returns ids to requeue. Caller holds the lock"""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return []
+        try:
+            with open(self.state_path) as f:
+                jobs = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not load ingestion jobs: {str(e)}")
+            return []
+        pending = []
+        for job in jobs:
+            if job.get('status') not in TERMINAL_JOB_STATUSES:
+                # Jobs that were running when the server stopped start over
+                job.update(status='queued', started_at=None)
+                pending.append(job['id'])
+            self._jobs[job['id']] = job
+        self._persist()
+        return pending
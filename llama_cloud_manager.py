@@ -3,6 +3,7 @@ from llama_cloud_services import LlamaExtract
 import os
 from dotenv import load_dotenv
 import requests
+from index_shards import index_pipeline_name
 
 # Load environment variables
 load_dotenv()
@@ -16,7 +17,7 @@ class LlamaCloudManager:
     def __init__(self):
         # Initialize LlamaCloud Index for document indexing
         self.index = LlamaCloudIndex(
-            name="agreed-urial-2025-04-15",
+            name=index_pipeline_name(),
             project_name="Default",
             organization_id=os.getenv('LLAMA_CLOUD_ORG_ID'),
             api_key=os.getenv('LLAMA_CLOUD_API_KEY')
@@ -0,0 +1,83 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query_text: str) -> str:
+    """Case- and whitespace-insensitive cache key; trailing ?/./! are ignored"""
+    return _WHITESPACE.sub(" ", query_text).strip().rstrip("?.!").strip().lower()
+
+
+class QueryResultCache:
+    """Bounded LRU/TTL cache for query results.
+
+    Keys combine the normalized query text with an index generation counter.
+    bump_generation() is called after every successful ingest, which makes
+    all earlier entries unreachable (they are dropped right away).
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 600.0):
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved_seconds = 0.0
+
+    def get(self, query_text: str) -> Tuple[bool, Optional[Any]]:
+        """Return (hit, value) for the current generation"""
+        key = (self.generation, normalize_query(query_text))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, compute_seconds, value = entry
+                if time.monotonic() - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self.latency_saved_seconds += compute_seconds
+                    return True, value
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, query_text: str, value: Any, compute_seconds: float = 0.0, generation: Optional[int] = None):
+        """Store a result computed against `generation` (defaults to the current one).
+        Results computed before an ingest finished are discarded.
+        """
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            key = (self.generation, normalize_query(query_text))
+            self._entries[key] = (time.monotonic(), compute_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def bump_generation(self) -> int:
+        """Invalidate every cached result after the index changed"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            return self.generation
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "latency_saved_seconds": round(self.latency_saved_seconds, 3),
+            }
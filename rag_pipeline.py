@@ -1,4 +1,9 @@
 import os
+import time
+import threading
+from urllib.parse import quote_plus
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
 from dotenv import load_dotenv
 from llama_cloud.client import LlamaCloud
 from llama_index.indices.managed.llama_cloud import LlamaCloudIndex
@@ -7,22 +12,89 @@ from llama_index.core.ingestion import IngestionPipeline
 from llama_index.core.storage.docstore import SimpleDocumentStore
 from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core import SimpleDirectoryReader
+from llama_index.core.readers.file.base import default_file_metadata_func
+from llama_index.core.vector_stores import MetadataFilter, MetadataFilters
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from embedding_workers import DEFAULT_EMBED_MODEL, PooledEmbedding
+from index_manifest import IndexManifest, file_sha256
+# Pipeline naming lives in the lightweight index_shards module so LlamaCloudManager
+# can use it without importing the embedding and ingestion stack
+from index_shards import DEFAULT_PIPELINE_NAME, index_pipeline_name  # noqa: F401
+
+INDEXABLE_EXTENSIONS = ('.pdf', '.txt', '.doc', '.docx')
+
+# Background indexing writes the manifest to disk after this many finished files
+MANIFEST_SAVE_EVERY = int(os.getenv("INDEX_MANIFEST_SAVE_EVERY", "50"))
+
+DEFAULT_PIPELINE_ID = "975599b4-c782-4a6e-a691-a729ea4eb450"
+
+# Metadata every ingested document (and so every node) is tagged with, so
+# retrieval can be scoped to one document instead of the whole shared index
+DOCUMENT_ID_KEY = "document_id"
+CONTENT_HASH_KEY = "content_sha256"
+
+def document_metadata(file_path: str, content_sha256: Optional[str] = None) -> dict:
+    """Reader metadata for a file plus its document id (file name) and content hash"""
+    metadata = default_file_metadata_func(file_path)
+    metadata[DOCUMENT_ID_KEY] = os.path.basename(file_path)
+    metadata[CONTENT_HASH_KEY] = content_sha256 or file_sha256(file_path)
+    return metadata
+
+def document_filters(content_sha256: str) -> MetadataFilters:
+    """Retrieval filter matching only the nodes of one document's content"""
+    return MetadataFilters(filters=[MetadataFilter(key=CONTENT_HASH_KEY, value=content_sha256)])
+
+# File metadata kept out of embeddings and LLM context (as SimpleDirectoryReader
+# does for its own keys); the identity tags are only for filtering
+_HIDDEN_METADATA_KEYS = ("file_name", "file_type", "file_size", "creation_date",
+                         "last_modified_date", "last_accessed_date", DOCUMENT_ID_KEY, CONTENT_HASH_KEY)
+
+def _exclude_tag_metadata(documents: List[Document]):
+    for document in documents:
+        if isinstance(document, Document):
+            for keys in (document.excluded_embed_metadata_keys, document.excluded_llm_metadata_keys):
+                keys.extend(k for k in _HIDDEN_METADATA_KEYS if k not in keys)
+
+def tag_documents(documents: List[Document], file_path: str, content_sha256: Optional[str] = None) -> List[Document]:
+    """Give documents parsed from one file elsewhere (e.g. by LlamaParse) the ids and
+    metadata SimpleDirectoryReader would, so they upsert and filter the same way"""
+    metadata = document_metadata(file_path, content_sha256)
+    for i, document in enumerate(documents):
+        document.id_ = str(file_path) if len(documents) == 1 else f"{file_path}_part_{i}"
+        document.metadata.update(metadata)
+    _exclude_tag_metadata(documents)
+    return documents
+
+def build_embed_model():
+    """Embedding model for the local pipeline.
+    INDEX_EMBED_WORKERS > 1 spreads embedding across that many worker processes;
+    otherwise the model runs in-process.
+    """
+    workers = int(os.getenv("INDEX_EMBED_WORKERS", "0"))
+    if workers > 1:
+        return PooledEmbedding(
+            model_name=DEFAULT_EMBED_MODEL,
+            worker_processes=workers,
+            worker_batch_size=int(os.getenv("INDEX_EMBED_BATCH_SIZE", "32"))
+        )
+    return HuggingFaceEmbedding(model_name=DEFAULT_EMBED_MODEL)
 
 class RAGPipeline:
-    def __init__(self):
+    def __init__(self, shard_id: Optional[str] = None, manifest_path: Optional[str] = None):
         # Load environment variables from .env file
         load_dotenv()
         
-        self.pipeline_id = "975599b4-c782-4a6e-a691-a729ea4eb450"
-        self.pipeline_name = "agreed-urial-2025-04-15"
+        # A sharded index server writes to and reads from its own pipeline
+        self.shard_id = shard_id
+        self.pipeline_name = index_pipeline_name(shard_id)
+        self.pipeline_id = None if shard_id else DEFAULT_PIPELINE_ID
         self.project_id = "226d42fe-57bd-4b61-a14e-0776cd6b5b8a"
         self.project_name = "Default"
         
         self.pipeline = IngestionPipeline(
             transformations=[
                 SentenceSplitter(),
-                HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5"),
+                build_embed_model(),
             ],
             docstore=SimpleDocumentStore(),
         )
@@ -35,51 +107,182 @@ class RAGPipeline:
         self.index = None
         self.initialized = False
 
+        # Ingest counters for the index server's metrics
+        self.documents_ingested = 0
+        self.nodes_ingested = 0
+        self.pipeline_seconds = 0.0
+
+        # The local pipeline's docstore is not thread-safe; loading files can run
+        # in parallel but ingestion is serialized
+        self._ingest_lock = threading.Lock()
+
+        # Index state of every file this pipeline ingested, shared by uploads and
+        # background indexing so restarts skip files that are already indexed
+        self.manifest = IndexManifest(manifest_path) if manifest_path else None
+
+        # Progress of the current/last background indexing run
+        self._progress_lock = threading.Lock()
+        self.background_progress = {"state": "idle"}
+
     def initialize_index(self):
         """Initialize the LlamaCloud index"""
         try:
-            self.index = LlamaCloudIndex(
+            index_args = dict(
                 name=self.pipeline_name,
                 project_name=self.project_name,
                 organization_id=self.project_id,
                 api_key=os.environ.get("LLAMA_CLOUD_API_KEY")
             )
+            if self.shard_id:
+                # Shard pipelines are created on first start (create_index upserts)
+                self.index = LlamaCloudIndex.create_index(**index_args)
+            else:
+                self.index = LlamaCloudIndex(**index_args)
+            # Upserts go to the pipeline the index actually resolved to
+            pipeline = getattr(self.index, "pipeline", None)
+            self.pipeline_id = getattr(pipeline, "id", None) or self.pipeline_id
             self.initialized = True
             return True
         except Exception as e:
             print(f"Error initializing index: {str(e)}")
             return False
 
+    def warm_up(self) -> bool:
+        """Connect the index and run one embedding so the first request is not cold"""
+        if not self.initialized and not self.initialize_index():
+            return False
+        # Loads model weights (or starts the embedding worker pool)
+        self.pipeline.transformations[-1].get_text_embedding("warm up")
+        return True
+
     def handle_file_upload(self, file_path: str) -> bool:
         """Process and upload a file to the index"""
+        return self.handle_file_uploads([file_path]).get(file_path, False)
+
+    def handle_file_uploads(self, file_paths: List[str]) -> Dict[str, bool]:
+        """Process and upload several files with one cloud upsert and one local pipeline run.
+
+        Returns a success flag per path. If the batched upsert fails, each file
+        is retried on its own so one bad document does not fail the others.
+        """
+        results = {file_path: False for file_path in file_paths}
         try:
             if not self.initialized:
                 if not self.initialize_index():
-                    return False
+                    return results
 
-            # Load the document
-            documents = SimpleDirectoryReader(
-                os.path.dirname(file_path),
-                filename_as_id=True
-            ).load_data()
+            # Load each document separately so failures map back to their file
+            documents_by_path = {}
+            for file_path in results:
+                try:
+                    documents_by_path[file_path] = SimpleDirectoryReader(
+                        input_files=[file_path],
+                        filename_as_id=True,
+                        file_metadata=document_metadata
+                    ).load_data()
+                    _exclude_tag_metadata(documents_by_path[file_path])
+                except Exception as e:
+                    print(f"Error loading {file_path}: {str(e)}")
 
-            # Convert to cloud documents
-            llama_cloud_documents = [d.to_cloud_document() for d in documents]
+            if not documents_by_path:
+                return results
 
-            # Upload to pipeline
-            self.client.pipelines.upsert_batch_pipeline_documents(
-                self.pipeline_id, request=llama_cloud_documents
-            )
+            try:
+                self._ingest_documents([d for docs in documents_by_path.values() for d in docs])
+                for file_path in documents_by_path:
+                    results[file_path] = True
+            except Exception as e:
+                if len(documents_by_path) == 1:
+                    raise
+                print(f"Batched upload failed ({str(e)}), retrying files individually")
+                for file_path, documents in documents_by_path.items():
+                    try:
+                        self._ingest_documents(documents)
+                        results[file_path] = True
+                    except Exception as file_error:
+                        print(f"Error handling file upload for {file_path}: {str(file_error)}")
 
-            # Process through local pipeline
-            nodes = self.pipeline.run(documents=documents)
-            print(f"Ingested {len(nodes)} Nodes")
-            
-            return True
+            self._record_manifest(documents_by_path, results)
+            return results
         except Exception as e:
             print(f"Error handling file upload: {str(e)}")
+            return results
+
+    def _record_manifest(self, documents_by_path: Dict[str, List[Document]], results: Dict[str, bool]):
+        if self.manifest is None:
+            return
+        for file_path, documents in documents_by_path.items():
+            # The reader already hashed the content into the document metadata
+            metadata = (getattr(documents[0], "metadata", None) or {}) if documents else {}
+            digest = metadata.get(CONTENT_HASH_KEY) or file_sha256(file_path)
+            indexed = results[file_path]
+            self.manifest.record(file_path, digest, indexed, None if indexed else "Failed to index file", save=False)
+        self.manifest.save()
+
+    def index_documents(self, file_path: str, documents: List[Document], content_sha256: Optional[str] = None) -> bool:
+        """Index documents already parsed from `file_path` without reading the file again,
+        so a single parse feeds both the cloud upsert and the local pipeline"""
+        try:
+            if not self.initialized and not self.initialize_index():
+                return False
+            self._ingest_documents(tag_documents(documents, file_path, content_sha256))
+            return True
+        except Exception as e:
+            print(f"Error indexing parsed documents for {file_path}: {str(e)}")
             return False
 
+    def wait_for_documents(self, documents: List[Document], timeout: float = 120.0, poll_interval: float = 1.0) -> bool:
+        """Block until LlamaCloud has finished ingesting upserted documents (the upsert
+        only queues them). Returns False if any is still pending after `timeout` and
+        raises RuntimeError if ingestion failed."""
+        pending = {document.id_ for document in documents}
+        deadline = time.monotonic() + timeout
+        while True:
+            for document_id in list(pending):
+                # Document ids are file paths; the API expects them double-encoded
+                # (as LlamaCloudIndex does when it waits for ingestion)
+                response = self.client.pipelines.get_pipeline_document_status(
+                    pipeline_id=self.pipeline_id, document_id=quote_plus(quote_plus(document_id))
+                )
+                status = getattr(response.status, "value", response.status)
+                if status in ("SUCCESS", "PARTIAL_SUCCESS"):
+                    pending.discard(document_id)
+                elif status in ("ERROR", "CANCELLED"):
+                    raise RuntimeError(f"LlamaCloud ingestion of {document_id} ended with status {status}")
+            if not pending:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+
+    def _ingest_documents(self, documents: List[Document]):
+        """Upsert documents to the cloud pipeline and run them through the local pipeline"""
+        # Convert to cloud documents
+        llama_cloud_documents = [d.to_cloud_document() for d in documents]
+
+        # Upload to pipeline
+        self.client.pipelines.upsert_batch_pipeline_documents(
+            self.pipeline_id, request=llama_cloud_documents
+        )
+
+        # Process through local pipeline
+        with self._ingest_lock:
+            started = time.perf_counter()
+            nodes = self.pipeline.run(documents=documents)
+            self.pipeline_seconds += time.perf_counter() - started
+            self.documents_ingested += len(documents)
+            self.nodes_ingested += len(nodes)
+        print(f"Ingested {len(nodes)} Nodes from {len(documents)} document(s)")
+
+    def get_ingest_stats(self) -> dict:
+        """Documents and nodes ingested, and local pipeline (chunk + embed) throughput"""
+        return {
+            "documents_ingested": self.documents_ingested,
+            "nodes_ingested": self.nodes_ingested,
+            "pipeline_seconds": round(self.pipeline_seconds, 3),
+            "nodes_per_second": round(self.nodes_ingested / self.pipeline_seconds, 2) if self.pipeline_seconds else None
+        }
+
     def query_index(self, query_text: str) -> str:
         """Query the index"""
         try:
@@ -95,26 +298,131 @@ class RAGPipeline:
         except Exception as e:
             return f"Error querying index: {str(e)}"
 
-    def background_index_existing_documents(self):
-        """Index all existing documents in the uploaded_documents directory"""
+    def retrieve(self, query_text: str, top_k: int = 5, content_sha256: Optional[str] = None) -> List[dict]:
+        """Top-k retrieved chunks as plain dicts (text, score, node_id, metadata).
+        `content_sha256` limits retrieval to the nodes of that one document.
+        """
+        if not self.initialized and not self.initialize_index():
+            return []
+        filters = document_filters(content_sha256) if content_sha256 else None
+        nodes = self.index.as_retriever(similarity_top_k=top_k, filters=filters).retrieve(query_text)
+        return [
+            {
+                "node_id": n.node.node_id,
+                "text": n.node.get_content(),
+                "score": n.score,
+                "metadata": dict(n.node.metadata or {})
+            }
+            for n in nodes
+        ]
+
+    def background_index_existing_documents(
+        self,
+        upload_dir: str = "uploaded_documents",
+        index_file: Optional[Callable[[str], bool]] = None,
+        max_workers: Optional[int] = None,
+        manifest_path: Optional[str] = None,
+        owns: Optional[Callable[[str], bool]] = None
+    ):
+        """Index new or changed documents in the upload directory.
+
+        A manifest of content hash -> index state skips files that are already
+        indexed, and the rest run on a bounded thread pool. The pipeline's own
+        manifest is used unless `manifest_path` names another one; entries for
+        deleted files are dropped during the scan. `index_file` defaults to
+        handle_file_upload; the index server passes its batching upload_file instead. `owns(path)` limits a sharded server to the files
+        the hash ring assigns to it. Progress and ETA are kept in
+        background_progress.
+        """
+        index_file = index_file or self.handle_file_upload
+        max_workers = max_workers or int(os.getenv("INDEX_BACKGROUND_WORKERS", "4"))
+        with self._progress_lock:
+            if self.background_progress.get("state") in ("scanning", "running"):
+                print("Background indexing already running")
+                return
+            self.background_progress = {"state": "scanning", "started_at": time.time()}
+        manifest = None
         try:
-            upload_dir = "uploaded_documents"
             if not os.path.exists(upload_dir):
                 print(f"Upload directory {upload_dir} does not exist")
+                self._update_progress(state="completed", total=0)
                 return
 
-            for filename in os.listdir(upload_dir):
-                if filename.endswith(('.pdf', '.txt', '.doc', '.docx')):
-                    file_path = os.path.join(upload_dir, filename)
-                    print(f"Indexing {filename}...")
-                    self.handle_file_upload(file_path)
+            if manifest_path is None and self.manifest is not None:
+                manifest = self.manifest
+            else:
+                manifest = IndexManifest(manifest_path or os.getenv("INDEX_MANIFEST_FILE", "index_manifest.json"))
+            pruned = manifest.prune_missing()
+            if pruned:
+                print(f"Background indexing: dropped {pruned} deleted file(s) from the manifest")
+            candidates = [
+                os.path.join(upload_dir, filename)
+                for filename in sorted(os.listdir(upload_dir))
+                if filename.endswith(INDEXABLE_EXTENSIONS)
+            ]
+            if owns is not None:
+                candidates = [file_path for file_path in candidates if owns(file_path)]
+            pending = []
+            for file_path in candidates:
+                digest = manifest.changed_digest(file_path)
+                if digest is not None:
+                    pending.append((file_path, digest))
+            manifest.save()
+            print(f"Background indexing: {len(pending)} new or changed of {len(candidates)} document(s)")
+            self._update_progress(
+                state="running", total=len(candidates), skipped=len(candidates) - len(pending),
+                pending=len(pending), indexed=0, failed=0, running_since=time.time()
+            )
+
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="background-index") as executor:
+                futures = {executor.submit(index_file, path): (path, digest) for path, digest in pending}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    file_path, digest = futures[future]
+                    try:
+                        error = None if future.result() else "Failed to index file"
+                    except Exception as e:
+                        error = str(e)
+                    # Rewriting the whole manifest per file is quadratic on a large backfill
+                    manifest.record(file_path, digest, error is None, error, save=False)
+                    if done % MANIFEST_SAVE_EVERY == 0:
+                        manifest.save()
+                    self._record_background_result(error is None)
+
+            self._update_progress(state="completed", finished_at=time.time())
         except Exception as e:
             print(f"Error in background indexing: {str(e)}")
+            self._update_progress(state="failed", error=str(e), finished_at=time.time())
+        finally:
+            if manifest is not None:
+                manifest.save()
+
+    def _update_progress(self, **changes):
+        with self._progress_lock:
+            self.background_progress.update(changes)
+
+    def _record_background_result(self, indexed: bool):
+        with self._progress_lock:
+            progress = self.background_progress
+            progress["indexed" if indexed else "failed"] += 1
+            progress["pending"] -= 1
+
+    def get_background_progress(self) -> dict:
+        """Snapshot of background indexing with throughput and ETA"""
+        with self._progress_lock:
+            progress = dict(self.background_progress)
+        if progress.get("state") == "running":
+            done = progress["indexed"] + progress["failed"]
+            elapsed = time.time() - progress["running_since"]
+            rate = done / elapsed if elapsed > 0 and done else None
+            progress["files_per_second"] = round(rate, 3) if rate else None
+            progress["eta_seconds"] = round(progress["pending"] / rate, 1) if rate else None
+        return progress
 
     def get_status(self) -> dict:
         """Get the current status of the pipeline"""
         return {
             "initialized": self.initialized,
             "connected": self.index is not None,
-            "message": "Pipeline ready" if self.initialized else "Pipeline not initialized"
+            "message": "Pipeline ready" if self.initialized else "Pipeline not initialized",
+            "background_indexing": self.get_background_progress()
         }
\ No newline at end of file
@@ -0,0 +1,121 @@
+import threading
+import time
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUFFER_SIZE = 2000
+DEFAULT_JOB_TTL = 300.0
+
+# Emitted in place of the producer's remaining events if it raises
+INTERNAL_ERROR_EVENT = ("error", {"status": "error", "error": "Internal server error", "is_complete": True})
+
+
+class StreamJob:
+    """A streaming extraction that outlives the HTTP connection watching it.
+
+    The producer generator runs in a background thread. Its events are
+    numbered from 1 and kept in a bounded replay buffer, so a client that
+    reconnects with the last id it saw can pick up where it left off. If the
+    client fell further behind than the buffer holds, read() reports how many
+    events were lost.
+    """
+
+    def __init__(self, job_id: str, events: Iterable[Tuple[str, Dict[str, Any]]], buffer_size: int = DEFAULT_BUFFER_SIZE):
+        self.job_id = job_id
+        self._events = events
+        self._buffer: deque = deque(maxlen=max(1, buffer_size))
+        self._last_id = 0
+        self._cond = threading.Condition()
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"stream-job-{job_id[:8]}")
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for event in self._events:
+                self._append(event)
+        except Exception as e:
+            print(f"Stream job {self.job_id} failed: {str(e)}")
+            self._append(INTERNAL_ERROR_EVENT)
+        finally:
+            with self._cond:
+                self.done = True
+                self.finished_at = time.monotonic()
+                self._cond.notify_all()
+
+    def _append(self, event: Tuple[str, Dict[str, Any]]):
+        with self._cond:
+            self._last_id += 1
+            self._buffer.append((self._last_id, event))
+            self._cond.notify_all()
+
+    @property
+    def last_id(self) -> int:
+        with self._cond:
+            return self._last_id
+
+    def read(self, after_id: int, timeout: Optional[float] = None) -> Tuple[List[Tuple[int, Tuple[str, Dict[str, Any]]]], int, bool]:
+        """Events numbered above `after_id`, waiting up to `timeout` for one.
+        Returns (events, missed, finished): `missed` counts events that already
+        fell out of the buffer and `finished` is True once the job is done, in
+        which case the returned events are its last ones.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._last_id > after_id or self.done, timeout)
+            oldest = self._buffer[0][0] if self._buffer else self._last_id + 1
+            missed = max(0, oldest - after_id - 1)
+            # Ids are contiguous, so skip straight to the first unseen event
+            events = list(islice(self._buffer, max(0, after_id + 1 - oldest), None))
+            return events, missed, self.done
+
+
+class StreamJobRegistry:
+    """Running and recently finished StreamJobs by id.
+    Finished jobs are forgotten `ttl` seconds after they complete.
+    """
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER_SIZE, ttl: float = DEFAULT_JOB_TTL):
+        self.buffer_size = buffer_size
+        self.ttl = ttl
+        self._jobs: Dict[str, StreamJob] = {}
+        self._lock = threading.Lock()
+
+    def start(self, events: Iterable[Tuple[str, Dict[str, Any]]]) -> StreamJob:
+        self._expire()
+        job = StreamJob(uuid.uuid4().hex, events, self.buffer_size)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        job.start()
+        return job
+
+    def get(self, job_id: str) -> Optional[StreamJob]:
+        self._expire()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.done)
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.done and job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+
+def parse_event_id(value: Optional[str]) -> Tuple[Optional[str], int]:
+    """Split a "<job_id>:<seq>" SSE event id; (None, 0) if it is not one"""
+    if not value:
+        return None, 0
+    job_id, _, seq = value.strip().rpartition(":")
+    if not job_id or not seq.isdigit():
+        return None, 0
+    return job_id, int(seq)
@@ -0,0 +1,256 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from llama_index.core.output_parsers import PydanticOutputParser
+
+WHITESPACE = " \t\r\n"
+# Characters that end a number or a true/false/null literal
+SCALAR_END = ",}]/" + WHITESPACE
+
+# Where a root value can start, and a run of string characters with nothing to interpret
+_ROOT_START = re.compile(r"[{\[]")
+_STRING_RUN = re.compile(r'[^"\\]+')
+
+Path = Tuple[Any, ...]
+
+
+class IncrementalJSONParser:
+    """Character-level JSON parser that can be fed LLM output in arbitrary chunks.
+
+    feed() returns (path, value) for every value that closed within the chunk,
+    innermost first. `path` is the tuple of object keys and array indices from
+    the root, so ("tenant_info", "tenant") closes before ("tenant_info",).
+    Text before the first '{' or '[' (a preamble or markdown fence) and after
+    the root value closes is ignored. Every character is examined once.
+
+    A few slips LLMs commonly make are accepted: trailing commas, // line
+    comments and raw control characters inside strings.
+
+    Malformed input stops the parser: `error` is set and later chunks are
+    ignored, leaving the caller to fall back to parsing the full text. If the
+    text simply ends early, close() returns what was parsed so far.
+    """
+
+    def __init__(self, track_paths: bool = True):
+        # Paths cost O(depth) per value; recover_json() switches them off
+        self._track_paths = track_paths
+        # Open containers, outermost first: {"container", "state", "key"}
+        self._stack: List[Dict[str, Any]] = []
+        self._string: Optional[List[str]] = None
+        self._string_is_key = False
+        self._escape = False
+        self._scalar: Optional[List[str]] = None
+        # None, "slash" after a lone '/', or "line" inside a // comment
+        self._comment: Optional[str] = None
+        self.done = False
+        self.repaired = False
+        self.error: Optional[str] = None
+        self.root: Any = None
+
+    def feed(self, chunk: str) -> List[Tuple[Path, Any]]:
+        events: List[Tuple[Path, Any]] = []
+        self._scan(chunk, 0, events)
+        return events
+
+    def _scan(self, text: str, start: int, events: List[Tuple[Path, Any]]) -> int:
+        """Consume text[start:] and return the index where parsing stopped:
+        len(text), the character after the root closed, or the offending one
+        """
+        if self.done or self.error:
+            return start
+        i, n = start, len(text)
+        try:
+            while i < n:
+                if not self._stack:
+                    # Jump to the root container rather than stepping through prose
+                    match = _ROOT_START.search(text, i)
+                    if match is None:
+                        return n
+                    i = match.start()
+                elif self._comment == "line":
+                    end = text.find("\n", i)
+                    if end == -1:
+                        return n
+                    self._comment = None
+                    i = end + 1
+                    continue
+                elif self._string is not None and not self._escape:
+                    match = _STRING_RUN.match(text, i)
+                    if match:
+                        self._string.append(match.group())
+                        i = match.end()
+                        continue
+                self._consume(text[i], events)
+                i += 1
+                if self.done:
+                    break
+        except ValueError as e:
+            self.error = str(e)
+        return i
+
+    def close(self) -> Any:
+        """Signal the end of input and return the root value.
+
+        A truncated root is completed rather than discarded: an unfinished
+        string, number or key is dropped and every open container is closed,
+        and `repaired` is set. Returns None if no root container was opened.
+        """
+        if self.done or not self._stack:
+            return self.root
+        self._string = self._scalar = self._comment = None
+        self._escape = False
+        self.repaired = True
+        while self._stack:
+            container = self._stack.pop()["container"]
+            if not self._stack:
+                self.root = container
+                break
+            # An open container is always the pending value of its parent
+            frame = self._stack[-1]
+            if isinstance(frame["container"], dict):
+                frame["container"][frame["key"]] = container
+            else:
+                frame["container"].append(container)
+            frame["state"] = "after"
+        self.done = True
+        return self.root
+
+    def _path(self) -> Path:
+        return tuple(
+            frame["key"] if isinstance(frame["container"], dict) else len(frame["container"])
+            for frame in self._stack
+        )
+
+    def _consume(self, ch: str, events: List[Tuple[Path, Any]]):
+        if self._string is not None:
+            if self._escape:
+                self._string.append(ch)
+                self._escape = False
+            elif ch == "\\":
+                self._string.append(ch)
+                self._escape = True
+            elif ch == '"':
+                value = json.loads('"' + "".join(self._string) + '"', strict=False)
+                self._string = None
+                if self._string_is_key:
+                    frame = self._stack[-1]
+                    frame["key"] = value
+                    frame["state"] = "colon"
+                else:
+                    self._complete(value, events)
+            else:
+                self._string.append(ch)
+            return
+
+        if self._scalar is not None:
+            if ch not in SCALAR_END:
+                self._scalar.append(ch)
+                return
+            token = "".join(self._scalar)
+            self._scalar = None
+            self._complete(json.loads(token), events)
+
+        if not self._stack:
+            # Skip anything before the root container opens
+            if ch in "{[":
+                self._open(ch)
+            return
+
+        if self._comment == "slash":
+            if ch != "/":
+                raise ValueError("Unexpected '/'")
+            self._comment = "line"
+            return
+        if ch == "/":
+            self._comment = "slash"
+            return
+        if ch in WHITESPACE:
+            return
+        frame = self._stack[-1]
+        is_object = isinstance(frame["container"], dict)
+
+        if ch == '"' and is_object and frame["state"] == "key":
+            self._string, self._string_is_key = [], True
+        elif ch == ":":
+            if frame["state"] != "colon":
+                raise ValueError("Unexpected ':'")
+            frame["state"] = "value"
+        elif ch == ",":
+            if frame["state"] != "after":
+                raise ValueError("Unexpected ','")
+            frame["state"] = "key" if is_object else "value"
+        elif ch in "}]":
+            closable = ("key", "after") if is_object else ("value", "after")
+            if (ch == "}") != is_object or frame["state"] not in closable:
+                raise ValueError(f"Unexpected '{ch}'")
+            self._stack.pop()
+            self._complete(frame["container"], events)
+        elif frame["state"] != "value":
+            raise ValueError(f"Unexpected {ch!r}")
+        elif ch == '"':
+            self._string, self._string_is_key = [], False
+        elif ch in "{[":
+            self._open(ch)
+        else:
+            self._scalar = [ch]
+
+    def _open(self, ch: str):
+        if ch == "{":
+            self._stack.append({"container": {}, "state": "key", "key": None})
+        else:
+            self._stack.append({"container": [], "state": "value", "key": None})
+
+    def _complete(self, value: Any, events: List[Tuple[Path, Any]]):
+        if self._track_paths:
+            events.append((self._path(), value))
+        if not self._stack:
+            self.root = value
+            self.done = True
+            return
+        frame = self._stack[-1]
+        if isinstance(frame["container"], dict):
+            frame["container"][frame["key"]] = value
+        else:
+            frame["container"].append(value)
+        frame["state"] = "after"
+
+
+def recover_json(text: str) -> Any:
+    """Recover the JSON object or array from raw LLM output in a single pass.
+
+    Prose and markdown code fences around the value are skipped, and the
+    IncrementalJSONParser repairs (trailing commas, comments, truncated tails)
+    apply. When a candidate turns out to be malformed, scanning resumes at the
+    offending character, so the whole text is still examined about once.
+
+    Returns the first value that parses completely, otherwise the non-empty
+    partial value that got furthest. Raises ValueError if there is neither.
+    """
+    best, best_length = None, 0
+    position = 0
+    while True:
+        match = _ROOT_START.search(text, position)
+        if match is None:
+            break
+        parser = IncrementalJSONParser(track_paths=False)
+        stop = parser._scan(text, match.start(), [])
+        if parser.done:
+            return parser.root
+        value = parser.close()
+        if value and stop - match.start() > best_length:
+            best, best_length = value, stop - match.start()
+        if parser.error is None:
+            # Ran out of text
+            break
+        position = stop
+    if best is None:
+        raise ValueError("No JSON object or array found in LLM output")
+    return best
+
+
+class RecoveringPydanticOutputParser(PydanticOutputParser):
+    """PydanticOutputParser that locates the JSON with recover_json()"""
+
+    def parse(self, text: str) -> Any:
+        return self.output_cls.model_validate(recover_json(text))
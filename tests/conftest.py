@@ -118,6 +118,7 @@ def mock_index_server(mocker):
     import flask_server as fs
     manager = types.SimpleNamespace(upload_file=mocker.Mock(return_value=True))
     mocker.patch.object(fs, "connect_to_index_server", return_value=manager)
-    # Force global manager to this object
-    fs.manager = manager
-    return manager
+    # Drop pooled connections so the pool hands out this object
+    fs.index_pool.reset()
+    yield manager
+    fs.index_pool.reset()
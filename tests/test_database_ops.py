@@ -131,3 +131,34 @@ def test_sync_user_from_auth_create_update_conflict():
     user3 = db.db_manager.sync_user_from_auth('idB', 'mail@example.com', 'B')
     assert user3.id == 'idB'
     assert user3.email == 'mail@example.com'
+
+
+def test_create_tables_adds_columns_missing_from_existing_tables(tmp_path):
+    from sqlalchemy import create_engine, inspect, text
+    from sqlalchemy.orm import sessionmaker
+
+    manager = db.DatabaseManager()
+    manager.engine = create_engine(f"sqlite+pysqlite:///{tmp_path / 'old.db'}")
+    # google_drive_syncs as deployed before stage_metrics existed
+    with manager.engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE google_drive_syncs (id INTEGER PRIMARY KEY, user_id VARCHAR(255) NOT NULL, "
+            "sync_type VARCHAR(50), status VARCHAR(50), files_processed INTEGER, files_failed INTEGER, "
+            "error_message TEXT, started_at DATETIME, completed_at DATETIME)"))
+        connection.execute(text("INSERT INTO google_drive_syncs (id, user_id, status) VALUES (1, 'u1', 'completed')"))
+
+    manager.create_tables()
+    columns = {column['name'] for column in inspect(manager.engine).get_columns('google_drive_syncs')}
+    assert 'stage_metrics' in columns
+    # Already migrated: nothing more to add
+    assert manager.add_missing_columns() == []
+
+    session = sessionmaker(bind=manager.engine)()
+    try:
+        session.add(db.GoogleDriveSync(user_id='u1', stage_metrics={'download': {'files': 1}}))
+        session.commit()
+        rows = {row.id: row.stage_metrics for row in session.query(db.GoogleDriveSync).all()}
+    finally:
+        session.close()
+    assert rows[1] is None
+    assert rows[2] == {'download': {'files': 1}}
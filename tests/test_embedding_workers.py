@@ -0,0 +1,53 @@
+import os
+
+from embedding_workers import MAX_EMBED_BATCH_SIZE, EmbeddingWorkerPool, PooledEmbedding
+
+
+class _FakeModel:
+    """Deterministic stand-in for HuggingFaceEmbedding that records the worker pid"""
+
+    def get_text_embedding(self, text):
+        return [float(len(text)), float(os.getpid()), 1.0]
+
+    def get_text_embedding_batch(self, texts):
+        return [self.get_text_embedding(t) for t in texts]
+
+    def get_query_embedding(self, query):
+        # Like BGE, queries get an instruction prefix that documents do not
+        return self.get_text_embedding("query: " + query)
+
+
+def _fake_model(model_name):
+    return _FakeModel()
+
+
+def test_pool_embeds_in_order_across_workers():
+    pool = EmbeddingWorkerPool("fake", num_workers=2, batch_size=3, model_factory=_fake_model)
+    try:
+        texts = ["x" * n for n in range(1, 21)]
+        vectors = pool.embed(texts)
+        assert [v[0] for v in vectors] == [float(n) for n in range(1, 21)]
+        # Work ran in child processes, not in the caller
+        assert all(int(v[1]) != os.getpid() for v in vectors)
+        assert pool.embed([]) == []
+    finally:
+        pool.shutdown()
+
+
+def test_pooled_embedding_sets_node_embeddings():
+    from llama_index.core.schema import TextNode
+
+    embed_model = PooledEmbedding(model_name="fake", worker_processes=2, worker_batch_size=2, model_factory=_fake_model)
+    try:
+        nodes = embed_model([TextNode(text="ab"), TextNode(text="abcd"), TextNode(text="a")])
+        assert [n.embedding[0] for n in nodes] == [2.0, 4.0, 1.0]
+        assert embed_model.get_text_embedding("abc")[0] == 3.0
+        assert embed_model.get_query_embedding("abc")[0] == float(len("query: abc"))
+    finally:
+        embed_model.pool.shutdown()
+
+
+def test_pooled_embedding_caps_default_batch_size_on_many_workers():
+    # 128 workers x 32 texts would exceed BaseEmbedding's embed_batch_size limit
+    embed_model = PooledEmbedding(model_name="fake", worker_processes=128, model_factory=_fake_model)
+    assert embed_model.embed_batch_size == MAX_EMBED_BATCH_SIZE
@@ -1,8 +1,11 @@
 """
 Unit tests for Google Drive integration
 """
+import os
 import pytest
+import time
 import json
+from contextlib import nullcontext
 from unittest.mock import Mock, patch, MagicMock
 from datetime import datetime
 from google_drive_auth import GoogleDriveAuth
@@ -40,8 +43,10 @@ class TestGoogleDriveAuth:
         assert "scope" in auth_url
     
     @patch('google_drive_auth.Flow')
-    def test_handle_callback_success(self, mock_flow_class, auth_manager):
+    def test_handle_callback_success(self, mock_flow_class, auth_manager, tmp_path, monkeypatch):
         """Test successful OAuth callback handling"""
+        # Tokens are written under token_storage/ in the working directory
+        monkeypatch.chdir(tmp_path)
         # Mock Flow instance
         mock_flow = MagicMock()
         mock_flow_class.from_client_config.return_value = mock_flow
@@ -50,6 +55,11 @@ class TestGoogleDriveAuth:
         mock_credentials = MagicMock()
         mock_credentials.token = "test_token"
         mock_credentials.refresh_token = "test_refresh_token"
+        mock_credentials.token_uri = "https://oauth2.googleapis.com/token"
+        mock_credentials.client_id = "test_client_id"
+        mock_credentials.client_secret = "test_client_secret"
+        mock_credentials.scopes = GoogleDriveAuth.SCOPES
+        mock_credentials.expiry = None
         mock_flow.credentials = mock_credentials
         
         # Mock Drive service
@@ -70,6 +80,9 @@ class TestGoogleDriveAuth:
             assert result['success'] is True
             assert result['user_email'] == 'test@example.com'
             assert result['display_name'] == 'Test User'
+        
+        with open(tmp_path / 'token_storage' / 'google_drive_tokens_test_user.json') as f:
+            assert json.load(f)['refresh_token'] == 'test_refresh_token'
     
     def test_is_authenticated_no_credentials(self, auth_manager):
         """Test authentication check when no credentials exist"""
@@ -98,6 +111,107 @@ class TestGoogleDriveAuth:
         assert credentials is not None
         assert credentials.token == 'test_token'
         assert credentials.refresh_token == 'test_refresh_token'
+    
+    def _cached_credentials(self, auth_manager, expiry):
+        from google.oauth2.credentials import Credentials
+        credentials = Credentials(
+            token='old_token',
+            refresh_token='test_refresh_token',
+            token_uri='https://oauth2.googleapis.com/token',
+            client_id='test_client_id',
+            client_secret='test_client_secret'
+        )
+        credentials.expiry = expiry
+        with auth_manager._cache_lock:
+            auth_manager._credentials_cache['test_user'] = credentials
+            auth_manager._last_used['test_user'] = time.monotonic()
+        return credentials
+    
+    def test_get_credentials_uses_cache(self, auth_manager):
+        """Test cached credentials are returned without re-reading token storage"""
+        from datetime import timedelta
+        cached = self._cached_credentials(auth_manager, datetime.utcnow() + timedelta(hours=1))
+        
+        with patch('builtins.open') as mock_open:
+            assert auth_manager.get_credentials("test_user") is cached
+            assert auth_manager.get_credentials("test_user") is cached
+            mock_open.assert_not_called()
+    
+    def test_concurrent_refresh_is_single_flight(self, auth_manager, tmp_path, monkeypatch):
+        """Test concurrent callers with expired credentials trigger one refresh"""
+        import threading
+        import time
+        from datetime import timedelta
+        monkeypatch.chdir(tmp_path)
+        auth_manager.refresh_ahead_seconds = 0
+        cached = self._cached_credentials(auth_manager, datetime.utcnow() - timedelta(minutes=1))
+        refresh_calls = []
+        
+        def fake_refresh(self, request):
+            refresh_calls.append(request)
+            time.sleep(0.05)
+            self.token = 'new_token'
+            self.expiry = datetime.utcnow() + timedelta(hours=1)
+        
+        results = []
+        with patch('google.oauth2.credentials.Credentials.refresh', fake_refresh):
+            threads = [
+                threading.Thread(target=lambda: results.append(auth_manager.get_credentials("test_user")))
+                for _ in range(5)
+            ]
+            for t in threads: t.start()
+            for t in threads: t.join()
+        
+        assert len(refresh_calls) == 1
+        assert all(r is cached for r in results)
+        assert cached.token == 'new_token'
+    
+    def test_refresh_ahead_renews_before_expiry(self, auth_manager, tmp_path, monkeypatch):
+        """Test the scheduler refreshes tokens that are about to expire"""
+        import threading
+        from datetime import timedelta
+        monkeypatch.chdir(tmp_path)
+        refreshed = threading.Event()
+        
+        def fake_refresh(self, request):
+            self.token = 'renewed_token'
+            self.expiry = datetime.utcnow() + timedelta(hours=1)
+            refreshed.set()
+        
+        cached = self._cached_credentials(auth_manager, datetime.utcnow() + timedelta(seconds=30))
+        with patch('google.oauth2.credentials.Credentials.refresh', fake_refresh):
+            auth_manager._schedule_refresh("test_user", cached)
+            assert refreshed.wait(timeout=5)
+        
+        assert not cached.expired
+        assert auth_manager.get_credentials("test_user").token == 'renewed_token'
+        auth_manager._evict_credentials("test_user")
+    
+    def test_refresh_ahead_evicts_idle_users(self, auth_manager):
+        """Test an idle user's credentials are dropped instead of refreshed and re-armed"""
+        from datetime import timedelta
+        auth_manager.credentials_idle_seconds = 60
+        self._cached_credentials(auth_manager, datetime.utcnow() + timedelta(seconds=30))
+        auth_manager._last_used['test_user'] = time.monotonic() - 120
+        
+        with patch('google.oauth2.credentials.Credentials.refresh') as mock_refresh:
+            auth_manager._refresh_ahead("test_user")
+        
+        mock_refresh.assert_not_called()
+        assert 'test_user' not in auth_manager._credentials_cache
+        assert 'test_user' not in auth_manager._refresh_timers
+    
+    def test_failed_refresh_ahead_is_not_rearmed(self, auth_manager):
+        """Test a failed background refresh does not schedule another one"""
+        from datetime import timedelta
+        self._cached_credentials(auth_manager, datetime.utcnow() + timedelta(seconds=30))
+        
+        with patch('google.oauth2.credentials.Credentials.refresh', side_effect=Exception('invalid_grant')), \
+             patch.object(auth_manager, '_schedule_refresh') as mock_schedule:
+            auth_manager._refresh_ahead("test_user")
+        
+        mock_schedule.assert_not_called()
+        assert 'test_user' not in auth_manager._refresh_timers
 
 
 class TestGoogleDriveIngestion:
@@ -191,9 +305,9 @@ class TestGoogleDriveIngestion:
         assert 'children' in result
     
     @patch('google_drive_ingestion.MediaIoBaseDownload')
-    @patch('google_drive_ingestion.io.FileIO')
+    @patch('google_drive_ingestion.GoogleDriveIngestion._stream_to_file', return_value='md5')
     @patch('google_drive_ingestion.build')
-    def test_download_file_success(self, mock_build, mock_fileio, mock_downloader, ingestion_manager, auth_manager):
+    def test_download_file_success(self, mock_build, mock_stream, mock_downloader, ingestion_manager, auth_manager):
         """Test successful file download"""
         # Mock credentials
         mock_credentials = MagicMock()
@@ -210,10 +324,6 @@ class TestGoogleDriveIngestion:
         mock_downloader_instance.next_chunk.return_value = (None, True)
         mock_downloader.return_value = mock_downloader_instance
         
-        # Mock file IO
-        mock_fh = MagicMock()
-        mock_fileio.return_value = mock_fh
-        
         file_metadata = {
             'id': 'file123',
             'name': 'test.pdf',
@@ -224,6 +334,143 @@ class TestGoogleDriveIngestion:
         
         assert filename == 'test.pdf'
         assert 'test_user_file123_test.pdf' in local_path
+        mock_stream.assert_called_once_with(mock_request, local_path)
+    
+    @patch('google_drive_ingestion.build')
+    def test_download_to_storage_skips_matching_checksum(self, mock_build, ingestion_manager, auth_manager, tmp_path):
+        """Test download is skipped when the Drive checksum is already stored"""
+        auth_manager.get_credentials.return_value = MagicMock()
+        mock_build.return_value = MagicMock()
+        
+        existing = tmp_path / 'gdrive_abc123.pdf'
+        existing.write_bytes(b'already here')
+        
+        with patch('google_drive_ingestion.MediaIoBaseDownload') as mock_downloader:
+            result = ingestion_manager.download_to_storage(
+                "test_user", "file123",
+                {'id': 'file123', 'name': 'Lease.PDF', 'mimeType': 'application/pdf', 'md5Checksum': 'abc123'},
+                storage_dir=str(tmp_path)
+            )
+            mock_downloader.assert_not_called()
+        
+        assert result['skipped'] is True
+        assert result['local_path'] == str(existing)
+        assert result['original_name'] == 'Lease.PDF'
+    
+    @patch('google_drive_ingestion.build')
+    def test_download_to_storage_streams_to_content_address(self, mock_build, ingestion_manager, auth_manager, tmp_path):
+        """Test streamed downloads are hashed and renamed into place"""
+        import hashlib
+        auth_manager.get_credentials.return_value = MagicMock()
+        mock_build.return_value = MagicMock()
+        payload = b'lease body ' * 100
+        
+        class FakeDownloader:
+            def __init__(self, fd, request, chunksize):
+                self.fd = fd
+                self.chunksize = chunksize
+                self.offset = 0
+            def next_chunk(self):
+                self.fd.write(payload[self.offset:self.offset + self.chunksize])
+                self.offset += self.chunksize
+                return None, self.offset >= len(payload)
+        
+        ingestion_manager.chunk_size = 64
+        expected_md5 = hashlib.md5(payload).hexdigest()
+        with patch('google_drive_ingestion.MediaIoBaseDownload', FakeDownloader):
+            result = ingestion_manager.download_to_storage(
+                "test_user", "file123",
+                {'id': 'file123', 'name': 'lease.pdf', 'mimeType': 'application/pdf', 'md5Checksum': expected_md5},
+                storage_dir=str(tmp_path)
+            )
+        
+        assert result['skipped'] is False
+        assert result['md5_checksum'] == expected_md5
+        assert result['local_path'] == str(tmp_path / f'gdrive_{expected_md5}.pdf')
+        assert (tmp_path / f'gdrive_{expected_md5}.pdf').read_bytes() == payload
+        # No staging or partial files are left behind
+        assert sorted(os.listdir(tmp_path)) == [f'gdrive_{expected_md5}.pdf']
+    
+    @patch('google_drive_ingestion.build')
+    def test_download_to_storage_stages_concurrent_downloads_apart(self, mock_build, ingestion_manager, auth_manager, tmp_path):
+        """Test two downloads of the same Drive file never share a staging path"""
+        auth_manager.get_credentials.return_value = MagicMock()
+        mock_build.return_value = MagicMock()
+        staged = []
+        
+        def fake_stream(request, target_path):
+            staged.append(target_path)
+            with open(target_path, 'wb') as fh:
+                fh.write(b'lease')
+            return 'samemd5'
+        
+        ingestion_manager._stream_to_file = fake_stream
+        for _ in range(2):
+            ingestion_manager.download_to_storage(
+                "test_user", "file123", {'id': 'file123', 'name': 'lease.pdf', 'mimeType': 'application/pdf'},
+                storage_dir=str(tmp_path)
+            )
+        
+        assert len(set(staged)) == 2
+        assert all(os.path.basename(path).startswith('.gdrive_test_user_file123_') for path in staged)
+        assert sorted(os.listdir(tmp_path)) == ['gdrive_samemd5.pdf']
+    
+    @patch('google_drive_ingestion.build')
+    def test_download_to_storage_checksum_mismatch(self, mock_build, ingestion_manager, auth_manager, tmp_path):
+        """Test a corrupted download is rejected and cleaned up"""
+        auth_manager.get_credentials.return_value = MagicMock()
+        mock_build.return_value = MagicMock()
+        
+        class FakeDownloader:
+            def __init__(self, fd, request, chunksize):
+                self.fd = fd
+            def next_chunk(self):
+                self.fd.write(b'truncated')
+                return None, True
+        
+        with patch('google_drive_ingestion.MediaIoBaseDownload', FakeDownloader):
+            with pytest.raises(IOError, match="Checksum mismatch"):
+                ingestion_manager.download_to_storage(
+                    "test_user", "file123",
+                    {'id': 'file123', 'name': 'lease.pdf', 'mimeType': 'application/pdf', 'md5Checksum': 'deadbeef'},
+                    storage_dir=str(tmp_path)
+                )
+        
+        assert os.listdir(tmp_path) == []
+    
+    @patch('google_drive_ingestion.build')
+    def test_get_files_metadata_batches_requests(self, mock_build, ingestion_manager, auth_manager):
+        """Test metadata for many ids is fetched in batches of 100 with per-item errors"""
+        auth_manager.get_credentials.return_value = MagicMock()
+        mock_service = MagicMock()
+        mock_build.return_value = mock_service
+        
+        batches = []
+        
+        class FakeBatch:
+            def __init__(self, callback):
+                self.callback = callback
+                self.request_ids = []
+                batches.append(self)
+            def add(self, request, request_id):
+                self.request_ids.append(request_id)
+            def execute(self):
+                for request_id in self.request_ids:
+                    if request_id == 'missing':
+                        self.callback(request_id, None, Exception('File not found'))
+                    else:
+                        self.callback(request_id, {'id': request_id, 'name': f'{request_id}.pdf'}, None)
+        
+        mock_service.new_batch_http_request.side_effect = lambda callback: FakeBatch(callback)
+        file_ids = [f'file{i}' for i in range(199)] + ['missing']
+        
+        metadata_by_id, errors_by_id = ingestion_manager.get_files_metadata("test_user", file_ids)
+        
+        assert [len(b.request_ids) for b in batches] == [100, 100]
+        assert len(metadata_by_id) == 199
+        assert metadata_by_id['file42']['name'] == 'file42.pdf'
+        assert errors_by_id == {'missing': 'File not found'}
+        mock_service.files.return_value.get.return_value.execute.assert_not_called()
 
 
 class TestGoogleDriveFlaskEndpoints:
@@ -359,3 +606,249 @@ class TestDatabaseModels:
         assert result['status'] == 'completed'
         assert result['files_processed'] == 10
         assert result['files_failed'] == 2
+
+
+def _stored_stage_metrics(db, sync_id):
+    session = db.get_session()
+    try:
+        return session.get(GoogleDriveSync, sync_id).stage_metrics
+    finally:
+        session.close()
+
+
+class TestGoogleDriveSyncWorker:
+    """Test background Drive sync processing"""
+    
+    @pytest.fixture
+    def db(self):
+        from database import db_manager
+        db_manager.create_tables()
+        return db_manager
+    
+    @pytest.fixture
+    def sync_id(self, db):
+        session = db.get_session()
+        try:
+            record = GoogleDriveSync(user_id='sync_user', sync_type='manual', status='queued')
+            session.add(record)
+            session.commit()
+            return record.id
+        finally:
+            session.close()
+    
+    @pytest.fixture
+    def ingestion(self, tmp_path):
+        import uuid
+        prefix = uuid.uuid4().hex[:8]
+        ingestion = MagicMock(spec=GoogleDriveIngestion)
+        ingestion.get_files_metadata.return_value = (
+            {f'{prefix}_a': {'id': f'{prefix}_a', 'name': 'a.pdf', 'mimeType': 'application/pdf', 'size': '10'},
+             f'{prefix}_b': {'id': f'{prefix}_b', 'name': 'b.pdf', 'mimeType': 'application/pdf', 'size': '20'}},
+            {f'{prefix}_gone': 'File not found'}
+        )
+        
+        def download(user_id, file_id, metadata, storage_dir):
+            if file_id.endswith('_b'):
+                raise IOError('network dropped')
+            return {'local_path': str(tmp_path / f'{file_id}.pdf'), 'original_name': metadata['name'],
+                    'md5_checksum': 'x', 'skipped': False}
+        ingestion.download_to_storage.side_effect = download
+        ingestion.file_ids = [f'{prefix}_a', f'{prefix}_b', f'{prefix}_gone']
+        return ingestion
+    
+    def test_run_sync_updates_counts_per_file(self, db, sync_id, ingestion):
+        from google_drive_sync import GoogleDriveSyncWorker
+        index_manager = MagicMock()
+        index_manager.upload_file.return_value = True
+        worker = GoogleDriveSyncWorker(ingestion, lambda key=None: nullcontext(index_manager), db=db, num_workers=1)
+        
+        worker.run_sync(sync_id, 'sync_user', ingestion.file_ids, [])
+        
+        session = db.get_session()
+        try:
+            record = session.get(GoogleDriveSync, sync_id)
+            assert record.status == 'completed'
+            assert record.files_processed == 1
+            assert record.files_failed == 2
+            stored = session.query(GoogleDriveFile).filter_by(drive_file_id=ingestion.file_ids[0]).one()
+            assert stored.index_status == 'indexed'
+        finally:
+            session.close()
+        
+        progress = worker.get_progress(sync_id)
+        assert progress['status'] == 'completed'
+        assert progress['files_total'] == 3
+        assert sorted(r['status'] for r in progress['results']) == ['error', 'error', 'success']
+        index_manager.upload_file.assert_called_once()
+        
+        metrics = progress['stage_metrics']
+        assert metrics['download'] == _stored_stage_metrics(db, sync_id)['download']
+        assert metrics['download']['items'] == 2
+        assert metrics['download']['failures'] == 1
+        assert metrics['persist']['items'] == 1
+        assert metrics['index']['items'] == 1
+    
+    def test_index_failure_behind_proxy_counts_as_failed(self, db, sync_id, ingestion):
+        """Test an index server failure wrapped in a (truthy) proxy still fails the file"""
+        from multiprocessing.managers import BaseProxy
+        from google_drive_sync import GoogleDriveSyncWorker
+        
+        class FakeProxy(BaseProxy):
+            def __init__(self, value):
+                self._value = value
+            
+            def _getvalue(self):
+                return self._value
+        
+        index_manager = MagicMock()
+        index_manager.upload_file.return_value = FakeProxy(False)
+        worker = GoogleDriveSyncWorker(ingestion, lambda key=None: nullcontext(index_manager), db=db, num_workers=1)
+        
+        worker.run_sync(sync_id, 'sync_user', ingestion.file_ids, [])
+        
+        session = db.get_session()
+        try:
+            record = session.get(GoogleDriveSync, sync_id)
+            assert record.files_processed == 0
+            assert record.files_failed == 3
+            stored = session.query(GoogleDriveFile).filter_by(drive_file_id=ingestion.file_ids[0]).one()
+            assert stored.index_status == 'failed'
+            assert stored.index_error == 'Failed to index file'
+        finally:
+            session.close()
+    
+    def test_persist_stage_removes_replaced_copy(self, db, tmp_path):
+        """Test re-syncing a file deletes the copy its row pointed to before"""
+        import uuid
+        from google_drive_sync import GoogleDriveSyncWorker
+        file_id = f'persist_{uuid.uuid4().hex[:8]}'
+        old_copy = tmp_path / 'gdrive_sync_user_lease.pdf'
+        old_copy.write_bytes(b'old revision')
+        new_copy = tmp_path / 'gdrive_abc123.pdf'
+        new_copy.write_bytes(b'new revision')
+        session = db.get_session()
+        try:
+            session.add(GoogleDriveFile(user_id='sync_user', drive_file_id=file_id, drive_file_name='lease.pdf',
+                                        local_file_path=str(old_copy)))
+            session.commit()
+        finally:
+            session.close()
+        
+        worker = GoogleDriveSyncWorker(MagicMock(spec=GoogleDriveIngestion), lambda key=None: nullcontext(MagicMock()), db=db)
+        worker._persist_stage('sync_user', {
+            'metadata': {'id': file_id, 'name': 'lease.pdf', 'mimeType': 'application/pdf', 'size': '12'},
+            'download': {'local_path': str(new_copy), 'md5_checksum': 'abc123'}
+        })
+        
+        assert not old_copy.exists()
+        assert new_copy.exists()
+    
+    def test_pipeline_overlaps_download_and_index(self, db, sync_id, tmp_path):
+        """Test downloads keep flowing while earlier files are being indexed"""
+        import threading
+        import time
+        from google_drive_sync import GoogleDriveSyncWorker
+        files = [{'id': f'pipe_{sync_id}_{i}', 'name': f'{i}.pdf', 'mimeType': 'application/pdf'} for i in range(4)]
+        ingestion = MagicMock(spec=GoogleDriveIngestion)
+        ingestion.get_files_metadata.return_value = ({f['id']: f for f in files}, {})
+        events = []
+        events_lock = threading.Lock()
+        
+        def download(user_id, file_id, metadata, storage_dir):
+            time.sleep(0.05)
+            with events_lock:
+                events.append(('downloaded', file_id))
+            return {'local_path': str(tmp_path / f'{file_id}.pdf'), 'original_name': metadata['name'],
+                    'md5_checksum': 'x', 'skipped': False}
+        ingestion.download_to_storage.side_effect = download
+        
+        index_manager = MagicMock()
+        def upload(path):
+            time.sleep(0.05)
+            with events_lock:
+                events.append(('indexed', path))
+            return True
+        index_manager.upload_file.side_effect = upload
+        
+        worker = GoogleDriveSyncWorker(ingestion, lambda key=None: nullcontext(index_manager), db=db,
+                                       stage_concurrency={'download': 1, 'persist': 1, 'index': 1})
+        worker.run_sync(sync_id, 'sync_user', [f['id'] for f in files], [])
+        
+        kinds = [kind for kind, _ in events]
+        # The first file is indexed before the last one finishes downloading
+        assert kinds.index('indexed') < len(kinds) - 1 - kinds[::-1].index('downloaded')
+        assert worker.get_progress(sync_id)['files_processed'] == 4
+    
+    def test_stage_failure_outside_handler_still_reports_a_result(self, db, sync_id, ingestion):
+        """Test a handler returning None fails that file instead of hanging the sync"""
+        from google_drive_sync import GoogleDriveSyncWorker
+        index_manager = MagicMock()
+        worker = GoogleDriveSyncWorker(ingestion, lambda key=None: nullcontext(index_manager), db=db,
+                                       result_timeout=5)
+        worker._persist_stage = lambda user_id, item: None
+        
+        worker.run_sync(sync_id, 'sync_user', ingestion.file_ids, [])
+        
+        progress = worker.get_progress(sync_id)
+        assert progress['status'] == 'completed'
+        assert progress['files_processed'] == 0
+        assert progress['files_failed'] == 3
+        assert [r['stage'] for r in progress['results'] if r.get('stage') == 'persist'] == ['persist']
+        index_manager.upload_file.assert_not_called()
+    
+    def test_stalled_pipeline_fails_the_sync(self, db, sync_id, ingestion):
+        """Test run_sync gives up on a file that never finishes"""
+        import threading
+        from google_drive_sync import GoogleDriveSyncWorker
+        release = threading.Event()
+        ingestion.download_to_storage.side_effect = lambda *args, **kwargs: release.wait(5)
+        worker = GoogleDriveSyncWorker(ingestion, lambda key=None: nullcontext(MagicMock()), db=db,
+                                       result_timeout=0.2)
+        try:
+            worker.run_sync(sync_id, 'sync_user', ingestion.file_ids, [])
+        finally:
+            release.set()
+        
+        session = db.get_session()
+        try:
+            record = session.get(GoogleDriveSync, sync_id)
+            assert record.status == 'failed'
+            assert 'stalled' in record.error_message
+            assert record.completed_at is not None
+        finally:
+            session.close()
+    
+    def test_submit_processes_in_background(self, db, sync_id, ingestion):
+        from google_drive_sync import GoogleDriveSyncWorker
+        index_manager = MagicMock()
+        index_manager.upload_file.return_value = True
+        worker = GoogleDriveSyncWorker(ingestion, lambda key=None: nullcontext(index_manager), db=db, num_workers=1)
+        
+        worker.submit(sync_id, 'sync_user', ingestion.file_ids, [])
+        
+        snapshot, version = None, None
+        for _ in range(50):
+            snapshot = worker.wait_for_update(sync_id, version, timeout=0.2)
+            version = snapshot['version']
+            if snapshot['status'] == 'completed':
+                break
+        assert snapshot['status'] == 'completed'
+        assert snapshot['files_processed'] == 1
+
+
+def test_sync_endpoint_queues_and_returns_immediately(client):
+    """Test the sync endpoint hands work to the background worker"""
+    from database import db_manager
+    db_manager.create_tables()
+    with patch('flask_server.google_auth') as mock_auth, \
+         patch('flask_server.google_ingestion'), \
+         patch('flask_server.google_sync_worker') as mock_worker:
+        mock_auth.get_credentials.return_value = MagicMock()
+        
+        response = client.post('/api/google-drive/sync',
+                               json={'user_id': 'test123', 'file_ids': ['f1', 'f2']})
+        
+        assert response.status_code == 202
+        assert response.json['status'] == 'queued'
+        sync_id = response.json['sync_id']
+        mock_worker.submit.assert_called_once_with(sync_id, 'test123', ['f1', 'f2'], [])
@@ -0,0 +1,501 @@
+import os
+import threading
+import time
+
+import pytest
+
+import index_server as srv
+
+
+def test_upload_coalescer_batches_concurrent_calls():
+    batches = []
+
+    def process_batch(paths):
+        batches.append(list(paths))
+        return {p: not p.endswith("bad.txt") for p in paths}
+
+    coalescer = srv.UploadCoalescer(process_batch, window_seconds=0.2, max_batch_size=10)
+    paths = ["/tmp/a.txt", "/tmp/b.txt", "/tmp/bad.txt", "/tmp/a.txt"]
+    results = [None] * len(paths)
+    start = threading.Barrier(len(paths))
+
+    def call(i):
+        start.wait()
+        results[i] = coalescer.submit(paths[i])
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(paths))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+
+    # One pipeline run, duplicate paths collapsed, each caller gets its own result
+    assert len(batches) == 1
+    assert sorted(batches[0]) == ["/tmp/a.txt", "/tmp/b.txt", "/tmp/bad.txt"]
+    assert results == [True, True, False, True]
+
+
+def test_upload_coalescer_respects_max_batch_size():
+    batches = []
+    coalescer = srv.UploadCoalescer(
+        lambda paths: batches.append(list(paths)) or {p: True for p in paths},
+        window_seconds=0.2, max_batch_size=2
+    )
+    threads = [threading.Thread(target=coalescer.submit, args=(f"/tmp/{i}.txt",)) for i in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+
+    assert all(len(b) <= 2 for b in batches)
+    assert sum(len(b) for b in batches) == 5
+
+
+def test_upload_coalescer_reports_failure_when_batch_raises():
+    def process_batch(paths):
+        raise RuntimeError("pipeline down")
+
+    coalescer = srv.UploadCoalescer(process_batch, window_seconds=0.01)
+    assert coalescer.submit("/tmp/a.txt") is False
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_ingestion_queue_runs_jobs_and_reports_status(tmp_path):
+    from ingestion_queue import IngestionJobQueue
+
+    jobs = IngestionJobQueue(lambda path: not path.endswith("bad.txt"), state_path=str(tmp_path / "jobs.json"), num_workers=2)
+    jobs.start()
+    ok_id = jobs.enqueue("/tmp/a.txt")
+    bad_id = jobs.enqueue("/tmp/bad.txt")
+
+    assert _wait_for(lambda: jobs.get_job(ok_id)["status"] == "completed")
+    assert _wait_for(lambda: jobs.get_job(bad_id)["status"] == "failed")
+    assert jobs.get_job(bad_id)["error"] == "Failed to index file"
+    assert [j["id"] for j in jobs.list_jobs()] == [bad_id, ok_id]
+    assert jobs.stats()["jobs"]["completed"] == 1
+    assert jobs.get_job("missing") is None
+
+
+def test_ingestion_queue_applies_backpressure():
+    from ingestion_queue import IngestionJobQueue, IngestionQueueFull
+
+    # Workers never started, so nothing drains the queue
+    jobs = IngestionJobQueue(lambda path: True, max_depth=2, enqueue_timeout=0.05)
+    jobs.enqueue("/tmp/1.txt")
+    jobs.enqueue("/tmp/2.txt")
+    with pytest.raises(IngestionQueueFull):
+        jobs.enqueue("/tmp/3.txt")
+    assert len(jobs.list_jobs()) == 2
+
+
+def test_ingestion_queue_resumes_persisted_jobs(tmp_path):
+    from ingestion_queue import IngestionJobQueue
+
+    state_path = str(tmp_path / "jobs.json")
+    first = IngestionJobQueue(lambda path: True, state_path=state_path)
+    job_id = first.enqueue("/tmp/a.txt")
+
+    # A new queue (server restart) picks the job up from the journal
+    processed = []
+    second = IngestionJobQueue(lambda path: processed.append(path) or True, state_path=state_path)
+    second.start()
+    assert _wait_for(lambda: second.get_job(job_id)["status"] == "completed")
+    assert processed == ["/tmp/a.txt"]
+
+
+def test_ingestion_queue_concurrent_start_resumes_each_job_once(tmp_path):
+    from ingestion_queue import IngestionJobQueue
+
+    state_path = str(tmp_path / "jobs.json")
+    job_id = IngestionJobQueue(lambda path: True, state_path=state_path).enqueue("/tmp/a.txt")
+
+    processed = []
+    jobs = IngestionJobQueue(lambda path: processed.append(path) or True, state_path=state_path, num_workers=2)
+    barrier = threading.Barrier(8)
+
+    def start():
+        barrier.wait()
+        jobs.start()
+
+    starters = [threading.Thread(target=start) for _ in range(8)]
+    for t in starters:
+        t.start()
+    for t in starters:
+        t.join()
+
+    assert _wait_for(lambda: jobs.get_job(job_id)["status"] == "completed")
+    time.sleep(0.1)
+    assert processed == ["/tmp/a.txt"]
+    assert len(jobs._threads) == 2
+
+
+def test_query_cache_normalizes_and_expires(monkeypatch):
+    from query_cache import QueryResultCache
+
+    cache = QueryResultCache(max_entries=2, ttl_seconds=60)
+    cache.put("What is the lease term?", "5 years", compute_seconds=1.5)
+    assert cache.get("  what is the   LEASE term ") == (True, "5 years")
+    assert cache.get("Who is the tenant?") == (False, None)
+
+    # LRU eviction beyond max_entries
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("What is the lease term?") == (False, None)
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["latency_saved_seconds"] == 1.5
+
+    cache.ttl_seconds = 0
+    monkeypatch.setattr("query_cache.time.monotonic", lambda: 1e12)
+    assert cache.get("a") == (False, None)
+
+
+def test_query_uses_cache_until_upload_bumps_generation(monkeypatch):
+    calls = []
+
+    class DummyPipeline:
+        def query_index(self, text):
+            calls.append(text)
+            return f"answer {len(calls)}"
+
+        def handle_file_uploads(self, paths):
+            return {p: True for p in paths}
+
+        def get_status(self):
+            return {"initialized": True, "connected": True}
+
+    monkeypatch.setattr(srv, "rag_pipeline", DummyPipeline())
+    monkeypatch.setattr(srv, "query_cache", srv.QueryResultCache())
+
+    assert srv.query("What is the lease term?") == "answer 1"
+    assert srv.query("what is the lease term") == "answer 1"
+    assert len(calls) == 1
+
+    srv._process_upload_batch(["/tmp/a.txt"])
+    assert srv.query("What is the lease term?") == "answer 2"
+    assert srv.get_status()["query_cache"]["generation"] == 1
+
+
+def test_query_does_not_cache_errors(monkeypatch):
+    class FailingPipeline:
+        def query_index(self, text):
+            return "Error querying index: boom"
+
+    monkeypatch.setattr(srv, "rag_pipeline", FailingPipeline())
+    monkeypatch.setattr(srv, "query_cache", srv.QueryResultCache())
+    srv.query("q")
+    assert srv.query_cache.stats()["entries"] == 0
+
+
+def test_latency_histogram_percentiles():
+    from index_metrics import LatencyHistogram
+
+    hist = LatencyHistogram()
+    for _ in range(90):
+        hist.observe(0.004)
+    for _ in range(10):
+        hist.observe(0.8)
+    assert hist.percentile(50) == 0.005
+    assert hist.percentile(95) == 1.0
+    hist.observe(500.0)
+    assert hist.percentile(100) == 500.0
+    assert hist.snapshot()["count"] == 101
+
+
+def test_get_metrics_tracks_rpc_calls(monkeypatch):
+    class DummyPipeline:
+        def query_index(self, text):
+            return "answer"
+
+        def get_ingest_stats(self):
+            return {"documents_ingested": 2, "nodes_ingested": 10, "pipeline_seconds": 2.0, "nodes_per_second": 5.0}
+
+    monkeypatch.setattr(srv, "rag_pipeline", DummyPipeline())
+    monkeypatch.setattr(srv, "query_cache", srv.QueryResultCache(max_entries=0))
+    before = srv.metrics.snapshot()["methods"].get("query", {}).get("calls", 0)
+    srv.query("q1")
+    srv.query("q2")
+
+    snapshot = srv.get_metrics()
+    query_metrics = snapshot["methods"]["query"]
+    assert query_metrics["calls"] == before + 2
+    assert query_metrics["in_flight"] == 0
+    assert query_metrics["latency"]["p99_seconds"] is not None
+    assert snapshot["ingest"]["nodes_per_second"] == 5.0
+    assert snapshot["ingestion_queue"]["capacity"] > 0
+    assert snapshot["rss_bytes"] > 0
+
+
+def test_index_server_pool_checks_out_distinct_connections():
+    from index_server_pool import IndexServerPool
+
+    created = []
+
+    def connect():
+        created.append(object())
+        return created[-1]
+
+    pool = IndexServerPool(connect, max_size=2, acquire_timeout=0.05)
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first is not second
+    # Pool exhausted: callers wait, then time out
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    assert len(created) == 2
+
+
+def test_index_server_pool_replaces_unhealthy_connections():
+    from index_server_pool import IndexServerPool
+
+    class Conn:
+        def __init__(self, healthy):
+            self.healthy = healthy
+
+        def _number_of_objects(self):
+            if not self.healthy:
+                raise EOFError()
+            return 0
+
+    conns = iter([Conn(False), Conn(True)])
+    pool = IndexServerPool(lambda: next(conns), max_size=1, health_check_interval=0)
+    stale = pool.acquire()
+    pool.release(stale)
+    fresh = pool.acquire()
+    assert fresh is not stale and fresh.healthy
+    assert pool.stats() == {"size": 1, "idle": 0, "in_use": 1, "max_size": 1, "connects": 2, "discarded": 1}
+
+
+def test_index_server_pool_connection_discards_on_connection_error():
+    from index_server_pool import IndexServerPool
+
+    pool = IndexServerPool(object, max_size=1)
+    with pytest.raises(ConnectionResetError):
+        with pool.connection():
+            raise ConnectionResetError()
+    with pytest.raises(ValueError):
+        with pool.connection():
+            raise ValueError()
+    stats = pool.stats()
+    assert stats["discarded"] == 1
+    assert stats["idle"] == 1
+
+
+def test_ready_is_true_in_lazy_mode(monkeypatch):
+    monkeypatch.setattr(srv, "readiness", {"state": "lazy", "warm_start": False, "error": None, "started_at": None, "ready_at": None})
+    assert srv.ready()["ready"] is True
+
+
+def test_warm_start_reports_ready_once_pipeline_is_hot(monkeypatch):
+    warmed = []
+
+    class DummyPipeline:
+        def __init__(self, shard_id=None):
+            self.shard_id = shard_id
+
+        def initialize_index(self):
+            return True
+
+        def warm_up(self):
+            warmed.append(True)
+            return True
+
+    monkeypatch.setattr(srv, "readiness", dict(srv.readiness))
+    monkeypatch.setattr(srv, "rag_pipeline", None)
+    monkeypatch.setattr(srv, "RAGPipeline", DummyPipeline)
+
+    assert srv.warm_start(max_attempts=1) is True
+    state = srv.ready()
+    assert state["ready"] is True
+    assert state["state"] == "ready"
+    assert state["pipeline_initialized"] is True
+    assert warmed == [True]
+
+
+def test_warm_start_failure_keeps_server_unready(monkeypatch):
+    class BrokenPipeline:
+        def __init__(self, shard_id=None):
+            raise RuntimeError("model download failed")
+
+    monkeypatch.setattr(srv, "readiness", dict(srv.readiness))
+    monkeypatch.setattr(srv, "rag_pipeline", None)
+    monkeypatch.setattr(srv, "RAGPipeline", BrokenPipeline)
+
+    assert srv.warm_start(max_attempts=1) is False
+    state = srv.ready()
+    assert state["ready"] is False
+    assert state["state"] == "failed"
+    assert state["error"] == "Pipeline initialization failed"
+
+
+def test_upload_session_verifies_hash_and_deduplicates(tmp_path):
+    import hashlib
+    from upload_sessions import UploadSessionStore
+
+    store = UploadSessionStore(str(tmp_path / "store"))
+    data = b"lease " * 1000
+    digest = hashlib.sha256(data).hexdigest()
+
+    upload_id = store.begin("Lease.PDF", size=len(data))
+    for offset in range(0, len(data), 1024):
+        store.write(upload_id, offset, data[offset:offset + 1024])
+    path, sha, dup = store.commit(upload_id, digest)
+    assert path.endswith(f"{digest}.pdf")
+    assert sha == digest and dup is False
+    assert open(path, "rb").read() == data
+
+    # Same bytes again are recognised as a duplicate and not stored twice
+    second = store.begin("copy.pdf")
+    store.write(second, 0, data)
+    assert store.commit(second, digest) == (path, digest, True)
+    assert store.find(digest, "other.pdf") == path
+    assert sorted(os.listdir(tmp_path / "store")) == [f"{digest}.pdf"]
+
+
+def test_upload_session_rejects_bad_chunks_and_checksums(tmp_path):
+    from upload_sessions import UploadSessionStore
+
+    store = UploadSessionStore(str(tmp_path))
+    upload_id = store.begin("a.txt")
+    store.write(upload_id, 0, b"abc")
+    with pytest.raises(ValueError):
+        store.write(upload_id, 0, b"abc")
+    with pytest.raises(ValueError):
+        store.commit(upload_id, "0" * 64)
+    # Failed commits leave nothing behind
+    assert os.listdir(tmp_path) == []
+    with pytest.raises(KeyError):
+        store.write(upload_id, 3, b"d")
+
+
+def test_streamed_upload_round_trip(tmp_path, monkeypatch):
+    import types
+    import flask_server as fs
+    from upload_sessions import UploadSessionStore
+
+    indexed = []
+    monkeypatch.setattr(srv, "upload_store", UploadSessionStore(str(tmp_path / "store")))
+    monkeypatch.setattr(srv, "upload_file", lambda path: indexed.append(path) or True)
+    # Stand-in for the BaseManager client: calls the RPC functions directly
+    mgr = types.SimpleNamespace(
+        begin_upload=srv.begin_upload,
+        write_chunk=srv.write_chunk,
+        commit_upload=srv.commit_upload,
+        abort_upload=srv.abort_upload,
+    )
+    source = tmp_path / "lease.txt"
+    source.write_bytes(os.urandom(10_000))
+
+    result = fs.stream_file_to_index_server(mgr, str(source), chunk_size=1024)
+    assert result["status"] == "success"
+    assert result["deduplicated"] is False
+    assert open(result["path"], "rb").read() == source.read_bytes()
+    assert indexed == [result["path"]]
+
+    # Second send is skipped after the hash handshake and not re-indexed
+    again = fs.stream_file_to_index_server(mgr, str(source), chunk_size=1024)
+    assert again["deduplicated"] is True
+    assert len(indexed) == 1
+
+
+def _commit_bytes(data, name="lease.txt"):
+    import hashlib
+    digest = hashlib.sha256(data).hexdigest()
+    session = srv.begin_upload(name, len(data), digest)
+    if session["deduplicated"]:
+        return session
+    srv.write_chunk(session["upload_id"], 0, data)
+    return srv.commit_upload(session["upload_id"], digest)
+
+
+def test_stored_but_unindexed_content_is_indexed_by_the_next_upload(tmp_path, monkeypatch):
+    from upload_sessions import UploadSessionStore
+
+    monkeypatch.setattr(srv, "upload_store", UploadSessionStore(str(tmp_path / "store")))
+    # Simulate a crash between storing the content and indexing it
+    crashed = srv.upload_store.begin("lease.txt")
+    srv.upload_store.write(crashed, 0, b"lease body")
+    path, digest, _ = srv.upload_store.commit(crashed)
+
+    indexed = []
+    monkeypatch.setattr(srv, "upload_file", lambda p: indexed.append(p) or True)
+    result = _commit_bytes(b"lease body")
+    assert result["status"] == "success" and result["deduplicated"] is False
+    assert indexed == [path]
+    assert _commit_bytes(b"lease body")["deduplicated"] is True
+    assert indexed == [path]
+
+
+def test_failed_indexing_keeps_shared_content_for_a_concurrent_commit(tmp_path, monkeypatch):
+    from upload_sessions import UploadSessionStore
+
+    monkeypatch.setattr(srv, "upload_store", UploadSessionStore(str(tmp_path / "store")))
+    data = b"shared lease"
+    first_started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def upload_file(path):
+        calls.append(path)
+        if len(calls) == 1:
+            # The first commit's indexing fails while the second commit waits
+            first_started.set()
+            release.wait(5)
+            return False
+        return os.path.exists(path)
+
+    monkeypatch.setattr(srv, "upload_file", upload_file)
+    results = {}
+    first = threading.Thread(target=lambda: results.setdefault("first", _commit_bytes(data)))
+    first.start()
+    assert first_started.wait(5)
+    second = threading.Thread(target=lambda: results.setdefault("second", _commit_bytes(data)))
+    second.start()
+    time.sleep(0.1)
+    release.set()
+    first.join()
+    second.join()
+
+    assert results["first"]["status"] == "failed"
+    # The second session does not dedupe against content that was never indexed
+    assert results["second"]["status"] == "success" and results["second"]["deduplicated"] is False
+    assert len(calls) == 2 and os.path.exists(calls[0])
+    assert srv.upload_store.is_indexed(results["second"]["sha256"])
+
+
+def test_shard_owns_only_the_files_the_ring_routes_to_it(tmp_path, monkeypatch):
+    from index_manifest import file_md5
+    from index_shards import HashRing
+
+    monkeypatch.setenv("INDEX_SERVER_SHARDS", "127.0.0.1:5602,127.0.0.1:5603")
+    monkeypatch.setenv("INDEX_SHARD_ID", "127.0.0.1:5603")
+    shard_id, ring = srv._load_shard_config()
+    assert shard_id == "127.0.0.1:5603"
+    monkeypatch.setattr(srv, "INDEX_SHARD_ID", shard_id)
+    monkeypatch.setattr(srv, "shard_ring", ring)
+
+    # Same ring and routing key (content MD5) as Flask's ShardedIndexClient
+    flask_ring = HashRing(["127.0.0.1:5602", "127.0.0.1:5603"])
+    owned = []
+    for i in range(20):
+        f = tmp_path / f"{i}.txt"
+        f.write_text(f"lease {i}")
+        assert srv.owns_file(str(f)) == (flask_ring.get(file_md5(str(f))) == shard_id)
+        owned.append(srv.owns_file(str(f)))
+    assert any(owned) and not all(owned)
+
+    monkeypatch.setenv("INDEX_SHARD_ID", "10.0.0.9:5602")
+    with pytest.raises(RuntimeError):
+        srv._load_shard_config()
+    monkeypatch.delenv("INDEX_SERVER_SHARDS")
+    assert srv._load_shard_config() == (None, None)
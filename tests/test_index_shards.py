@@ -0,0 +1,107 @@
+import threading
+from multiprocessing.managers import BaseManager
+
+from index_shards import HashRing, ShardedIndexClient, merge_top_k, parse_shard_endpoints
+
+AUTHKEY = b"shard-test-key-0123456789"
+RPC_NAMES = ("upload_file", "retrieve")
+
+
+def test_parse_shard_endpoints():
+    assert parse_shard_endpoints("10.0.0.1:5602, 5603") == [("10.0.0.1", 5602), ("127.0.0.1", 5603)]
+
+
+def test_hash_ring_moves_only_a_proportional_slice():
+    keys = [f"doc-{i}" for i in range(5000)]
+    ring = HashRing(["a", "b", "c", "d"])
+    before = {k: ring.get(k) for k in keys}
+
+    # Every shard gets a reasonable share
+    counts = {n: list(before.values()).count(n) for n in ring.nodes}
+    assert min(counts.values()) > len(keys) / 4 * 0.6
+
+    ring.add("e")
+    after_add = {k: ring.get(k) for k in keys}
+    moved = [k for k in keys if before[k] != after_add[k]]
+    assert all(after_add[k] == "e" for k in moved)
+    assert 0.1 < len(moved) / len(keys) < 0.3
+
+    ring.remove("e")
+    assert {k: ring.get(k) for k in keys} == before
+
+    ring.remove("b")
+    after_remove = {k: ring.get(k) for k in keys}
+    assert all(before[k] == "b" for k in keys if before[k] != after_remove[k])
+
+
+def test_merge_top_k_orders_by_score():
+    merged = merge_top_k([[{"text": "a", "score": 0.2}, {"text": "b", "score": 0.9}],
+                          [{"text": "c", "score": 0.5}, {"text": "d", "score": None}]], 3)
+    assert [r["text"] for r in merged] == ["b", "c", "a"]
+
+
+def test_merge_top_k_keeps_one_copy_of_a_chunk_returned_by_several_shards():
+    chunk = {"text": "Base rent is $4,668.25", "metadata": {"content_sha256": "abc"}}
+    shard_a = [{**chunk, "node_id": "a-1", "score": 0.8}, {"node_id": "n2", "text": "Term", "score": 0.5}]
+    # Shard B indexed the same content (its own node id) and shares an untagged node
+    shard_b = [{**chunk, "node_id": "b-7", "score": 0.9}, {"node_id": "n2", "text": "Term", "score": 0.3},
+               {"node_id": "n3", "text": "Deposit", "score": 0.1}]
+    merged = merge_top_k([shard_a, shard_b], 3)
+    assert [(r["node_id"], r["score"]) for r in merged] == [("b-7", 0.9), ("n2", 0.5), ("n3", 0.1)]
+
+
+def _start_shard(name, uploads):
+    """Run a BaseManager server with fake index RPCs on an ephemeral port"""
+    shard_manager = type(f"Shard{name}", (BaseManager,), {})
+    shard_manager.register("upload_file", lambda path: uploads.append(path) or True)
+    shard_manager.register("retrieve", lambda text, top_k: [
+        {"text": f"{name}-{i}", "score": score} for i, score in enumerate([0.9, 0.4] if name == "A" else [0.7, 0.6])
+    ][:top_k])
+    server = shard_manager(("127.0.0.1", 0), AUTHKEY).get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.address
+
+
+def _connect(host, port):
+    client_manager = type("ShardClient", (BaseManager,), {})
+    for rpc in RPC_NAMES:
+        client_manager.register(rpc)
+    manager = client_manager((host, port), AUTHKEY)
+    manager.connect()
+    return manager
+
+
+def test_sharded_client_routes_uploads_and_merges_retrieval():
+    uploads = {"A": [], "B": []}
+    endpoints = [_start_shard("A", uploads["A"]), _start_shard("B", uploads["B"])]
+    client = ShardedIndexClient(endpoints, _connect, pool_size=2)
+
+    paths = [f"/docs/{i}.pdf" for i in range(20)]
+    for path in paths:
+        with client.connection(path) as mgr:
+            assert mgr.upload_file(path)
+
+    # Each document went to exactly the shard that owns its key
+    names = {f"{host}:{port}": shard for (host, port), shard in zip(endpoints, "AB")}
+    for path in paths:
+        assert path in uploads[names[client.shard_for(path)]]
+    assert len(uploads["A"]) + len(uploads["B"]) == len(paths)
+    assert uploads["A"] and uploads["B"]
+
+    results = client.fan_out(lambda mgr: mgr.retrieve("rent", 2)._getvalue())
+    assert all(ok for ok, _ in results.values())
+    merged = merge_top_k([value for _, value in results.values()], 3)
+    assert [r["text"] for r in merged] == ["A-0", "B-0", "B-1"]
+
+
+def test_fan_out_reports_failed_shards_without_hiding_others():
+    def connect(host, port):
+        if port == 2:
+            raise ConnectionRefusedError("shard down")
+        return object()
+
+    client = ShardedIndexClient([("h", 1), ("h", 2)], connect)
+    results = client.fan_out(lambda mgr: "ok")
+    assert results["h:1"] == (True, "ok")
+    ok, error = results["h:2"]
+    assert ok is False and isinstance(error, ConnectionRefusedError)
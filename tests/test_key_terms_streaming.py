@@ -0,0 +1,443 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import types
+
+import key_terms_extractor as kte
+
+VALID_JSON = """{"property_info": {"property_address": "1 Main St", "landlord_name": "Acme LP"},
+"tenant_info": {"tenant": "Widgets Inc", "suite_number": "100", "leased_sqft": 1200.0},
+"lease_dates": {"lease_commencement_date": "2020-01-01", "lease_expiration_date": "2023-01-01", "lease_term": "3 years"},
+"financial_terms": {"base_rent": 1000.0, "security_deposit": 2000.0, "expense_recovery_type": "Net",
+"renewal_options": null, "free_rent_months": null}}"""
+
+
+def _stub_extractor(monkeypatch, tokens, structured_text=VALID_JSON):
+    extractor = kte.KeyTermsExtractor()
+    extractor.initialized = True
+    extractor.parsed = []
+    extractor.parse_document = lambda path: extractor.parsed.append(path) or ["doc"]
+    extractor.indexed = []
+    extractor.rag_pipeline = types.SimpleNamespace(
+        index_documents=lambda path, documents, content_sha256: extractor.indexed.append((path, documents, content_sha256)) or True,
+        wait_for_documents=lambda documents, timeout: True)
+    engine = types.SimpleNamespace(query=lambda q: types.SimpleNamespace(response_gen=iter(tokens)))
+    extractor.query_filters = []
+    index = types.SimpleNamespace(as_query_engine=lambda streaming, filters: extractor.query_filters.append(filters) or engine)
+    extractor.llama_manager = types.SimpleNamespace(get_index=lambda: index)
+    # Stream the structured output a few characters at a time
+    llm = types.SimpleNamespace(stream_complete=lambda prompt: (
+        types.SimpleNamespace(delta=structured_text[i:i + 7]) for i in range(0, len(structured_text), 7)
+    ))
+    monkeypatch.setattr(kte, "Settings", types.SimpleNamespace(llm=llm))
+    monkeypatch.setattr(kte, "file_sha256", lambda path: f"sha256-of-{path}")
+    return extractor
+
+
+def test_stream_document_yields_stages_tokens_then_result(monkeypatch):
+    extractor = _stub_extractor(monkeypatch, ["Base ", "rent ", "is $1000."])
+    events = list(extractor.stream_document("lease.pdf"))
+
+    stages = [(e["stage"], e["status"]) for e in events if e["event"] == "stage"]
+    assert stages == [(s, status) for s in kte.STAGES for status in ("started", "completed")]
+
+    kinds = [e["event"] for e in events]
+    tokens = [e["text"] for e in events if e["event"] == "token"]
+    assert tokens == ["Base ", "rent ", "is $1000."]
+    # Tokens arrive inside the summarize stage, the result comes last
+    first_token = kinds.index("token")
+    assert (events[first_token - 1]["stage"], events[first_token - 1]["status"]) == ("summarize", "started")
+    assert events[-1]["event"] == "result"
+    assert events[-1]["result"]["status"] == "success"
+    assert events[-1]["result"]["data"]["tenant_info"]["tenant"] == "Widgets Inc"
+
+    # The document is parsed once and the parsed documents are indexed directly
+    assert extractor.parsed == ["lease.pdf"]
+    assert extractor.indexed == [("lease.pdf", ["doc"], "sha256-of-lease.pdf")]
+    assert set(events[-1]["result"]["extraction_metadata"]["stage_seconds"]) == set(kte.STAGES)
+
+    # Retrieval is scoped to this document's content hash
+    [filters] = extractor.query_filters
+    assert [(f.key, f.value) for f in filters.filters] == [("content_sha256", "sha256-of-lease.pdf")]
+
+
+def test_stream_document_emits_validated_fields_before_result(monkeypatch):
+    extractor = _stub_extractor(monkeypatch, ["ok"], structured_text=VALID_JSON.replace('"2023-01-01"', '"soon"'))
+    events = list(extractor.stream_document("lease.pdf"))
+
+    fields = {e["path"]: e for e in events if e["event"] == "field"}
+    assert fields["tenant_info.tenant"] == {"event": "field", "path": "tenant_info.tenant", "value": "Widgets Inc", "valid": True}
+    assert fields["financial_terms.base_rent"]["value"] == 1000.0
+    assert fields["lease_dates.lease_expiration_date"]["valid"] is False
+
+    sections = {e["section"]: e["valid"] for e in events if e["event"] == "section"}
+    assert sections == {"property_info": True, "tenant_info": True, "lease_dates": False, "financial_terms": True}
+
+    # Fields arrive in document order, each before its section and all before the result
+    kinds = [e["event"] for e in events]
+    paths = [e["path"] for e in events if e["event"] == "field"]
+    assert paths[:2] == ["property_info.property_address", "property_info.landlord_name"]
+    assert kinds.index("field") < kinds.index("section") < kinds.index("result")
+
+
+def test_single_pass_mode_structures_retrieved_nodes_in_one_call(monkeypatch):
+    extractor = _stub_extractor(monkeypatch, [])
+    retrieved = []
+    nodes = [types.SimpleNamespace(get_content=lambda text=text: text) for text in ("Rent is $1000.", "Tenant: Widgets Inc")]
+    index = types.SimpleNamespace(as_retriever=lambda similarity_top_k, filters: types.SimpleNamespace(
+        retrieve=lambda q: retrieved.append((similarity_top_k, filters.filters[0].value)) or nodes))
+    extractor.llama_manager = types.SimpleNamespace(get_index=lambda: index)
+    calls = []
+
+    def structured_predict(output_cls, prompt, context):
+        calls.append(context)
+        return output_cls.model_validate_json(VALID_JSON)
+
+    monkeypatch.setattr(kte, "Settings", types.SimpleNamespace(llm=types.SimpleNamespace(structured_predict=structured_predict)))
+    events = list(extractor.stream_document("lease.pdf", extraction_mode="single_pass"))
+
+    assert retrieved == [(kte.KEY_TERMS_TOP_K, "sha256-of-lease.pdf")]
+    assert calls == ["Rent is $1000.\n\nTenant: Widgets Inc"]
+    stages = [e["stage"] for e in events if e["event"] == "stage" and e["status"] == "started"]
+    assert stages == ["parse", "index", "retrieve", "structure"]
+    assert {e["path"] for e in events if e["event"] == "field"} >= {"tenant_info.tenant", "financial_terms.base_rent"}
+    result = events[-1]["result"]
+    assert result["status"] == "success"
+    assert result["data"]["financial_terms"]["base_rent"] == 1000.0
+    assert result["extraction_metadata"]["extraction_mode"] == "single_pass"
+
+
+def _sectioned_extractor(monkeypatch, delay, fail_section=None):
+    extractor = _stub_extractor(monkeypatch, [])
+    retrieved = []
+
+    def as_retriever(similarity_top_k, filters):
+        async def aretrieve(query):
+            retrieved.append((query, similarity_top_k, filters.filters[0].value))
+            await asyncio.sleep(delay)
+            return [types.SimpleNamespace(get_content=lambda: query)]
+        return types.SimpleNamespace(aretrieve=aretrieve)
+
+    extractor.llama_manager = types.SimpleNamespace(get_index=lambda: types.SimpleNamespace(as_retriever=as_retriever))
+    sections = json.loads(VALID_JSON)
+
+    async def astructured_predict(output_cls, prompt, section, context):
+        await asyncio.sleep(delay)
+        key = section.replace(" ", "_")
+        if key == fail_section:
+            raise RuntimeError(f"{section} failed")
+        assert context == kte.SECTION_QUERIES[key]
+        return output_cls.model_validate(sections[key])
+
+    monkeypatch.setattr(kte, "Settings", types.SimpleNamespace(llm=types.SimpleNamespace(astructured_predict=astructured_predict)))
+    return extractor, retrieved
+
+
+def test_sectioned_mode_runs_section_sub_queries_concurrently(monkeypatch):
+    extractor, retrieved = _sectioned_extractor(monkeypatch, delay=0.2)
+    events = list(extractor.stream_document("lease.pdf", extraction_mode="sectioned"))
+
+    result = events[-1]["result"]
+    assert result["status"] == "success"
+    assert result["data"] == kte.LeaseSummary.model_validate_json(VALID_JSON).model_dump(mode="json")
+    # One small, document-scoped retrieval per section
+    assert sorted(q for q, _, _ in retrieved) == sorted(kte.SECTION_QUERIES.values())
+    assert {(top_k, sha) for _, top_k, sha in retrieved} == {(kte.KEY_TERMS_SECTION_TOP_K, "sha256-of-lease.pdf")}
+    # Four sections of 0.4s each finish together rather than back to back
+    metadata = result["extraction_metadata"]
+    assert metadata["extraction_mode"] == "sectioned"
+    assert set(metadata["section_seconds"]) == set(kte.SECTION_QUERIES)
+    assert metadata["stage_seconds"]["structure"] < 1.2
+
+    stages = [e["stage"] for e in events if e["event"] == "stage" and e["status"] == "started"]
+    assert stages == ["parse", "index", "structure"]
+    assert sorted(e["section"] for e in events if e["event"] == "section") == sorted(kte.SECTION_QUERIES)
+
+
+def test_sectioned_mode_reports_a_failed_section_as_error(monkeypatch):
+    extractor, _ = _sectioned_extractor(monkeypatch, delay=0, fail_section="lease_dates")
+    result = extractor.process_document("lease.pdf", extraction_mode="sectioned")
+    assert result["status"] == "error"
+    assert "lease dates failed" in result["message"]
+
+
+def test_unknown_extraction_mode_is_an_error(monkeypatch):
+    extractor = _stub_extractor(monkeypatch, [])
+    result = extractor.process_document("lease.pdf", extraction_mode="three_step")
+    assert result["status"] == "error"
+    assert "three_step" in result["message"]
+
+
+def test_benchmark_single_pass_makes_one_llm_call():
+    from benchmark_extraction_modes import run_benchmark
+    results = run_benchmark(runs=1, call_latency=0, token_latency=0)
+    assert results["two_step"]["llm_calls"] == 2
+    assert results["single_pass"]["llm_calls"] == 1
+    assert results["sectioned"]["llm_calls"] == len(kte.SECTION_QUERIES)
+    assert results["two_step"]["statuses"] == results["single_pass"]["statuses"] == results["sectioned"]["statuses"] == ["success"]
+
+
+def test_shared_extractor_builds_heavy_components_once_under_concurrency(monkeypatch):
+    built = []
+
+    def slow_component(kind):
+        def factory():
+            time.sleep(0.05)
+            built.append(kind)
+            return types.SimpleNamespace(kind=kind, initialize_index=lambda: True)
+        return factory
+
+    monkeypatch.setattr(kte, "RAGPipeline", slow_component("rag"))
+    monkeypatch.setattr(kte, "LlamaCloudManager", slow_component("cloud"))
+    monkeypatch.setattr(kte, "_shared_extractor", None)
+    # Constructing the extractor itself is cheap
+    kte.KeyTermsExtractor()
+    assert built == []
+
+    seen = []
+    barrier = threading.Barrier(16)
+
+    def request():
+        barrier.wait()
+        extractor = kte.get_key_terms_extractor()
+        extractor.ensure_initialized()
+        seen.append((extractor, extractor.rag_pipeline, extractor.llama_manager))
+
+    threads = [threading.Thread(target=request) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(seen) == 16
+    assert len({tuple(map(id, components)) for components in seen}) == 1
+    assert sorted(built) == ["cloud", "rag"]
+
+
+def test_shared_extractor_reuses_the_callers_llama_manager(monkeypatch):
+    monkeypatch.setattr(kte, "LlamaCloudManager", lambda: (_ for _ in ()).throw(AssertionError("second manager built")))
+    monkeypatch.setattr(kte, "_shared_extractor", None)
+    manager = types.SimpleNamespace(get_index=lambda: None)
+
+    extractor = kte.get_key_terms_extractor(llama_manager=manager)
+    assert extractor.llama_manager is manager
+    assert kte.get_key_terms_extractor() is extractor
+
+
+def test_process_document_returns_final_result(monkeypatch):
+    extractor = _stub_extractor(monkeypatch, ["ok"], structured_text="not json")
+    result = extractor.process_document("lease.pdf")
+    assert result["status"] == "partial"
+    assert result["data"]["raw_extraction"] == "not json"
+
+
+def test_structure_response_recovers_nested_json_from_messy_output():
+    data = json.loads(VALID_JSON)
+    data["financial_terms"]["rent_escalations"] = {"rent_schedule": [{
+        "start_date": "2021-01-01", "duration": {"years": 1}, "rent_type": "Base",
+        "units": "$/SF/Year", "amount": 30.5, "uplift": {"min": 2.0, "max": 4.0}}]}
+    # Fenced, with a trailing comma and a cut-off note after the object
+    text = "Here you go:\n```json\n" + json.dumps(data, indent=2)[:-1] + ",}\n```\nNote: {the rent"
+    result = kte.KeyTermsExtractor()._structure_response(text, "lease.pdf")
+    assert result["status"] == "success"
+    [entry] = result["data"]["financial_terms"]["rent_escalations"]["rent_schedule"]
+    assert entry["amount"] == 30.5 and entry["uplift"]["max"] == 4.0
+
+
+def test_stream_document_reports_failures_as_error_result(monkeypatch):
+    extractor = _stub_extractor(monkeypatch, [])
+    extractor.rag_pipeline = types.SimpleNamespace(index_documents=lambda path, documents, content_sha256: False)
+    events = list(extractor.stream_document("lease.pdf"))
+    assert events[-1]["result"]["status"] == "error"
+    assert "Failed to index" in events[-1]["result"]["message"]
+
+
+def test_retrieval_waits_until_the_upserted_document_is_ingested(monkeypatch):
+    extractor = _stub_extractor(monkeypatch, [])
+    ingested = threading.Event()
+    # Until LlamaCloud finishes ingesting, the filtered retrieval matches nothing
+    nodes = [types.SimpleNamespace(get_content=lambda: "Tenant: Widgets Inc")]
+    retrievals = []
+    index = types.SimpleNamespace(as_retriever=lambda similarity_top_k, filters: types.SimpleNamespace(
+        retrieve=lambda q: retrievals.append(ingested.is_set()) or (nodes if ingested.is_set() else [])))
+    extractor.llama_manager = types.SimpleNamespace(get_index=lambda: index)
+    extractor.rag_pipeline.wait_for_documents = lambda documents, timeout: ingested.set() or True
+    contexts = []
+
+    def structured_predict(output_cls, prompt, context):
+        contexts.append(context)
+        return output_cls.model_validate_json(VALID_JSON)
+
+    monkeypatch.setattr(kte, "Settings", types.SimpleNamespace(llm=types.SimpleNamespace(structured_predict=structured_predict)))
+    events = list(extractor.stream_document("lease.pdf", extraction_mode="single_pass"))
+
+    assert retrievals == [True]
+    assert contexts == ["Tenant: Widgets Inc"]
+    assert events[-1]["result"]["extraction_metadata"]["retrieved_nodes"] == 1
+
+
+def test_document_still_indexing_is_an_error(monkeypatch):
+    extractor = _stub_extractor(monkeypatch, ["never"])
+    extractor.rag_pipeline.wait_for_documents = lambda documents, timeout: False
+    events = list(extractor.stream_document("lease.pdf"))
+
+    assert extractor.query_filters == []
+    assert events[-1]["result"]["status"] == "error"
+    assert "still indexing" in events[-1]["result"]["message"]
+
+
+def test_stream_key_terms_sends_tokens_before_extraction_finishes(client, sample_text_file, mocker):
+    release = threading.Event()
+
+    class SlowExtractor:
+        def stream_document(self, file_path, extraction_mode=None):
+            yield {"event": "stage", "stage": "summarize", "status": "started", "message": "Summarizing"}
+            yield {"event": "token", "stage": "summarize", "text": "Base rent"}
+            # The rest of the extraction only runs once the client has seen the token
+            assert release.wait(5)
+            yield {"event": "result", "result": {"status": "success", "data": {"ok": True}, "extraction_metadata": {}}}
+
+    mocker.patch("flask_server.get_key_terms_extractor", lambda **components: SlowExtractor())
+    resp = client.get(f"/stream-key-terms?filename={os.path.basename(sample_text_file)}", buffered=False)
+    assert resp.mimetype == "text/event-stream"
+
+    received = ""
+    chunks = iter(resp.response)
+    while "event: token" not in received:
+        received += next(chunks).decode()
+    assert "event: complete" not in received
+    assert '"stage": "summarize"' in received
+
+    release.set()
+    received += "".join(chunk.decode() for chunk in chunks)
+    assert received.index("event: token") < received.index("event: complete")
+
+
+def test_reconnect_with_last_event_id_replays_instead_of_restarting(client, sample_text_file, mocker):
+    release = threading.Event()
+    runs = []
+
+    class SlowExtractor:
+        def stream_document(self, file_path, extraction_mode=None):
+            runs.append(file_path)
+            yield {"event": "token", "stage": "summarize", "text": "Base rent"}
+            assert release.wait(5)
+            yield {"event": "token", "stage": "summarize", "text": " is $1000"}
+            yield {"event": "result", "result": {"status": "success", "data": {"ok": True}, "extraction_metadata": {}}}
+
+    mocker.patch("flask_server.get_key_terms_extractor", lambda **components: SlowExtractor())
+    url = f"/stream-key-terms?filename={os.path.basename(sample_text_file)}"
+    resp = client.get(url, buffered=False)
+
+    received = ""
+    chunks = iter(resp.response)
+    while "event: token" not in received:
+        received += next(chunks).decode()
+    # Drop the connection after the first token
+    resp.close()
+    last_id = [line[4:] for line in received.splitlines() if line.startswith("id: ")][-1]
+
+    release.set()
+    resumed = client.get(url, headers={"Last-Event-ID": last_id}).get_data(as_text=True)
+    assert len(runs) == 1
+    assert "event: connected" not in resumed
+    assert "Base rent" not in resumed and " is $1000" in resumed
+    assert "event: complete" in resumed
+    job_id, _, seq = last_id.rpartition(":")
+    assert f"id: {job_id}:{int(seq) + 1}" in resumed
+
+
+def test_idle_stream_sends_heartbeats(client, sample_text_file, mocker):
+    release = threading.Event()
+
+    class SlowExtractor:
+        def stream_document(self, file_path, extraction_mode=None):
+            assert release.wait(5)
+            yield {"event": "result", "result": {"status": "success", "data": {}, "extraction_metadata": {}}}
+
+    mocker.patch("flask_server.get_key_terms_extractor", lambda **components: SlowExtractor())
+    mocker.patch("flask_server.KEY_TERMS_STREAM_HEARTBEAT", 0.05)
+    resp = client.get(f"/stream-key-terms?filename={os.path.basename(sample_text_file)}", buffered=False)
+    received = ""
+    chunks = iter(resp.response)
+    while ": heartbeat" not in received:
+        received += next(chunks).decode()
+    release.set()
+    received += "".join(chunk.decode() for chunk in chunks)
+    assert "event: complete" in received
+
+
+def _sse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if "event" in lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_batch_stream_interleaves_documents_with_bounded_concurrency(client, temp_upload_dir, mocker):
+    names = [f"lease_{i}.txt" for i in range(4)]
+    for name in names:
+        with open(os.path.join(temp_upload_dir, name), "w") as f:
+            f.write("lease")
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    class CountingExtractor:
+        def stream_document(self, file_path, extraction_mode=None):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            try:
+                yield {"event": "token", "stage": "summarize", "text": os.path.basename(file_path)}
+                time.sleep(0.05)
+                if file_path.endswith("lease_3.txt"):
+                    yield {"event": "result", "result": {"status": "error", "message": "bad scan"}}
+                else:
+                    yield {"event": "result", "result": {"status": "success", "data": {"f": file_path}, "extraction_metadata": {}}}
+            finally:
+                with lock:
+                    running[0] -= 1
+
+    mocker.patch("flask_server.get_key_terms_extractor", lambda **components: CountingExtractor())
+    mocker.patch("flask_server.KEY_TERMS_BATCH_CONCURRENCY", 2)
+    resp = client.post("/stream-key-terms/batch", json={"filenames": names + ["missing.txt"]})
+    assert resp.mimetype == "text/event-stream"
+    events = _sse_events(resp.get_data(as_text=True))
+
+    assert peak[0] == 2
+    assert events[0][0] == "connected"
+    name, summary = events[-1]
+    assert name == "batch_complete" and summary["status"] == "complete"
+    assert sorted(summary["completed"]) == names[:3]
+    assert sorted(summary["failed"]) == ["lease_3.txt", "missing.txt"]
+
+    # Every per-document event is tagged, and each document's token precedes its result
+    per_doc = events[1:-1]
+    assert all("document" in data for _, data in per_doc)
+    for name in names[:3]:
+        kinds = [kind for kind, data in per_doc if data["document"] == name]
+        assert kinds == ["document_started", "progress", "token", "complete"]
+
+
+def test_batch_stream_requires_filenames(client):
+    events = _sse_events(client.get("/stream-key-terms/batch").get_data(as_text=True))
+    assert events == [("error", {"status": "error", "error": "No filenames provided", "is_complete": True})]
+
+
+def test_key_terms_endpoints_reject_unknown_mode(client, sample_text_file, mocker):
+    extractor = mocker.patch("flask_server.get_key_terms_extractor")
+    filename = os.path.basename(sample_text_file)
+    with open(sample_text_file, "rb") as f:
+        resp = client.post("/extract-key-terms", data={"file": (f, filename), "mode": "three_step"},
+                           content_type="multipart/form-data")
+    assert resp.status_code == 400
+    assert "sectioned" in resp.get_json()["error"]
+
+    assert client.get(f"/stream-key-terms?filename={filename}&mode=three_step").status_code == 400
+    assert client.get(f"/stream-key-terms/batch?filename={filename}&mode=three_step").status_code == 400
+    assert client.post("/stream-key-terms/batch", json={"filenames": [filename], "mode": "three_step"}).status_code == 400
+    extractor.assert_not_called()
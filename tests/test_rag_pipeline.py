@@ -80,3 +80,254 @@ def test_rag_background_indexing_handles_missing_dir(capsys):
     pipeline.background_index_existing_documents()
     out = capsys.readouterr().out
     assert "Upload directory" in out or out == ""
+
+
+def test_rag_handle_file_uploads_batches_and_isolates_failures(monkeypatch, tmp_path):
+    class DummyIndex:
+        def as_retriever(self):
+            return types.SimpleNamespace(retrieve=lambda q: [])
+        def as_query_engine(self):
+            return types.SimpleNamespace(query=lambda q: "")
+    monkeypatch.setattr(rp, 'LlamaCloudIndex', lambda **kwargs: DummyIndex())
+
+    pipeline = rp.RAGPipeline()
+    paths = []
+    for name in ("a.txt", "b.txt", "bad.txt"):
+        f = tmp_path / name
+        f.write_text(name)
+        paths.append(str(f))
+
+    def fake_reader(*a, input_files=None, **k):
+        doc = types.SimpleNamespace(to_cloud_document=lambda: {}, text=input_files[0])
+        return types.SimpleNamespace(load_data=lambda: [doc])
+    monkeypatch.setattr(rp, 'SimpleDirectoryReader', fake_reader)
+
+    upserts = []
+    def upsert(pipeline_id, request):
+        upserts.append(len(request))
+    pipeline.client = types.SimpleNamespace(pipelines=types.SimpleNamespace(upsert_batch_pipeline_documents=upsert))
+
+    def run(documents):
+        if any(d.text.endswith("bad.txt") for d in documents):
+            raise ValueError("bad document")
+        return list(documents)
+    pipeline.pipeline = types.SimpleNamespace(run=run)
+
+    results = pipeline.handle_file_uploads(paths)
+    assert results == {paths[0]: True, paths[1]: True, paths[2]: False}
+    # One batched upsert, then per-file retries after the batch failed
+    assert upserts[0] == 3
+
+
+def test_index_manifest_skips_unchanged_files(tmp_path):
+    from index_manifest import IndexManifest
+
+    f = tmp_path / "a.txt"
+    f.write_text("one")
+    manifest = IndexManifest(str(tmp_path / "manifest.json"))
+    digest = manifest.changed_digest(str(f))
+    assert digest is not None
+    manifest.record(str(f), digest, True)
+
+    # Reloaded from disk, unchanged content is skipped even after a touch
+    reloaded = IndexManifest(str(tmp_path / "manifest.json"))
+    os.utime(f, None)
+    assert reloaded.changed_digest(str(f)) is None
+    f.write_text("two")
+    assert reloaded.changed_digest(str(f)) not in (None, digest)
+
+
+def test_rag_background_indexing_is_incremental(tmp_path):
+    pipeline = rp.RAGPipeline()
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for name in ("a.txt", "b.pdf", "c.txt", "notes.md"):
+        (docs / name).write_text(name)
+    manifest_path = str(tmp_path / "manifest.json")
+
+    indexed = []
+    def index_file(path):
+        indexed.append(os.path.basename(path))
+        return not path.endswith("c.txt")
+
+    pipeline.background_index_existing_documents(str(docs), index_file=index_file, max_workers=2, manifest_path=manifest_path)
+    assert sorted(indexed) == ["a.txt", "b.pdf", "c.txt"]
+    progress = pipeline.get_status()["background_indexing"]
+    assert progress["state"] == "completed"
+    assert (progress["total"], progress["indexed"], progress["failed"], progress["pending"]) == (3, 2, 1, 0)
+
+    # Second run only retries the failure and picks up changed content
+    indexed.clear()
+    (docs / "a.txt").write_text("changed")
+    pipeline.background_index_existing_documents(str(docs), index_file=index_file, max_workers=2, manifest_path=manifest_path)
+    assert sorted(indexed) == ["a.txt", "c.txt"]
+    assert pipeline.get_background_progress()["skipped"] == 1
+
+
+def test_rag_uploads_are_recorded_in_the_manifest(monkeypatch, tmp_path):
+    monkeypatch.setattr(rp, 'LlamaCloudIndex', lambda **kwargs: types.SimpleNamespace())
+    pipeline = rp.RAGPipeline(manifest_path=str(tmp_path / "manifest.json"))
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for name in ("a.txt", "b.txt"):
+        (docs / name).write_text(name)
+
+    def fake_reader(*a, input_files=None, **k):
+        doc = types.SimpleNamespace(to_cloud_document=lambda: {}, text=input_files[0])
+        return types.SimpleNamespace(load_data=lambda: [doc])
+    monkeypatch.setattr(rp, 'SimpleDirectoryReader', fake_reader)
+    pipeline.client = types.SimpleNamespace(pipelines=types.SimpleNamespace(upsert_batch_pipeline_documents=lambda *a, **k: None))
+    pipeline.pipeline = types.SimpleNamespace(run=lambda documents: list(documents))
+
+    assert pipeline.handle_file_upload(str(docs / "a.txt")) is True
+
+    # Background indexing only picks up the file that was never uploaded
+    indexed = []
+    pipeline.background_index_existing_documents(
+        str(docs), index_file=lambda path: indexed.append(os.path.basename(path)) or True)
+    assert indexed == ["b.txt"]
+    assert pipeline.get_background_progress()["skipped"] == 1
+
+
+def test_index_manifest_prunes_deleted_files(tmp_path):
+    from index_manifest import IndexManifest
+
+    kept, deleted = tmp_path / "kept.txt", tmp_path / "deleted.txt"
+    kept.write_text("kept")
+    deleted.write_text("deleted")
+    manifest = IndexManifest(str(tmp_path / "manifest.json"))
+    for f in (kept, deleted):
+        manifest.record(str(f), manifest.changed_digest(str(f)), True)
+    deleted.unlink()
+
+    assert manifest.prune_missing() == 1
+    assert list(manifest.entries) == [str(kept)]
+
+
+def test_rag_background_indexing_saves_manifest_in_batches(monkeypatch, tmp_path):
+    from index_manifest import IndexManifest
+
+    pipeline = rp.RAGPipeline()
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(5):
+        (docs / f"{i}.txt").write_text(str(i))
+    saves = []
+    original_save = IndexManifest._save
+    monkeypatch.setattr(IndexManifest, "_save", lambda self: saves.append(len(self.entries)) or original_save(self))
+    monkeypatch.setattr(rp, "MANIFEST_SAVE_EVERY", 2)
+    manifest_path = str(tmp_path / "manifest.json")
+
+    pipeline.background_index_existing_documents(str(docs), index_file=lambda path: True, max_workers=1, manifest_path=manifest_path)
+    # After the scan, every second finished file, and once at the end
+    assert saves == [0, 2, 4, 5]
+    assert len(IndexManifest(manifest_path).entries) == 5
+
+
+def test_rag_background_indexing_only_indexes_owned_files(tmp_path):
+    pipeline = rp.RAGPipeline()
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for name in ("a.txt", "b.txt", "c.txt"):
+        (docs / name).write_text(name)
+
+    indexed = []
+    pipeline.background_index_existing_documents(
+        str(docs), index_file=lambda path: indexed.append(os.path.basename(path)) or True,
+        manifest_path=str(tmp_path / "manifest.json"), owns=lambda path: not path.endswith("b.txt"))
+    assert sorted(indexed) == ["a.txt", "c.txt"]
+    assert pipeline.get_background_progress()["total"] == 2
+
+
+def test_rag_shard_uses_its_own_cloud_pipeline(monkeypatch):
+    created = []
+
+    class DummyIndex:
+        def __init__(self, **kwargs):
+            raise AssertionError("a shard must not attach to the shared pipeline")
+
+        @staticmethod
+        def create_index(**kwargs):
+            created.append(kwargs["name"])
+            return types.SimpleNamespace(pipeline=types.SimpleNamespace(id="shard-pipeline-id"))
+
+    monkeypatch.setattr(rp, "LlamaCloudIndex", DummyIndex)
+    monkeypatch.delenv("LLAMA_CLOUD_PIPELINE_NAME", raising=False)
+    pipeline = rp.RAGPipeline(shard_id="127.0.0.1:5603")
+    assert pipeline.initialize_index() is True
+    assert created == [f"{rp.DEFAULT_PIPELINE_NAME}-shard-127-0-0-1-5603"]
+    assert pipeline.pipeline_id == "shard-pipeline-id"
+    assert rp.index_pipeline_name() == rp.DEFAULT_PIPELINE_NAME
+    assert rp.index_pipeline_name("127.0.0.1:5602") != rp.index_pipeline_name("127.0.0.1:5603")
+
+
+def test_rag_tags_ingested_documents_for_scoped_retrieval(monkeypatch, tmp_path):
+    pipeline = rp.RAGPipeline()
+    pipeline.initialized = True
+    upserted = []
+    pipeline.client = types.SimpleNamespace(pipelines=types.SimpleNamespace(
+        upsert_batch_pipeline_documents=lambda pipeline_id, request: upserted.extend(request)))
+    # Chunk without embedding so the produced nodes can be inspected
+    produced = []
+    splitter = rp.SentenceSplitter()
+    pipeline.pipeline = types.SimpleNamespace(run=lambda documents: produced.extend(splitter(documents)) or produced)
+    f = tmp_path / "lease.txt"
+    f.write_text("Base rent is $1,000 per month.")
+
+    assert pipeline.handle_file_upload(str(f)) is True
+    digest = rp.file_sha256(str(f))
+    assert upserted[0].metadata[rp.DOCUMENT_ID_KEY] == "lease.txt"
+    assert upserted[0].metadata[rp.CONTENT_HASH_KEY] == digest
+    # Tags reach the nodes but stay out of the embedded text
+    assert produced and all(n.metadata[rp.CONTENT_HASH_KEY] == digest for n in produced)
+    assert digest not in produced[0].get_content(metadata_mode="embed")
+
+    captured = {}
+    pipeline.index = types.SimpleNamespace(as_retriever=lambda similarity_top_k, filters: captured.update(filters=filters)
+                                           or types.SimpleNamespace(retrieve=lambda q: []))
+    pipeline.retrieve("rent", content_sha256=digest)
+    assert [(f.key, f.value) for f in captured["filters"].filters] == [(rp.CONTENT_HASH_KEY, digest)]
+
+
+def test_rag_index_documents_reuses_parsed_documents(monkeypatch, tmp_path):
+    pipeline = rp.RAGPipeline()
+    pipeline.initialized = True
+    upserted, ingested = [], []
+    pipeline.client = types.SimpleNamespace(pipelines=types.SimpleNamespace(
+        upsert_batch_pipeline_documents=lambda pipeline_id, request: upserted.extend(request)))
+    pipeline.pipeline = types.SimpleNamespace(run=lambda documents: ingested.extend(documents) or documents)
+    # The file must not be read again
+    monkeypatch.setattr(rp, 'SimpleDirectoryReader', None)
+    f = tmp_path / "lease.pdf"
+    f.write_bytes(b"%PDF parsed elsewhere")
+    parsed = [rp.Document(text="page one"), rp.Document(text="page two")]
+
+    assert pipeline.index_documents(str(f), parsed, content_sha256="abc") is True
+    assert ingested == parsed
+    assert [d.id_ for d in parsed] == [f"{f}_part_0", f"{f}_part_1"]
+    assert all(d.metadata[rp.CONTENT_HASH_KEY] == "abc" and d.metadata[rp.DOCUMENT_ID_KEY] == "lease.pdf" for d in upserted)
+    assert "abc" not in parsed[0].get_content(metadata_mode="embed")
+
+
+def test_rag_wait_for_documents_polls_until_ingested(monkeypatch):
+    pipeline = rp.RAGPipeline()
+    pipeline.pipeline_id = "pipe"
+    statuses = {"lease.pdf": ["NOT_STARTED", "IN_PROGRESS", "SUCCESS"]}
+    polled = []
+
+    def get_status(pipeline_id, document_id):
+        polled.append(document_id)
+        remaining = statuses["lease.pdf"]
+        return types.SimpleNamespace(status=remaining.pop(0) if len(remaining) > 1 else remaining[0])
+
+    pipeline.client = types.SimpleNamespace(pipelines=types.SimpleNamespace(get_pipeline_document_status=get_status))
+    documents = [rp.Document(text="page", id_="lease.pdf")]
+    assert pipeline.wait_for_documents(documents, timeout=5, poll_interval=0.01) is True
+    assert len(polled) == 3
+
+    statuses["lease.pdf"] = ["IN_PROGRESS"]
+    assert pipeline.wait_for_documents(documents, timeout=0.05, poll_interval=0.01) is False
+
+    statuses["lease.pdf"] = ["ERROR"]
+    with pytest.raises(RuntimeError):
+        pipeline.wait_for_documents(documents, timeout=5, poll_interval=0.01)
@@ -0,0 +1,77 @@
+import threading
+
+from stream_jobs import StreamJob, StreamJobRegistry, parse_event_id
+
+
+def _events(n, gate=None):
+    for i in range(n):
+        if gate is not None and i == n // 2:
+            gate.wait(5)
+        yield "progress", {"n": i}
+
+
+def _drain(job, after_id=0):
+    seen = []
+    while True:
+        events, missed, finished = job.read(after_id, timeout=2)
+        for event_id, (_, payload) in events:
+            seen.append((event_id, payload["n"]))
+            after_id = event_id
+        if finished:
+            return seen, missed
+
+
+def test_reader_resumes_from_last_event_id():
+    gate = threading.Event()
+    job = StreamJobRegistry().start(_events(10, gate))
+
+    first, _, _ = job.read(0, timeout=2)
+    assert [event_id for event_id, _ in first] == list(range(1, 6))
+
+    gate.set()
+    seen, missed = _drain(job, after_id=3)
+    assert missed == 0
+    assert seen == [(i, i - 1) for i in range(4, 11)]
+
+
+def test_read_reports_events_lost_from_the_buffer():
+    job = StreamJob("job", _events(10), buffer_size=4)
+    job.start()
+    seen, missed = _drain(job, after_id=2)
+    assert seen == [(7, 6), (8, 7), (9, 8), (10, 9)]
+    assert missed == 4
+
+
+def test_idle_read_times_out_without_events():
+    gate = threading.Event()
+    job = StreamJob("job", _events(2, gate))
+    job.start()
+    job.read(0, timeout=2)
+    events, missed, finished = job.read(job.last_id, timeout=0.05)
+    assert (events, missed, finished) == ([], 0, False)
+    gate.set()
+
+
+def test_producer_failure_ends_the_stream_with_an_error_event():
+    def broken():
+        yield "progress", {"n": 0}
+        raise RuntimeError("boom")
+
+    job = StreamJobRegistry().start(broken())
+    job._thread.join(5)
+    events, _, finished = job.read(0)
+    assert finished
+    assert [name for _, (name, _) in events] == ["progress", "error"]
+
+
+def test_finished_jobs_expire_after_ttl():
+    registry = StreamJobRegistry(ttl=0)
+    job = registry.start(_events(1))
+    _drain(job)
+    assert registry.get(job.job_id) is None
+
+
+def test_parse_event_id():
+    assert parse_event_id("abc123:42") == ("abc123", 42)
+    assert parse_event_id("42") == (None, 0)
+    assert parse_event_id(None) == (None, 0)
@@ -0,0 +1,145 @@
+import gc
+import json
+import random
+import time
+
+import pytest
+from pydantic import BaseModel
+
+from streaming_json import IncrementalJSONParser, RecoveringPydanticOutputParser, recover_json
+
+DOC = {
+    "tenant_info": {"tenant": "Café \"Blue\" LLC", "leased_sqft": 2394.5, "suite_number": "N/A"},
+    "financial_terms": {"base_rent": -1e3, "free_rent_months": None, "flags": [True, False, {"x": []}]},
+}
+
+
+def _feed_all(text, chunk_size):
+    parser = IncrementalJSONParser()
+    events = []
+    for i in range(0, len(text), chunk_size):
+        events.extend(parser.feed(text[i:i + chunk_size]))
+    return parser, events
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 1000])
+def test_chunking_does_not_change_result(chunk_size):
+    text = "Here is the JSON:\n```json\n" + json.dumps(DOC, indent=2) + "\n```\nDone."
+    parser, events = _feed_all(text, chunk_size)
+    assert parser.error is None and parser.done
+    assert parser.root == DOC
+    assert events[-1] == ((), DOC)
+    assert (("tenant_info", "tenant"), 'Café "Blue" LLC') in events
+    assert (("financial_terms", "flags", 2, "x"), []) in events
+
+
+def test_values_close_innermost_first_in_document_order():
+    _, events = _feed_all('{"a": {"b": 1, "c": [2, 3]}, "d": "e"}', 3)
+    assert [path for path, _ in events] == [
+        ("a", "b"), ("a", "c", 0), ("a", "c", 1), ("a", "c"), ("a",), ("d",), (),
+    ]
+
+
+def test_value_is_reported_as_soon_as_it_closes():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"tenant": "Acme') == []
+    assert parser.feed('"') == [(("tenant",), "Acme")]
+    # Numbers only close on the following delimiter
+    assert parser.feed(', "rent": 12') == []
+    assert parser.feed('50,') == [(("rent",), 1250)]
+
+
+@pytest.mark.parametrize("text", ['{"a": }', '{"a" 1}', '{"a": 1]', '{"a": tru}', '[1,, 2]'])
+def test_malformed_input_sets_error_and_stops(text):
+    parser, _ = _feed_all(text, 1)
+    assert parser.error
+    assert not parser.done
+    assert parser.feed('{"b": 1}') == []
+
+
+def test_close_completes_a_truncated_root():
+    parser, _ = _feed_all('{"a": {"b": [1, {"c": "x"}, 2', 4)
+    assert not parser.done and parser.error is None
+    # The unfinished number is dropped, every open container is closed
+    assert parser.close() == {"a": {"b": [1, {"c": "x"}]}}
+    assert parser.repaired
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('```json\n{"a": [1, 2,],}\n```', {"a": [1, 2]}),
+    ('{"a": 1, // the rent\n "b": 2}', {"a": 1, "b": 2}),
+    ('{"note": "two\nlines"}', {"note": "two\nlines"}),
+    ('Format: {like this}. Answer: {"a": 1}', {"a": 1}),
+    ('{"a": {"b": {"c": {"d": [1]}}}} and {"e": 2}', {"a": {"b": {"c": {"d": [1]}}}}),
+    ('{"a": 1, "b": {"c": "unterminat', {"a": 1, "b": {}}),
+    ('{"a": 1, "b": 2 "c": 3}', {"a": 1, "b": 2}),
+    ('[{"a": 1}, {"a": 2', [{"a": 1}, {}]),
+])
+def test_recover_json(text, expected):
+    assert recover_json(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "no json here", "Use {braces} {here}", '{"a": "never closed'])
+def test_recover_json_raises_when_nothing_is_recoverable(text):
+    with pytest.raises(ValueError):
+        recover_json(text)
+
+
+def test_recovering_output_parser_validates_model():
+    class Flag(BaseModel):
+        title: str
+
+    parser = RecoveringPydanticOutputParser(Flag)
+    assert parser.parse('Sure:\n```json\n{"title": "Early termination",}\n```') == Flag(title="Early termination")
+
+
+def _random_value(rng, depth=0):
+    kind = rng.randrange(7 if depth < 4 else 4)
+    if kind == 0:
+        return rng.choice([True, False, None])
+    if kind == 1:
+        return rng.choice([0, -7, 12.5, 1e-3, 2394])
+    if kind in (2, 3):
+        return "".join(rng.choice('ab "\\/{}[],:\n\té') for _ in range(rng.randrange(8)))
+    if kind in (4, 5):
+        return {f"k{i}": _random_value(rng, depth + 1) for i in range(rng.randrange(4))}
+    return [_random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+
+
+def test_fuzz_recovers_wrapped_documents_and_never_crashes():
+    rng = random.Random(1234)
+    for _ in range(300):
+        doc = {"root": _random_value(rng), "tail": [1]}
+        body = json.dumps(doc, indent=rng.choice([None, 2]), ensure_ascii=rng.random() < 0.5)
+        text = rng.choice(["", "Here:\n```json\n", "{not json} "]) + body + rng.choice(["", "\n```", " {trailing"])
+        assert recover_json(text) == doc
+
+        # Any truncation or corruption yields a value or ValueError, nothing else
+        cut = rng.randrange(len(text))
+        for broken in (text[:cut], text[:cut] + rng.choice("}],:\"x") + text[cut + 1:]):
+            try:
+                recover_json(broken)
+            except ValueError:
+                pass
+
+
+@pytest.mark.parametrize("unit", ["{", "[", "x{ ", '{"k": [', '{"a": 1, "b": 2 ', '{"s": "' + "z" * 50])
+def test_recovery_time_is_linear_on_large_malformed_input(unit):
+    def timed(size):
+        text = unit * (size // len(unit))
+        # Keep collections of the rest of the test session's heap out of the timing
+        gc.disable()
+        start = time.perf_counter()
+        try:
+            recover_json(text)
+        except ValueError:
+            pass
+        finally:
+            elapsed = time.perf_counter() - start
+            gc.enable()
+        return elapsed
+
+    small, large = timed(50_000), timed(200_000)
+    assert large < 5.0
+    # Four times the input should take about four times as long, not sixteen
+    assert large < 10 * max(small, 0.01)
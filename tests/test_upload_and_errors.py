@@ -1,7 +1,20 @@
 import io
 import json
 import os
+import types
+
 import pytest
+from multiprocessing.managers import BaseProxy
+
+
+class FakeProxy(BaseProxy):
+    """Stands in for the AutoProxy a BaseManager call returns (always truthy)"""
+
+    def __init__(self, value):
+        self._value = value
+
+    def _getvalue(self):
+        return self._value
 
 
 def test_upload_success(client, sample_text_file):
@@ -30,6 +43,13 @@ def test_index_endpoint_success_with_mock(client, sample_text_file, mock_index_s
     assert resp.status_code == 200
 
 
+def test_index_endpoint_reports_failure_behind_proxy(client, sample_text_file, mock_index_server):
+    mock_index_server.upload_file.return_value = FakeProxy(False)
+    resp = client.post('/index', json={"file_path": sample_text_file})
+    assert resp.status_code == 500
+    assert resp.get_json()["error"] == "Failed to index file"
+
+
 def test_index_endpoint_missing_file_path(client):
     resp = client.post('/index', json={})
     assert resp.status_code == 400
@@ -75,3 +95,127 @@ def test_sync_user_endpoint(client):
 def test_sync_user_endpoint_missing_fields(client):
     resp = client.post('/sync-user', data=json.dumps({}), content_type='application/json')
     assert resp.status_code == 400
+
+
+def test_index_endpoint_async_queues_job(client, sample_text_file, mock_index_server, mocker):
+    mock_index_server.enqueue_upload = mocker.Mock(return_value="job-1")
+    resp = client.post('/index', json={"file_path": sample_text_file, "async": True})
+    assert resp.status_code == 202
+    body = json.loads(resp.get_data(as_text=True))
+    assert body["job_id"] == "job-1"
+    assert body["status_url"] == "/index/jobs/job-1"
+    mock_index_server.upload_file.assert_not_called()
+
+
+def test_index_endpoint_async_queue_full(client, sample_text_file, mock_index_server, mocker):
+    from multiprocessing.managers import RemoteError
+    mock_index_server.enqueue_upload = mocker.Mock(side_effect=RemoteError("ingestion_queue.IngestionQueueFull: full"))
+    resp = client.post('/index', json={"file_path": sample_text_file, "async": True})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "5"
+
+
+def test_index_job_endpoints(client, mock_index_server):
+    jobs = {"job-1": {"id": "job-1", "status": "completed"}}
+    mock_index_server.get_job = lambda job_id: jobs.get(job_id)
+    mock_index_server.list_jobs = lambda status, limit: list(jobs.values())
+    assert client.get('/index/jobs/job-1').get_json()["status"] == "completed"
+    assert client.get('/index/jobs/nope').status_code == 404
+    assert client.get('/index/jobs').get_json()["jobs"][0]["id"] == "job-1"
+
+
+def test_index_metrics_endpoint(client, mock_index_server):
+    mock_index_server.get_metrics = lambda: {"methods": {"query": {"calls": 3}}, "rss_bytes": 1}
+    resp = client.get('/index/metrics')
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["methods"]["query"]["calls"] == 3
+    assert body["client_pool"]["max_size"] > 0
+
+
+def test_index_metrics_endpoint_server_down(client, mocker):
+    import flask_server as fs
+    mocker.patch.object(fs, "connect_to_index_server", side_effect=ConnectionRefusedError("down"))
+    fs.index_pool.reset()
+    assert client.get('/index/metrics').status_code == 503
+
+
+def test_index_endpoint_discards_broken_connection(client, sample_text_file, mocker):
+    import flask_server as fs
+    broken = types.SimpleNamespace(upload_file=mocker.Mock(side_effect=EOFError()))
+    healthy = types.SimpleNamespace(upload_file=mocker.Mock(return_value=True))
+    mocker.patch.object(fs, "connect_to_index_server", side_effect=[broken, healthy])
+    fs.index_pool.reset()
+    try:
+        assert client.post('/index', json={"file_path": sample_text_file}).status_code == 503
+        # The broken connection was dropped; the next request reconnects
+        assert client.post('/index', json={"file_path": sample_text_file}).status_code == 200
+        assert fs.index_pool.stats()["discarded"] >= 1
+    finally:
+        fs.index_pool.reset()
+
+
+def test_health_reports_index_server_readiness(client, mock_index_server):
+    mock_index_server.ready = lambda: {"ready": False, "state": "warming"}
+    resp = client.get('/health')
+    assert resp.status_code == 503
+    assert resp.get_json()["index_server"]["state"] == "warming"
+
+    mock_index_server.ready = lambda: {"ready": True, "state": "ready"}
+    assert client.get('/health').status_code == 200
+
+
+def test_health_index_server_down(client, mocker):
+    import flask_server as fs
+    mocker.patch.object(fs, "connect_to_index_server", side_effect=ConnectionRefusedError("down"))
+    fs.index_pool.reset()
+    resp = client.get('/health')
+    assert resp.status_code == 503
+    assert resp.get_json()["status"] == "unavailable"
+
+
+def test_index_retrieve_endpoint(client, mock_index_server):
+    mock_index_server.retrieve = lambda text, top_k: [
+        {"text": "low", "score": 0.1}, {"text": "high", "score": 0.9}
+    ]
+    resp = client.get('/index/retrieve?text=rent&top_k=1')
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert [n["text"] for n in body["nodes"]] == ["high"]
+    assert body["failed_shards"] == {}
+    assert client.get('/index/retrieve').status_code == 400
+
+    scoped = []
+    mock_index_server.retrieve = lambda text, top_k, content_sha256: scoped.append(content_sha256) or []
+    assert client.get('/index/retrieve?text=rent&content_sha256=abc').status_code == 200
+    assert scoped == ["abc"]
+
+
+def test_query_endpoint_fans_out_to_every_shard(client, mocker):
+    import flask_server as fs
+
+    class DummyShards:
+        shards = {"h:1": None, "h:2": None}
+
+        def fan_out(self, call):
+            return {
+                "h:1": (True, [{"node_id": "a", "text": "Rent is $10", "score": 0.7}]),
+                "h:2": (True, [{"node_id": "b", "text": "Term is 5 years", "score": 0.9}]),
+            }
+
+    class BaseIndex:
+        def as_retriever(self, **kwargs):
+            raise AssertionError("sharded /query must not merge the base index")
+
+    mocker.patch.object(fs, "index_shards", DummyShards())
+    mocker.patch.object(fs, "index", BaseIndex())
+    synthesized = []
+    synthesizer = types.SimpleNamespace(synthesize=lambda q, nodes: synthesized.append(nodes) or "merged answer")
+    mocker.patch.object(fs, "get_response_synthesizer", lambda: synthesizer)
+
+    resp = client.get('/query?text=rent&top_k=2')
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["response"] == "merged answer"
+    assert [n.node.node_id for n in synthesized[0]] == ["b", "a"]
+    assert len(body["retrieved_nodes"]) == 2 and body["failed_shards"] == {}
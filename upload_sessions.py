@@ -0,0 +1,150 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+DEFAULT_UPLOAD_STORE = "index_uploads"
+# Striped locks serializing indexing of the same content
+CONTENT_LOCK_STRIPES = 64
+
+
+class UploadSessionStore:
+    """Chunked uploads into content-addressed storage.
+
+    Each session streams chunks into a temporary `.part` file while hashing
+    incrementally, so memory use is bounded by the chunk size. On commit the
+    SHA-256 is verified and the file is moved to `<storage_dir>/<sha256><ext>`;
+    if that file already exists the upload is a duplicate and the new copy
+    is dropped. Sessions idle for longer than `session_ttl` are discarded.
+
+    Stored is not the same as indexed: indexing can fail or be interrupted
+    after commit. The caller records successful indexing with mark_indexed(),
+    which writes a `<sha256>.indexed` marker, and dedupes on is_indexed().
+    """
+
+    def __init__(self, storage_dir: str = DEFAULT_UPLOAD_STORE, session_ttl: float = 3600.0):
+        self.storage_dir = storage_dir
+        self.session_ttl = session_ttl
+        self._sessions: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._content_locks = [threading.Lock() for _ in range(CONTENT_LOCK_STRIPES)]
+
+    def content_path(self, sha256: str, filename: str) -> str:
+        ext = os.path.splitext(filename)[1].lower()
+        return os.path.join(self.storage_dir, f"{sha256}{ext}")
+
+    def find(self, sha256: str, filename: str) -> Optional[str]:
+        """Path of already-stored content with this hash, if any"""
+        path = self.content_path(sha256.lower(), filename)
+        return path if os.path.exists(path) else None
+
+    def _marker_path(self, sha256: str) -> str:
+        return os.path.join(self.storage_dir, f"{sha256.lower()}.indexed")
+
+    def is_indexed(self, sha256: str) -> bool:
+        return os.path.exists(self._marker_path(sha256))
+
+    def mark_indexed(self, sha256: str):
+        """Record that the content with this hash was indexed successfully"""
+        marker = self._marker_path(sha256)
+        tmp_path = f"{marker}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(time.time()))
+        os.replace(tmp_path, marker)
+
+    def content_lock(self, sha256: str) -> threading.Lock:
+        """Lock held while checking and indexing the content with this hash"""
+        return self._content_locks[int(sha256[:8], 16) % CONTENT_LOCK_STRIPES]
+
+    def begin(self, filename: str, size: Optional[int] = None) -> str:
+        self._expire_stale()
+        os.makedirs(self.storage_dir, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        part_path = os.path.join(self.storage_dir, f"{upload_id}.part")
+        session = {
+            "filename": os.path.basename(filename),
+            "size": size,
+            "part_path": part_path,
+            "file": open(part_path, "wb"),
+            "hasher": hashlib.sha256(),
+            "received": 0,
+            "lock": threading.Lock(),
+            "touched": time.monotonic(),
+        }
+        with self._lock:
+            self._sessions[upload_id] = session
+        return upload_id
+
+    def write(self, upload_id: str, offset: int, data: bytes) -> int:
+        """Append a chunk at `offset`; returns total bytes received"""
+        session = self._get(upload_id)
+        with session["lock"]:
+            if offset != session["received"]:
+                raise ValueError(f"Chunk offset {offset} does not match {session['received']} bytes received")
+            if session["size"] is not None and offset + len(data) > session["size"]:
+                raise ValueError("Chunk exceeds declared upload size")
+            session["file"].write(data)
+            session["hasher"].update(data)
+            session["received"] += len(data)
+            session["touched"] = time.monotonic()
+            return session["received"]
+
+    def commit(self, upload_id: str, sha256: Optional[str] = None) -> Tuple[str, str, bool]:
+        """Verify and store the upload. Returns (path, sha256, already_stored);
+        already stored content may still need indexing (see is_indexed)"""
+        with self._lock:
+            session = self._sessions.pop(upload_id, None)
+        if session is None:
+            raise KeyError(f"Unknown upload {upload_id}")
+        with session["lock"]:
+            session["file"].close()
+            digest = session["hasher"].hexdigest()
+            try:
+                if session["size"] is not None and session["received"] != session["size"]:
+                    raise ValueError(f"Upload incomplete: {session['received']} of {session['size']} bytes")
+                if sha256 and sha256.lower() != digest:
+                    raise ValueError(f"Checksum mismatch: expected {sha256}, got {digest}")
+                path = self.content_path(digest, session["filename"])
+                if os.path.exists(path):
+                    return path, digest, True
+                os.replace(session["part_path"], path)
+                return path, digest, False
+            finally:
+                if os.path.exists(session["part_path"]):
+                    os.remove(session["part_path"])
+
+    def abort(self, upload_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(upload_id, None)
+        if session is None:
+            return False
+        self._close_and_remove(session)
+        return True
+
+    def active_count(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def _get(self, upload_id: str) -> Dict:
+        with self._lock:
+            session = self._sessions.get(upload_id)
+        if session is None:
+            raise KeyError(f"Unknown upload {upload_id}")
+        return session
+
+    def _expire_stale(self):
+        cutoff = time.monotonic() - self.session_ttl
+        with self._lock:
+            stale = [uid for uid, s in self._sessions.items() if s["touched"] < cutoff]
+            sessions = [self._sessions.pop(uid) for uid in stale]
+        for session in sessions:
+            self._close_and_remove(session)
+
+    @staticmethod
+    def _close_and_remove(session: Dict):
+        with session["lock"]:
+            session["file"].close()
+            if os.path.exists(session["part_path"]):
+                os.remove(session["part_path"])